@@ -1,6 +1,5 @@
 #!/usr/bin/python3
 import sys
-import hashlib
 import json
 import os
 import logging
@@ -24,7 +23,7 @@ def main():
     fs = webstorageClient.FileStorageClient(cache=False)
     with open(sys.argv[2], "wb") as outfile:
         # get file with checksum in sys.argv[1] as is
-        digest = hashlib.sha1()
+        digest = fs.file_digest(sys.argv[1])
         for data in fs.read(sys.argv[1]):
             outfile.write(bytes(data))
             digest.update(data)
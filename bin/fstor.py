@@ -1,6 +1,5 @@
 #!/usr/bin/python3
 import sys
-import hashlib
 import json
 import os
 import logging
@@ -27,7 +26,7 @@ def main():
         logging.info("getting file data stream of file with checksum %s", metadata["checksum"])
         fs = webstorageClient.FileStorageClient(cache=False)
         # get file with checksum in sys.argv[1] as is
-        digest = hashlib.sha1()
+        digest = fs.file_digest(metadata["checksum"])
         for data in fs.read(metadata["checksum"]):
             sys.stdout.buffer.write(bytes(data))
             digest.update(data)
@@ -1,26 +1,30 @@
 #!/usr/bin/python3
 import sys
 import time
-import hashlib
 import logging
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
 logging.getLogger("requests").setLevel(logging.ERROR)
+import argparse
 # own modules
 from webstorageClient import FileStorageClient
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write file with checksum from filestorage backend to stdout")
+    parser.add_argument("checksum", help="checksum of file to retrieve")
+    parser.add_argument("-t", "--threads", type=int, default=4, help="download next blocks on this number of threads, still written in order, default %(default)s")
+    options = parser.parse_args()
     fs = FileStorageClient()
-    digest = hashlib.sha1()
+    digest = fs.file_digest(options.checksum)
     size = 0
     starttime = time.time()
-    for data in fs.read(sys.argv[1]):
+    for data in fs.read(options.checksum, threads=options.threads):
         sys.stdout.buffer.write(bytes(data))
         digest.update(data)
         size += len(data)
     duration = time.time() - starttime
     checksum = digest.hexdigest()
-    if checksum != sys.argv[1]:
+    if checksum != options.checksum:
         sys.stderr.write("ERROR: checksum mismatch, the received is not the same as the requested\n")
     sys.stderr.write("stream stored with checksum %s, size %0.2f kb, duration %0.2f s, %0.2f kb/s\n" % (checksum, size / 1024, duration, size / 1024 / duration))
@@ -1,7 +1,6 @@
 #!/usr/bin/python3
 import sys
 import time
-import hashlib
 import logging
 logging.basicConfig(level=logging.DEBUG)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
@@ -24,7 +23,7 @@ if __name__ == "__main__":
             sys.stderr.write("no input data available")
     elif len(sys.argv) == 2:
         # get file with checksum in sys.argv[1]
-        digest = hashlib.sha1()
+        digest = fs.file_digest(sys.argv[1])
         size = 0
         starttime = time.time()
         for data in fs.read(sys.argv[1]):
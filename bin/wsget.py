@@ -8,7 +8,43 @@ logging.getLogger("urllib3").setLevel(logging.ERROR)
 logging.getLogger("requests").setLevel(logging.ERROR)
 import argparse
 # own modules
-from webstorage import FileStorageClient as FileStorageClient
+from webstorageClient import FileStorageClient
+from webstorageClient import RestorePlanner
+
+
+def get_sequential(fs, checksum, output):
+    with open(output, "wb") as outfile:
+        for data in fs.read(checksum):
+            outfile.write(data)
+
+def get_parallel(fs, checksum, output, threads):
+    """
+    file is preallocated in its final size, the blocks are downloaded
+    on threads sessions and written with pwrite at their offsets,
+    so they could arrive in any order
+    """
+    planner = RestorePlanner(fs, threads=threads)
+    planner.add(output, checksum)
+    if not planner.run():
+        raise IOError("unable to create %s" % output)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(output, 0o666 & ~umask) # like open would do
+    logging.debug("downloaded %d blocks, written %d times", planner.blocks, planner.writes)
+
+def verify(fs, checksum, output):
+    """
+    read written file block by block and compare checksum with requested one
+    """
+    recipe = fs.get(checksum)
+    digest = fs.file_digest(checksum)
+    with open(output, "rb") as infile:
+        for length in [recipe["size"]] if "inline" in recipe else fs.block_lengths(recipe):
+            digest.update(infile.read(length))
+    if digest.hexdigest() != checksum:
+        logging.error("checksum mismatch, %s written instead of %s", digest.hexdigest(), checksum)
+        return False
+    return True
 
 
 if __name__ == "__main__":
@@ -16,17 +52,23 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--checksum", help="checksum of file to retrieve", required=True)
     parser.add_argument("-o", "--output", help="full name to output retrieved file", required=True)
     parser.add_argument("-f", "--force", help="force overwrite of existing file, be carefull", action="store_true", default=False)
+    parser.add_argument("-t", "--threads", type=int, default=1, help="download blocks on this number of threads and write them at their offset, default %(default)s")
+    parser.add_argument("--noverify", action="store_true", default=False, help="skip final checksum pass over written file")
     # options = parser.parse_args("-c 3e3ffbf86c1d72fe4cced47038c1fef88c06d1f6 -o /tmp/test -f".split())
     options = parser.parse_args()
     fs = FileStorageClient()
     if os.path.isfile(options.output) and options.force is False:
         logging.error("file %s already exists, stopping", options.output)
+        sys.exit(1)
     elif os.path.isfile(options.output) and options.force is True:
         logging.info("overwriting existing file %s", options.output)
-        with open(options.output, "wb") as output:
-            for data in fs.read(options.checksum):
-                output.write(data)
-    elif not os.path.isfile(options.output):
-        with open(options.output, "wb") as output:
-            for data in fs.read(options.checksum):
-                output.write(data)
+    starttime = time.time()
+    if options.threads > 1:
+        get_parallel(fs, options.checksum, options.output, options.threads)
+    else:
+        get_sequential(fs, options.checksum, options.output)
+    duration = time.time() - starttime
+    size = os.stat(options.output).st_size
+    logging.info("written %s, size %0.2f kb, duration %0.2f s, %0.2f kb/s", options.output, size / 1024, duration, size / 1024 / max(duration, 0.001))
+    if options.noverify is False and not verify(fs, options.checksum, options.output):
+        sys.exit(1)
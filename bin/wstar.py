@@ -14,6 +14,9 @@ import argparse
 import stat
 import re
 import json
+import queue
+import functools
+import threading
 import logging
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
 logging.getLogger("requests").setLevel(logging.WARNING)
@@ -25,6 +28,13 @@ logging.getLogger("urllib3").setLevel(logging.WARNING)
 #import webstorage
 from webstorageClient import WebStorageArchiveClient
 from webstorageClient import FileStorageClient
+from webstorageClient import ClientConfig
+from webstorageClient import StatCache
+from webstorageClient import TreeWalker
+from webstorageClient import ExcludeMatcher
+from webstorageClient import SmallFilePacker
+from webstorageClient import RestorePlanner
+from webstorageClient.BlockStorageClient import is_zero
 
 def filemode(st_mode):
     """
@@ -57,35 +67,277 @@ def ppls(absfile, filedata):
     datestring = datetime.datetime.fromtimestamp(int(st_mtime))
     return "%10s %s %s %10s %19s %s" % (filemode(st_mode), st_uid, st_gid, sizeof_fmt(st_size), datestring, absfile)
 
+def write_blocks(outfile, blocks):
+    """
+    write blocks to outfile, all-zero blocks are skipped with seek,
+    so they become holes of a sparse file
+    """
+    size = 0
+    for block in blocks:
+        if is_zero(block):
+            outfile.seek(len(block), os.SEEK_CUR)
+        else:
+            outfile.write(block)
+        size += len(block)
+    outfile.truncate(size) # if the file ends with a hole
+
 def create_blacklist(absfilename):
     """
     generator for blacklist function
 
-    read exclude file and generate blacklist function
-    blacklist function returns True if filenae matches (re.match) any pattern
+    read exclude file and return ExcludeMatcher,
+    called with some path it returns True if path is excluded,
+    its prune method tells if a directory could be skipped as a whole
     """
-    patterns = []
     logging.debug("reading exclude file")
-    with open(absfilename, "rt") as exclude_file:
-        for row in exclude_file:
-            if len(row) <= 1:
+    return ExcludeMatcher.from_file(absfilename)
+
+def get_walker(blacklist_func, walk_threads=1):
+    """
+    return TreeWalker skipping files matched by blacklist_func,
+    and directories if blacklist_func is able to tell
+    """
+    return TreeWalker(exclude_func=blacklist_func, prune_func=getattr(blacklist_func, "prune", None), threads=walk_threads)
+
+class Progress(object):
+    """
+    live progress line on stderr, with files/s since start, size of all
+    files scanned and MB/s of the bytes actually read from disk,
+    files skipped by the stat cache are scanned but not read
+    """
+
+    def __init__(self, enabled=True, interval=1.0):
+        self._enabled = enabled
+        self._interval = interval
+        self._starttime = time.time()
+        self._lasttime = 0.0
+        self.files = 0
+        self.size = 0 # of all files scanned
+        self.read = 0 # bytes read
+
+    def update(self, size, read=True):
+        """
+        count one file of size bytes, read or not, redraw at most once per interval
+        """
+        self.files += 1
+        self.size += size
+        if read:
+            self.read += size
+        if self._enabled and time.time() - self._lasttime >= self._interval:
+            self._draw()
+
+    def finish(self):
+        if self._enabled:
+            self._draw()
+            sys.stderr.write("\n")
+
+    def _draw(self):
+        self._lasttime = time.time()
+        duration = max(self._lasttime - self._starttime, 0.001)
+        sys.stderr.write("\r%d files %s scanned, %s read, %0.1f files/s %0.1f MB/s read " % (self.files, sizeof_fmt(self.size), sizeof_fmt(self.read), self.files / duration, self.read / duration / 1000000))
+        sys.stderr.flush()
+
+def stat_change(stats, filedata):
+    """
+    return name of first stat information which differs from the one in filedata,
+    or None if nothing changed, atime is not checked
+    """
+    st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = filedata["stat"]
+    for name, old, new in (("MTIME", st_mtime, stats.st_mtime), ("CTIME", st_ctime, stats.st_ctime), ("UID", st_uid, stats.st_uid), ("GID", st_gid, stats.st_gid), ("MODE", st_mode, stats.st_mode), ("SIZE", st_size, stats.st_size)):
+        if old != new:
+            return name
+    return None
+
+def backup_file(filestorage, absfilename, stats, statcache=None, filedata=None, packer=None):
+    """
+    put one file in FileStorage, return action string and metadata
+
+    statcache ... <StatCache> to skip reading unchanged files already stored, or None
+    filedata ... <dict> entry of this file in the previous backupset, or None
+    packer ... <SmallFilePacker> to pack small files, or None
+    metadata of packed files has packed set to True, they are located after packer.flush()
+    """
+    if statcache is not None:
+        checksum = statcache.get(stats)
+        if checksum is not None and packer is not None and packer.location(checksum) is not None:
+            return "CACHED", {"checksum" : checksum, "packed" : True}
+        if checksum is not None and filestorage.exists(checksum):
+            # unchanged since last backup, no need to read it
+            return "CACHED", {"checksum" : checksum}
+    with open(absfilename, "rb") as infile:
+        if packer is not None and filestorage.inline_size < stats.st_size <= packer.max_size:
+            data = infile.read(packer.max_size + 1)
+            if len(data) <= packer.max_size: # not grown since stat
+                checksum, new = packer.add(data)
+                if statcache is not None:
+                    statcache.put(stats, checksum)
+                return "PACKED" if new else "PDEDUP", {"checksum" : checksum, "packed" : True}
+            infile.seek(0)
+        if filedata is not None and "pack" not in filedata and stats.st_size > filedata["stat"][-1]: # maybe only appended
+            logging.debug("%8s %s", "APPEND", ppls(absfilename, filedata))
+            metadata = filestorage.put_append(infile, filedata["checksum"])
+        else:
+            metadata = filestorage.put(infile)
+    if statcache is not None:
+        statcache.put(stats, metadata["checksum"])
+    if metadata["filehash_exists"] is True:
+        return "FDEDUP", metadata
+    if metadata["blockhash_exists"] > 0:
+        return "BDEDUP", metadata
+    return "PUT", metadata
+
+def put_files(filestorage, work, jobs=1, statcache=None, packer=None, failed=None):
+    """
+    put files in FileStorage, yield absfilename, stats, action_str, metadata
+    in order of completion, files which could not be read or stored are logged,
+    appended to failed and skipped
+
+    work ... <iterable> of absfilename, stats, filedata of previous backupset or None
+    jobs ... <int> number of files to put in parallel
+    statcache, packer ... see backup_file
+    failed ... <list> to append absfilename of every file failed, or None
+
+    with jobs > 1 work is consumed on a walker thread feeding a bounded queue,
+    every worker thread uses its own clone of filestorage, sharing the known checksums
+    """
+    if jobs <= 1:
+        for absfilename, stats, filedata in work:
+            try:
+                action_str, metadata = backup_file(filestorage, absfilename, stats, statcache, filedata, packer)
+            except (OSError, IOError) as exc:
+                logging.error("%8s %s : %s", "FAILED", absfilename, exc)
+                if failed is not None:
+                    failed.append(absfilename)
                 continue
-            if row[0] == "#":
+            yield absfilename, stats, action_str, metadata
+        return
+    tasks = queue.Queue(maxsize=16 * jobs)
+    results = queue.Queue()
+    def walker():
+        try:
+            for item in work:
+                tasks.put(item)
+        except Exception as exc: # pylint: disable=broad-except
+            results.put(exc)
+        finally:
+            for _ in range(jobs):
+                tasks.put(None)
+    def worker(client):
+        try:
+            while True:
+                item = tasks.get()
+                if item is None:
+                    break
+                absfilename, stats, filedata = item
+                try:
+                    action_str, metadata = backup_file(client, absfilename, stats, statcache, filedata, packer)
+                except (OSError, IOError) as exc:
+                    logging.error("%8s %s : %s", "FAILED", absfilename, exc)
+                    if failed is not None:
+                        failed.append(absfilename)
+                    continue
+                results.put((absfilename, stats, action_str, metadata))
+        except Exception as exc: # pylint: disable=broad-except
+            results.put(exc)
+        finally:
+            client.close()
+            results.put(None)
+    threads = [threading.Thread(target=walker, daemon=True)]
+    threads.extend(threading.Thread(target=worker, args=(filestorage.clone(), ), daemon=True) for _ in range(jobs))
+    for thread in threads:
+        thread.start()
+    running = jobs
+    while running:
+        result = results.get()
+        if result is None:
+            running -= 1
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            yield result
+
+def file_entry(metadata, stats):
+    """
+    return entry of file in backupset
+    """
+    return {
+        "checksum" : metadata["checksum"],
+        "stat" : (stats.st_mtime, stats.st_atime, stats.st_ctime, stats.st_uid, stats.st_gid, stats.st_mode, stats.st_size)
+    }
+
+def locate_packed(filedata, packed, packer):
+    """
+    store last pack and add pack checksum, offset and length
+    to entries in filedata of packed files
+    """
+    packer.flush()
+    for absfilename in packed:
+        filedata[absfilename]["pack"] = packer.location(filedata[absfilename]["checksum"])
+
+def get_packer(args, filestorage):
+    """
+    return SmallFilePacker if packing is enabled, otherwise None,
+    the index of packed files is kept per FileStorage in config directory
+    """
+    if args.pack is False:
+        return None
+    index_filename = os.path.join(ClientConfig().homepath, "%s_packs.db" % filestorage.info["id"])
+    return SmallFilePacker(filestorage, index_filename, args.pack_max_size)
+
+class HardlinkTracker(object):
+    """
+    remember files with more than one link by st_dev and st_ino,
+    so the data of every inode is read only once
+    """
+
+    def __init__(self):
+        self.inodes = {} # absfilename : (st_dev, st_ino)
+        self.first = {} # (st_dev, st_ino) : absfilename read
+        self.skipped = [] # (absfilename, stats) of files not read
+
+    def seen(self, absfilename, stats):
+        """
+        return True if the inode of this file is already read
+        """
+        if stats.st_nlink < 2:
+            return False
+        key = (stats.st_dev, stats.st_ino)
+        self.inodes[absfilename] = key
+        if key in self.first:
+            self.skipped.append((absfilename, stats))
+            return True
+        self.first[key] = absfilename
+        return False
+
+    def add_skipped(self, filedata):
+        """
+        add entries of files not read to filedata, copied from the file read
+        """
+        for absfilename, stats in self.skipped:
+            source = filedata.get(self.first[self.inodes[absfilename]])
+            if source is None: # reading failed
                 continue
-            operator = row.strip()[0] # -/+
-            pattern = row.strip()[2:] # some string to use in match
-            logging.debug("%s %s", operator, pattern)
-            if operator == "-":
-                patterns.append(pattern)
-    def blacklist_func(filename):
+            entry = file_entry(source, stats)
+            if "pack" in source:
+                entry["pack"] = source["pack"]
+            filedata[absfilename] = entry
+            logging.info("%8s %s", "LINK", ppls(absfilename, entry))
+
+    def mark_links(self, filedata):
         """
-        returned closure to use for blacklist checking
+        every file of a group of hardlinked files gets link set
+        to the first file of this group in sorted order
         """
-        logging.debug("matching %s", filename)
-        return any((pattern in filename for pattern in patterns))
-    return blacklist_func
+        groups = {}
+        for absfilename in sorted(self.inodes):
+            if absfilename in filedata:
+                filedata[absfilename].pop("link", None)
+                groups.setdefault(self.inodes[absfilename], []).append(absfilename)
+        for group in groups.values():
+            for absfilename in group[1:]:
+                filedata[absfilename]["link"] = group[0]
 
-def create(filestorage, path, blacklist_func):
+def create(filestorage, path, blacklist_func, statcache=None, walk_threads=1, jobs=1, progress=False, packer=None, failed=None):
     """
     create a new archive of files under path
     filter out filepath which mathes some item in blacklist
@@ -94,7 +346,15 @@ def create(filestorage, path, blacklist_func):
     filestorage ... <FileStorage> Object
     path ... <str> must be valid os path
     blacklist_func ... <func> called with absfilename, if True is returned, skip this file
-    """
+    statcache ... <StatCache> to skip reading unchanged files already stored, or None
+    walk_threads ... <int> number of threads to scan directories
+    jobs ... <int> number of files to put in parallel
+    progress ... <bool> show progress line on stderr
+    packer ... <SmallFilePacker> to pack small files, or None
+    failed ... <list> to append absfilename of files which could not be archived, or None
+    """
+    if failed is None:
+        failed = []
     archive_dict = {
         "path" : path,
         "filedata" : {},
@@ -106,39 +366,39 @@ def create(filestorage, path, blacklist_func):
         "PUT" : 0,
         "FDEDUP" : 0,
         "BDEDUP" : 0,
+        "CACHED" : 0,
+        "PACKED" : 0,
+        "PDEDUP" : 0,
         "EXCLUDE" : 0,
+        "FAILED" : 0,
     }
-    action_str = "PUT"
-    for root, dirs, files in os.walk(path):
-        for filename in files:
-            absfilename = os.path.join(root, filename)
-            if blacklist_func(absfilename):
-                logging.debug("EXCLUDE %s", absfilename)
-                continue
-            if not os.path.isfile(absfilename):
-                # only save regular files
-                continue
-            try:
-                stats = os.stat(absfilename)
-                metadata = filestorage.put(open(absfilename, "rb"))
-                if metadata["filehash_exists"] is True:
-                    action_str = "FDEDUP"
-                else:
-                    if metadata["blockhash_exists"] > 0:
-                        action_str = "BDEDUP"
-                    else:
-                        action_str = "PUT"
-                archive_dict["filedata"][absfilename] = {
-                    "checksum" : metadata["checksum"],
-                    "stat" : (stats.st_mtime, stats.st_atime, stats.st_ctime, stats.st_uid, stats.st_gid, stats.st_mode, stats.st_size)
-                }
-                if action_str == "PUT":
-                    logging.error("%8s %s", action_str, ppls(absfilename, archive_dict["filedata"][absfilename]))
-                else:
-                    logging.info("%8s %s", action_str, ppls(absfilename, archive_dict["filedata"][absfilename]))
-                action_stat[action_str] += 1
-            except (OSError, IOError) as exc:
-                logging.exception(exc)
+    walker = get_walker(blacklist_func, walk_threads)
+    hardlinks = HardlinkTracker()
+    work = ((absfilename, stats, None) for absfilename, stats in walker.walk(path) if not hardlinks.seen(absfilename, stats))
+    status = Progress(progress)
+    filedata = {}
+    packed = []
+    for absfilename, stats, action_str, metadata in put_files(filestorage, work, jobs, statcache, packer, failed):
+        filedata[absfilename] = file_entry(metadata, stats)
+        if metadata.get("packed") is True:
+            packed.append(absfilename)
+        if action_str == "PUT":
+            logging.error("%8s %s", action_str, ppls(absfilename, filedata[absfilename]))
+        else:
+            logging.info("%8s %s", action_str, ppls(absfilename, filedata[absfilename]))
+        action_stat[action_str] += 1
+        status.update(stats.st_size, action_str != "CACHED") # all others are read, at least to hash them
+    status.finish()
+    if packer is not None:
+        locate_packed(filedata, packed, packer)
+    hardlinks.add_skipped(filedata)
+    hardlinks.mark_links(filedata)
+    action_stat["LINK"] = len(hardlinks.skipped)
+    # same order regardless of the order of completion
+    for absfilename in sorted(filedata):
+        archive_dict["filedata"][absfilename] = filedata[absfilename]
+    action_stat["EXCLUDE"] = walker.excluded
+    action_stat["FAILED"] = len(failed)
     logging.info("file operations statistics:")
     for action, count in action_stat.items():
         logging.info("%8s : %s", action, count)
@@ -147,98 +407,116 @@ def create(filestorage, path, blacklist_func):
     archive_dict["totalsize"] = sum((archive_dict["filedata"][absfilename]["stat"][-1] for absfilename in archive_dict["filedata"]))
     return archive_dict
 
-def diff(filestorage, data, blacklist_func):
+def diff(filestorage, data, blacklist_func, walk_threads=1, jobs=1, progress=False, packer=None, failed=None):
     """
     doing differential backup
     criteriat to check if some file is change will be the stats informations
     there is a slight possiblity, that the file has change by checksum but non in stats information
 
+    the tree is walked once, every file found is compared with the existing data
+    or added, files not found anymore are removed afterwards
+
     filestorage ... <FileStorage> Object
     data ... <dict> existing data to compare with existing files
     blacklist_func ... <func> called with absfilename, if True is returned, skip this file
+    walk_threads ... <int> number of threads to scan directories
+    jobs ... <int> number of files to put in parallel
+    progress ... <bool> show progress line on stderr
+    packer ... <SmallFilePacker> to pack small files, or None
+    failed ... <list> to append absfilename of changed files which could not be archived,
+        their entry of data is kept, or None
     """
-    # check if some files are missing or have changed
-    changed = False
     data["starttime"] = time.time()
-    for absfile in sorted(data["filedata"].keys()):
-        filedata = data["filedata"][absfile]
-        if os.path.isfile(absfile) is False:
-            # remove informaion from data, if file was deleted
-            logging.info("%8s %s", "DELETED", ppls(absfile, filedata))
-            del data["filedata"][absfile]
-            changed = True
-        else:
-            st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = filedata["stat"]
-            # check all except atime
-            stats = os.stat(absfile)
-            change = False
-            # long version to print every single criteria
-            if  stats.st_mtime != st_mtime:
-                logging.info("%8s %s", "MTIME", ppls(absfile, filedata))
-                change = True
-            elif stats.st_ctime != st_ctime:
-                logging.info("%8s %s", "CTIME", ppls(absfile, filedata))
-                change = True
-            elif stats.st_uid != st_uid:
-                logging.info("%8s %s", "UID", ppls(absfile, filedata))
-                change = True
-            elif stats.st_gid != st_gid:
-                logging.info("%8s %s", "GID", ppls(absfile, filedata))
-                change = True
-            elif stats.st_mode != st_mode:
-                logging.info("%8s %s", "MODE", ppls(absfile, filedata))
-                change = True
-            elif stats.st_size != st_size:
-                logging.info("%8s %s", "SIZE", ppls(absfile, filedata))
-                change = True
-            # update data dictionary if something has changed
-            if change is False:
-                logging.debug("%8s %s", "OK", ppls(absfile, filedata))
-            else:
-                try:
-                    with open(absfile, "rb") as infile:
-                        metadata = filestorage.put(infile)
-                        # update data
-                        data["filedata"][absfile] = {
-                            "checksum" : metadata["checksum"],
-                            "stat" : (stats.st_mtime, stats.st_atime, stats.st_ctime, stats.st_uid, stats.st_gid, stats.st_mode, stats.st_size)
-                        }
-                        changed = True
-                except PermissionError as exc:
-                    logging.error(exc)
-                    logging.error("skipping file %s", absfile)
-    # search for new files on local storage
-    for root, dirs, files in os.walk(data["path"]):
-        for filename in files:
-            absfilename = os.path.join(root, filename)
-            if blacklist_func(absfilename):
-                logging.debug("%8s %s", "EXCLUDE", absfilename)
-                continue
-            if os.path.isfile(absfilename) is False:
-                logging.debug("%8s %s", "NOFILE", absfilename)
+    seen = set()
+    walker = get_walker(blacklist_func, walk_threads)
+    hardlinks = HardlinkTracker()
+    def changed_files():
+        """
+        yield new and changed files to put
+        """
+        for absfile, stats in walker.walk(data["path"]):
+            seen.add(absfile)
+            if hardlinks.seen(absfile, stats):
                 continue
-            if absfilename not in data["filedata"]:
+            filedata = data["filedata"].get(absfile)
+            if filedata is None:
                 # there is some new file
-                logging.info("%8s %s", "ADD", absfilename)
-                try:
-                    stats = os.stat(absfilename)
-                    metadata = filestorage.put(open(absfilename, "rb"))
-                    data["filedata"][absfilename] = {
-                        "checksum" : metadata["checksum"],
-                        "stat" : (stats.st_mtime, stats.st_atime, stats.st_ctime, stats.st_uid, stats.st_gid, stats.st_mode, stats.st_size)
-                    }
-                    changed = True
-                except (OSError, IOError) as exc:
-                    logging.error(exc)
+                logging.info("%8s %s", "ADD", absfile)
+                yield absfile, stats, None
+                continue
+            change = stat_change(stats, filedata)
+            if change is None:
+                logging.debug("%8s %s", "OK", ppls(absfile, filedata))
+            else:
+                logging.info("%8s %s", change, ppls(absfile, filedata))
+                yield absfile, stats, filedata
+    status = Progress(progress)
+    updates = {}
+    packed = []
+    for absfile, stats, action_str, metadata in put_files(filestorage, changed_files(), jobs, packer=packer, failed=failed):
+        updates[absfile] = file_entry(metadata, stats)
+        if metadata.get("packed") is True:
+            packed.append(absfile)
+        status.update(stats.st_size, action_str != "CACHED") # all others are read, at least to hash them
+    status.finish()
+    if packer is not None:
+        locate_packed(updates, packed, packer)
+    # hardlinks not read get the entry of the file read, if this was unchanged
+    # but the hardlink is new or changed, the entry is taken from data
+    for absfile, stats in hardlinks.skipped:
+        first = hardlinks.first[hardlinks.inodes[absfile]]
+        filedata = data["filedata"].get(absfile)
+        if first not in updates and first in data["filedata"] and (filedata is None or stat_change(stats, filedata) is not None):
+            updates[first] = data["filedata"][first]
+    hardlinks.add_skipped(updates)
+    # update data dictionary in deterministic order
+    for absfile in sorted(updates):
+        data["filedata"][absfile] = updates[absfile]
+    changed = len(updates) > 0
+    # remove informaion from data, if file was deleted or is excluded now,
+    # but keep files below directories which could not be read this time
+    for absfile in sorted(set(data["filedata"].keys()) - seen):
+        if walker.is_failed(absfile):
+            logging.info("%8s %s", "UNREAD", ppls(absfile, data["filedata"][absfile]))
+            continue
+        logging.info("%8s %s", "DELETED", ppls(absfile, data["filedata"][absfile]))
+        del data["filedata"][absfile]
+        changed = True
+    hardlinks.mark_links(data["filedata"])
     data["stoptime"] = time.time()
     data["totalcount"] = len(data["filedata"])
     data["totalsize"] = sum((data["filedata"][absfilename]["stat"][-1] for absfilename in data["filedata"].keys()))
     return changed
 
+def recipe_checksum(filedata):
+    """
+    return checksum of recipe in FileStorage holding the data of file,
+    for packed files this is the pack
+    """
+    if "pack" in filedata:
+        return filedata["pack"][0]
+    return filedata["checksum"]
+
+def get_reader(filestorage, cache_size=8):
+    """
+    return function, which returns the blocks of some file given by filedata,
+    packed files are sliced out of their pack, the last packs read are cached
+    """
+    @functools.lru_cache(maxsize=cache_size)
+    def read_pack(checksum):
+        return b"".join(filestorage.read(checksum))
+    def read(filedata):
+        if "pack" in filedata:
+            pack, offset, length = filedata["pack"]
+            return [read_pack(pack)[offset:offset + length]]
+        return filestorage.read(filedata["checksum"])
+    return read
+
 def test(filestorage, data, level=0):
     """
     check backup archive for consistency
-    check if the filechecksum is available in FileStorage
+    check if the filechecksum is available in FileStorage,
+    the recipes are fetched in bulk for level 1 and 2
 
     if deep is True also every block will be checked
         this operation could be very time consuming!
@@ -249,18 +527,22 @@ def test(filestorage, data, level=0):
     blockset = set() # unique list of blockchecksums
     if level == 0: # check only checksum existance in filestorage
         for absfile, filedata in data["filedata"].items():
-            if filestorage.exists(filedata["checksum"]) is True:
+            if filestorage.exists(recipe_checksum(filedata)) is True:
                 logging.info("FILE-CHECKSUM %s EXISTS  for %s", filedata["checksum"], absfile)
                 filecount += 1
                 fileset.add(filedata["checksum"])
     elif level == 1: # get filemetadata and check also block existance
         blockstorage = filestorage.blockstorage
+        recipes = dict(filestorage.get_many(sorted({recipe_checksum(filedata) for filedata in data["filedata"].values()}))) # packed files share their pack
         for absfile, filedata in data["filedata"].items():
-            metadata = filestorage.get(filedata["checksum"])
+            metadata = recipes.get(recipe_checksum(filedata))
+            if metadata is None:
+                logging.error("FILE-CHECKSUM %s MISSING for %s", filedata["checksum"], absfile)
+                continue
             logging.info("FILE-CHECKSUM %s OK     for %s", filedata["checksum"], absfile)
             filecount += 1
             fileset.add(filedata["checksum"])
-            for blockchecksum in metadata["blockchain"]:
+            for blockchecksum, _ in filestorage.blocks(metadata):
                 blockset.add(blockchecksum)
                 if blockstorage.exists(blockchecksum) is True:
                     logging.info("BLOCKCHECKSUM %s EXISTS", blockchecksum)
@@ -269,46 +551,132 @@ def test(filestorage, data, level=0):
                 blockcount += 1
     elif level == 2: # get filemetadata and read every block, very time consuming
         blockstorage = filestorage.blockstorage
+        recipes = dict(filestorage.get_many(sorted({recipe_checksum(filedata) for filedata in data["filedata"].values()}))) # packed files share their pack
         for absfile, filedata in data["filedata"].items():
-            metadata = filestorage.get(filedata["checksum"])
+            metadata = recipes.get(recipe_checksum(filedata))
+            if metadata is None:
+                logging.error("FILE-CHECKSUM %s MISSING for %s", filedata["checksum"], absfile)
+                continue
             logging.info("FILE-CHECKSUM %s OK      for %s", filedata["checksum"], absfile)
             filecount += 1
             fileset.add(filedata["checksum"])
-            for blockchecksum in metadata["blockchain"]:
+            for blockchecksum, _ in filestorage.blocks(metadata):
                 blockset.add(blockchecksum)
                 blockstorage.get(blockchecksum)
                 logging.info("BLOCKCHECKSUM %s OK", blockchecksum)
                 blockcount += 1
     logging.info("all files %d(%d) available, %d(%d) blocks used", filecount, len(fileset), blockcount, len(blockset))
 
-def restore(filestorage, data, targetpath, overwrite=False):
+def restore_link(source, newfilename):
+    """
+    create newfilename as hardlink to already restored source,
+    return False if this is not possible
+    """
+    try:
+        if os.path.isfile(newfilename):
+            os.unlink(newfilename)
+        os.link(source, newfilename)
+        return True
+    except OSError as exc:
+        logging.error("unable to link %s to %s : %s", newfilename, source, exc)
+        return False
+
+def local_digest(filename):
+    """
+    return sha1 of local file
+    """
+    digest = hashlib.sha1()
+    with open(filename, "rb") as infile:
+        for data in iter(lambda: infile.read(1024 * 1024), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+def sync_unchanged(filedata, newfilename, verify=False):
+    """
+    return True if existing newfilename has size and mtime of filedata,
+    with verify also the data of packed files has to match, all other
+    files are compared block by block while restoring, inline files
+    are written again
+    """
+    st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = filedata["stat"]
+    stats = os.stat(newfilename)
+    if stats.st_size != st_size:
+        return False
+    if verify is False:
+        return stats.st_mtime == st_mtime
+    return "pack" in filedata and local_digest(newfilename) == filedata["checksum"]
+
+def restore(filestorage, data, targetpath, overwrite=False, jobs=4, sync=False, verify=False):
     """
     restore all files of archive to targetpath
     backuppath will be replaced by targetpath
-    """
-    # check if some files are missing or have changed
+
+    all files are restored at once by RestorePlanner, downloading every
+    unique block only once on jobs threads, hardlinks are created afterwards
+    and at last the metadata of all files is set
+
+    with sync existing files with same size and mtime are skipped, all
+    other existing files are updated in place, only blocks which differ
+    locally are downloaded, with verify also files with same size and
+    mtime are compared block by block, hardlinks to other files are not
+    changed, files hardlinked in the backupset are linked again
+    """
+    planner = RestorePlanner(filestorage, threads=jobs)
+    planned = {} # absfile : newfilename
+    links = [] # absfile, newfilename
+    processed = [] # absfile, newfilename
+    unchanged = set() # newfilenames kept by sync
     for absfile in sorted(data["filedata"].keys()):
         filedata = data["filedata"][absfile]
-        st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = filedata["stat"]
         newfilename = absfile.replace(data["path"], targetpath)
+        processed.append((absfile, newfilename))
         # remove double slashes
         if not os.path.isdir(os.path.dirname(newfilename)):
             logging.debug("creating directory %s", os.path.dirname(newfilename))
             os.makedirs(os.path.dirname(newfilename))
-        if (os.path.isfile(newfilename)) and (overwrite is True):
-            logging.info("REPLACE %s", newfilename)
-            outfile = open(newfilename, "wb")
-            for block in filestorage.read(filedata["checksum"]):
-                outfile.write(block)
-            outfile.close()
+        if sync is True and filedata.get("link") in planned:
+            links.append((absfile, newfilename)) # relinked, even if it exists
+        elif sync is True and os.path.isfile(newfilename):
+            if sync_unchanged(filedata, newfilename, verify):
+                logging.info("UNCHANGED %s", newfilename)
+                planned[absfile] = newfilename # to link to
+                unchanged.add(newfilename)
+            elif "pack" in filedata:
+                logging.info("SYNC %s", newfilename)
+                planner.add(newfilename, *filedata["pack"])
+            else:
+                logging.info("SYNC %s", newfilename)
+                planner.add(newfilename, filedata["checksum"], sync=True)
+                planned[absfile] = newfilename
         elif (os.path.isfile(newfilename)) and (overwrite is False):
             logging.info("SKIPPING %s", newfilename)
+        elif filedata.get("link") in planned:
+            links.append((absfile, newfilename))
         else:
-            logging.info("RESTORE %s", newfilename)
-            outfile = open(newfilename, "wb")
-            for block in filestorage.read(filedata["checksum"]):
-                outfile.write(block)
-            outfile.close()
+            if os.path.isfile(newfilename):
+                logging.info("REPLACE %s", newfilename)
+            else:
+                logging.info("RESTORE %s", newfilename)
+            if "pack" in filedata:
+                planner.add(newfilename, *filedata["pack"])
+            else:
+                planner.add(newfilename, filedata["checksum"])
+            planned[absfile] = newfilename
+    restored = set(planner.run())
+    logging.info("downloaded %d blocks, written %d times, %d blocks unchanged", planner.blocks, planner.writes, planner.unchanged)
+    read = get_reader(filestorage)
+    for absfile, newfilename in links:
+        source = planned[data["filedata"][absfile]["link"]]
+        if (source in restored or source in unchanged) and restore_link(source, newfilename):
+            logging.info("LINK %s", newfilename)
+        else: # restore data as some single file
+            if os.path.lexists(newfilename):
+                os.unlink(newfilename)
+            with open(newfilename, "wb") as outfile:
+                write_blocks(outfile, read(data["filedata"][absfile]))
+    # set metadata
+    for absfile, newfilename in processed:
+        st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = data["filedata"][absfile]["stat"]
         try:
             os.chmod(newfilename, st_mode)
             os.utime(newfilename, (st_atime, st_mtime))
@@ -323,21 +691,18 @@ def restore_single(filestorage, filedata, targetpath, name, checksum, overwrite=
     """
     st_mtime, st_atime, st_ctime, st_uid, st_gid, st_mode, st_size = filedata["stat"]
     newfilename = os.path.join(targetpath, os.path.basename(name))
+    read = get_reader(filestorage)
     # replace, skip or restore
     if (os.path.isfile(newfilename)) and (overwrite is True):
         logging.info("REPLACE %s", newfilename)
-        outfile = open(newfilename, "wb")
-        for block in filestorage.read(filedata["checksum"]):
-            outfile.write(block)
-        outfile.close()
+        with open(newfilename, "wb") as outfile:
+            write_blocks(outfile, read(filedata))
     elif (os.path.isfile(newfilename)) and (overwrite is False):
         logging.info("SKIPPING %s", newfilename)
     else:
         logging.info("RESTORE %s", newfilename)
-        outfile = open(newfilename, "wb")
-        for block in filestorage.read(filedata["checksum"]):
-            outfile.write(block)
-        outfile.close()
+        with open(newfilename, "wb") as outfile:
+            write_blocks(outfile, read(filedata))
     try: # change permissions and times
         os.chmod(newfilename, st_mode)
         os.utime(newfilename, (st_atime, st_mtime))
@@ -446,6 +811,16 @@ def get_webstorage_data(public_key=None, filename=None):
         logging.info("no digital signature provided")
     return data
 
+def exit_failed(failed):
+    """
+    report files which could not be archived and exit with 1, if there are any
+    """
+    if failed:
+        for absfilename in sorted(failed):
+            logging.error("%8s %s", "FAILED", absfilename)
+        logging.error("%d files could not be archived, backupset is incomplete", len(failed))
+        sys.exit(1)
+
 def main():
     """
     get options, then call specific functions
@@ -454,12 +829,14 @@ def main():
     group_create = parser.add_argument_group("create backupset from scratch")
     group_create.add_argument("-c", dest="create", help="create archive of this path")
     group_diff = parser.add_argument_group("create incremental backupset, some pre existing backupset must exist")
-    group_diff.add_argument("-d", dest="diff", action="store_true", help="create differential to latest backupset or expliit given backupset")
+    group_diff.add_argument("-d", dest="diff", action="store_true", help="create differential to latest backupset or expliit given backupset, with --identity blocklist files grown since are read only after their last complete block, which is the only one verified, earlier changes are not detected")
     group_extract = parser.add_argument_group("extract archive")
     group_extract.add_argument("-x", dest="extract", action="store_true", help="restore content of backupset to path location")
     group_extract.add_argument("--backupset", help="backupset to get from backend, if not given use the latest available backupset")
     group_extract.add_argument("--overwrite", action="store_true", default=False, help="overwrite existing files during restore default %(default)s")
     group_extract.add_argument("--extract-path", help="path to restore to")
+    group_extract.add_argument("--sync", action="store_true", default=False, help="skip existing files with same size and mtime, update other existing files in place, downloading only blocks which differ")
+    group_extract.add_argument("--sync-verify", action="store_true", default=False, help="in conjunction with --sync compare also files with same size and mtime by checksum")
     group_get = parser.add_argument_group("get single file from backupset")
     group_get.add_argument("-g", dest="get", action="store_true", help="get single files from backupset")
     group_get.add_argument("--checksum", help="file checksum")
@@ -468,6 +845,18 @@ def main():
     group_optional.add_argument("--exclude-file", help="exclude file, in conjunction with --create and --diff")
     group_optional.add_argument("--tag", help="optional tag for this archive, otherwise last portion of path is used")
     group_optional.add_argument("--nocache", dest="cache", action="store_false", default=True, help="disable caching mode, using less memory")
+    group_optional.add_argument("--chunking", choices=("fixed", "gear"), default="fixed", help="cut files at fixed offsets or content defined, in conjunction with --create and --diff, default %(default)s")
+    group_optional.add_argument("--identity", choices=("sha1", "blocklist"), default="sha1", help="file checksum over whole data or derived from block checksums to hash every byte only once, default %(default)s")
+    group_optional.add_argument("--hash-threads", type=int, default=1, help="hash and upload blocks of large files on this number of threads, default %(default)s")
+    group_optional.add_argument("--mmap", action="store_true", default=False, help="map files to memory instead of reading them, only fixed chunking")
+    group_optional.add_argument("--compress", action="store_true", default=False, help="compress blocks on the wire if worth it, in conjunction with --create and --diff")
+    group_optional.add_argument("--walk-threads", type=int, default=1, help="scan directories on this number of threads, in conjunction with --create and --diff, default %(default)s")
+    group_optional.add_argument("--jobs", type=int, default=1, help="put this number of files in parallel, in conjunction with --create and --diff, with --extract download on this number of threads, at least 4, default %(default)s")
+    group_optional.add_argument("--progress", action="store_true", default=False, help="show files/s and MB/s read on stderr, in conjunction with --create and --diff")
+    group_optional.add_argument("--pack", action="store_true", default=False, help="pack small files together, to save round trips per file, in conjunction with --create and --diff")
+    group_optional.add_argument("--pack-max-size", type=int, default=4096, help="files up to this size in bytes are packed, default %(default)s")
+    group_optional.add_argument("--inline-max-size", type=int, default=0, help="files up to this size in bytes are stored inline in their recipe, without BlockStorage, 0 to disable, default %(default)s")
+    group_optional.add_argument("--nostatcache", dest="statcache", action="store_false", default=True, help="read every file on --create, even if unchanged since last backup")
     group_optional.add_argument("--hostname", dest="hostname", help="set specific hostname")
     group_test = parser.add_argument_group("testing of backupsets and retrieving existing archive informations")
     group_test.add_argument("-l", dest="list", action="store_true", help="list backupsets, use --backupset to specify one specific")
@@ -516,7 +905,7 @@ def main():
     if not args.hostname:
         args.hostname = socket.gethostname()
     wsa = WebStorageArchiveClient()
-    filestorage = FileStorageClient(cache=args.cache)
+    filestorage = FileStorageClient(cache=args.cache, compress=args.compress, chunking=args.chunking, identity=args.identity, threads=args.hash_threads, use_mmap=args.mmap, inline_size=args.inline_max_size)
     # CREATE new Backupset
     if args.create:
         if not args.tag:
@@ -527,8 +916,22 @@ def main():
         # create
         filename = get_filename(args.tag)
         logging.info("archiving content of %s to backupset %s", args.create, filename)
-        data = create(filestorage, args.create, blacklist_func)
+        statcache = None
+        if args.statcache is True:
+            statcache = StatCache(os.path.join(ClientConfig().homepath, "%s_stat.db" % filestorage.info["id"]))
+        packer = get_packer(args, filestorage)
+        failed = []
+        try:
+            data = create(filestorage, args.create, blacklist_func, statcache, args.walk_threads, args.jobs, args.progress, packer, failed)
+        finally:
+            if packer is not None:
+                packer.close()
+            if statcache is not None:
+                statcache.close()
+        if statcache is not None:
+            logging.info("stat cache hits %d misses %d", statcache.hits, statcache.misses)
         save_webstorage_archive(data, filename, args.private_key)
+        exit_failed(failed)
     # LIST Backupsets
     elif args.list:
         args.cache = False # set this explicit, not useful
@@ -565,12 +968,19 @@ def main():
         if not args.tag:
             args.tag = args.backupset.split("_")[1]
         data = get_webstorage_data(args.public_key, args.backupset)
-        changed = diff(filestorage, data, blacklist_func)
+        packer = get_packer(args, filestorage)
+        failed = []
+        try:
+            changed = diff(filestorage, data, blacklist_func, args.walk_threads, args.jobs, args.progress, packer, failed)
+        finally:
+            if packer is not None:
+                packer.close()
         if changed is False:
             logging.info("Nothing changed")
         else:
             newfilename = get_filename(args.tag)
             save_webstorage_archive(data, newfilename, args.private_key)
+        exit_failed(failed)
     # EXTRACT Backupset to path
     elif args.extract:
         if args.extract_path is None:
@@ -583,7 +993,7 @@ def main():
             logging.info("you have to specify --backupset explicitly")
             sys.exit(1)
         data = get_webstorage_data(args.public_key, args.backupset)
-        restore(filestorage, data, args.extract_path, overwrite=args.overwrite)
+        restore(filestorage, data, args.extract_path, overwrite=args.overwrite, jobs=max(args.jobs, 4), sync=args.sync, verify=args.sync_verify)
     # GET Backupset to path
     elif args.get:
         if args.extract_path is None:
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+Pipeline to hash and upload blocks on a pool of threads
+"""
+import collections
+import concurrent.futures
+
+
+class BlockPipeline(object):
+    """
+    call put_func for every block on a thread pool and return the results
+    in the order of the blocks
+
+    hashlib releases the GIL for large buffers and the uploads are waiting
+    on the network, so hashing, dedup lookups and uploads of the next
+    blocks overlap with each other and with reading the file
+
+    at most window blocks are in flight, to limit memory usage
+    """
+
+    def __init__(self, put_func, threads=4, window=None):
+        self._put_func = put_func
+        self._threads = threads
+        self._window = window or 2 * threads
+        self._executor = None
+
+    @property
+    def threads(self):
+        return self._threads
+
+    def run(self, blocks, **kwds):
+        """
+        yield data, result of put_func(data, **kwds) for every block in blocks
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._threads)
+        pending = collections.deque()
+        try:
+            for data in blocks:
+                if len(pending) >= self._window:
+                    first_data, future = pending.popleft()
+                    yield first_data, future.result()
+                pending.append((data, self._executor.submit(self._put_func, data, **kwds)))
+            while pending:
+                first_data, future = pending.popleft()
+                yield first_data, future.result()
+        finally:
+            for _, future in pending: # only on errors
+                future.cancel()
+
+    def close(self):
+        """
+        shutdown thread pool
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -3,21 +3,75 @@
 """
 RestFUL Webclient to use BlockStorage WebApps
 """
-import os
-import array
+import copy
+import zlib
+import lzma
 import logging
+import threading
 # own modules
 from webstorageClient.ClientConfig import ClientConfig
 from webstorageClient.WebStorageClient import WebStorageClient
 
+# all-zero block, to detect zero blocks by memcmp and to return them without transfer
+ZERO_BLOCK = bytes(1024 * 1024)
+
+def is_zero(data):
+    """
+    return True if data (bytes, bytearray, memoryview) contains only zeros
+    """
+    if len(data) > len(ZERO_BLOCK):
+        return data == bytes(len(data))
+    return ZERO_BLOCK.startswith(data)
+
 class BlockStorageError(Exception):
     pass
 
+class CompressionAdvisor(object):
+    """
+    decide per type of data, if wire compression is worth the CPU
+
+    the first probe_blocks blocks of every type are compressed in any case,
+    afterwards only if the average ratio of the probes was good enough
+    so jpegs, archives and such are not compressed again and again
+    """
+
+    def __init__(self, probe_blocks=4, max_ratio=0.9):
+        self._probe_blocks = probe_blocks
+        self._max_ratio = max_ratio
+        self._stats = {} # hint : [count, sum of ratios]
+        self._lock = threading.Lock() # shared by clones on pool threads
+
+    @property
+    def max_ratio(self):
+        return self._max_ratio
+
+    def wanted(self, hint):
+        """
+        return True if data of this type should be compressed
+        """
+        with self._lock:
+            count, ratio_sum = self._stats.get(hint, (0, 0.0))
+        if count < self._probe_blocks:
+            return True
+        return ratio_sum / count <= self._max_ratio
+
+    def record(self, hint, ratio):
+        """
+        remember compression ratio (compressed/raw) of one block of this type
+        """
+        with self._lock:
+            stat = self._stats.setdefault(hint, [0, 0.0])
+            stat[0] += 1
+            stat[1] += ratio
+
 class BlockStorageClient(WebStorageClient):
     """stores chunks of data into BlockStorage"""
 
-    def __init__(self, url=None, cache=True):
-        """__init__"""
+    def __init__(self, url=None, cache=True, compress=False):
+        """
+        cache ... keep all checksums of backend in a local cachefile, queried before every put
+        compress ... compress block data on the wire with deflate, if it is worth it
+        """
         self._logger = logging.getLogger(self.__class__.__name__)
         self._client_config = ClientConfig()
         if url is None:
@@ -27,17 +81,30 @@ class BlockStorageClient(WebStorageClient):
         super().__init__()
         # get info from backend
         self._cache = cache # cache blockdigests or not
+        self._advisor = CompressionAdvisor() if compress else None
+        self._zero_digests = {} # length : checksum of all-zero blocks
+        self._inflight = {} # checksum : threading.Event, blocks uploading right now, shared by clones
+        self._lock = threading.Lock()
         self._info = self._get_json("info")
-        # search for cachefiles, and load local data
-        self._checksums = None
-        cachefile, cache_epoch = self._choose_cachefile(self._client_config.homepath, self._info["id"], self._info["blockchain_epoch"])
-        if cache_epoch == 2: # fresh file
-            self._dump_checksums(cachefile, 2)
-        elif cache_epoch < self._info["blockchain_epoch"]:
-            self._logger.info("TODO: update local cache, fallback get whole data")
-            self._dump_checksums(cachefile, 2)
-        # load stored data
-        self._checksums = self._load_checksums(cachefile)
+        self._checksums = set() # without cache only blocks put by this client
+        if cache is True: # load local cache of checksums, and append epochs added since the last run
+            self._checksums = self._sync_checksums()
+        self._zero_digest(self.blocksize) # most often used
+
+    def _new_session(self):
+        session = super()._new_session()
+        # deflate is decoded by requests itself, xz in get()
+        session.headers["accept-encoding"] = "gzip, deflate, xz"
+        return session
+
+    def clone(self):
+        """
+        return copy with its own session, to use in another thread,
+        the known checksums are shared
+        """
+        clone = copy.copy(self)
+        clone._session = self._new_session()
+        return clone
 
     @property
     def blocksize(self):
@@ -49,9 +116,6 @@ class BlockStorageClient(WebStorageClient):
 
     @property
     def checksums(self):
-        if (self._cache == True) and (not self._checksums):
-            self._logger.info("getting existing checksums")
-            self._checksums = self._get_json()
         return self._checksums
 
     def get_info(self):
@@ -61,12 +125,6 @@ class BlockStorageClient(WebStorageClient):
         self._info = self._get_json("info")
         return self._info
 
-    def get_epoch(self, epoch):
-        """
-        return blockchain data at epoch
-        """
-        return self._get_json("epoch/%d" % epoch)
-
     def get_journal(self, epoch):
         """
         return blockchain journal starting at epoch
@@ -83,35 +141,75 @@ class BlockStorageClient(WebStorageClient):
             for chunk in res:
                 outfile.write(chunk)
 
-    def put(self, data, use_cache=False):
-        """put some arbitrary data into storage"""
+    def put(self, data, use_cache=False, hint=None):
+        """
+        put some arbitrary data into storage
+
+        hint ... type of data, like file extension, used to decide on wire compression
+
+        with use_cache, a block put by several threads at once is sent only
+        once, the others wait for this upload and return 202
+        """
         if len(data) > self.blocksize: # assure maximum length
             raise BlockStorageError("length of providede data (%s) is above maximum blocksize of %s" % (len(data), self.blocksize))
-        checksum = self._blockdigest(data)
-        if use_cache and checksum in self.checksums:
-            self._logger.debug("202 - skip this block, checksum is in list of cached checksums")
-            return checksum, 202
+        if is_zero(data): # no need to hash, sparse files have lots of them
+            checksum = self._zero_digest(len(data))
         else:
-            res = self._put(checksum, data=data)
+            checksum = self._blockdigest(data)
+        if use_cache:
+            while True:
+                with self._lock:
+                    if checksum in self._checksums:
+                        self._logger.debug("202 - skip this block, checksum is in list of cached checksums")
+                        return checksum, 202
+                    uploaded = self._inflight.get(checksum)
+                    if uploaded is None: # claim it, identical blocks in flight are sent only once
+                        uploaded = self._inflight[checksum] = threading.Event()
+                        break
+                uploaded.wait() # by another thread, check again, it could have failed
+        try:
+            res = self._put(checksum, *self._encode(data, hint))
             if res.status_code == 201:
-                self._logger.debug("201 - block rewritten")
+                self._logger.debug("201 - block existed already")
             if res.text != checksum:
                 raise BlockStorageError("checksum mismatch, sent %s to save, but got %s from backend" % (checksum, res.text))
-            self._checksums.append(checksum) # add to local cache
+            self._checksums.add(checksum) # add to local cache
             return res.text, res.status_code
+        finally:
+            if use_cache:
+                with self._lock:
+                    del self._inflight[checksum]
+                uploaded.set()
 
     def get(self, checksum, verify=False):
         """
         get data defined by hexdigest from storage
         if verify - recheck checksum locally
+
+        blocks stored compressed at BlockStorage are transfered compressed
+        and decoded here, all-zero blocks with known checksum are not transfered
         """
+        length = self.zero_length(checksum)
+        if length is not None:
+            return ZERO_BLOCK[:length]
         res = self._get(checksum)
         data = res.content
+        if res.headers.get("content-encoding") == "xz":
+            data = lzma.decompress(data)
         if verify:
             if checksum != self._blockdigest(data):
                 raise BlockStorageError("Checksum mismatch %s requested, %s get" % (checksum, self._blockdigest(data)))
         return data
 
+    def zero_length(self, checksum):
+        """
+        return length of all-zero block with checksum, None if checksum is not a known zero block
+        """
+        for length, zero_checksum in self._zero_digests.items():
+            if zero_checksum == checksum:
+                return length
+        return None
+
     def get_verify(self, checksum):
         return self.get(checksum, True)
 
@@ -163,67 +261,27 @@ class BlockStorageClient(WebStorageClient):
 
 ##################### private section #####################################
 
-    def _dump_checksums(self, cachefile, epoch=2):
+    def _zero_digest(self, length):
+        """
+        return checksum of all-zero block of length, calculated only once
         """
-        write binary blob of checksums to cachefile
+        if length not in self._zero_digests:
+            self._zero_digests[length] = self._blockdigest(ZERO_BLOCK[:length])
+        return self._zero_digests[length]
 
-        to get whole checksums from backend use
-            epoch=2
-        returns: None
+    def _encode(self, data, hint):
         """
-        res = self._get_chunked("checksums/%d" % epoch)
-        self._logger.info("writing %s", cachefile)
-        mode = "wb"
-        if epoch != 2:
-            mode = "ab" # append if epoch higher than 2
-        with open(cachefile, mode) as outfile:
-            for chunk in res:
-                outfile.write(chunk)
+        compress data for transfer if compression is enabled and worth it
 
-    def _load_checksums(self, cachefile):
-        """
-        loading list of checksums from locally stored binary blob
-
-        using: cachefile
-        returning: checksums
-        """
-        checksums = []
-        self._logger.info("using cachefile %s", cachefile)
-        data = array.array("B")
-        with open(cachefile, "rb") as infile:
-            data.fromfile(infile, os.stat(cachefile).st_size)
-            for index in range(0, len(data), 20):
-                checksum = "".join(["%02x" % item for item in data[index:index+20]])
-                checksums.append(checksum)
-        self._logger.info("loaded %d checksum from cache", len(checksums))
-        return checksums
-
-    def _choose_cachefile(self, directory, backend_id, backend_epoch):
-        """
-        try to find the best cachefile available
-        using: self._client_config, self._info
-        modfying: self._cachefile
-        returning: cachefile, cachefile_epoch
-        """
-        cache_file = None
-        cache_epoch = 2 # the lowest possible
-        cache_file = "%s.bin" % backend_id
-        absfilename = os.path.join(directory, cache_file)
-        self._logger.info("absfilename: %s", absfilename)
-        if os.path.isfile(absfilename):
-            cache_epoch = int(os.stat(absfilename).st_size / 20) + 1
-            self._logger.info("cache_epoch: %s", cache_epoch)
-            leftover = os.stat(absfilename).st_size % 20
-            self._logger.info("leftover: %s", leftover)
-            if leftover != 0:
-                self._logger.error("cachefile %s is corrupted, deleting file", cache_file)
-                os.unlink(absfilename)
-                cache_epoch = 2
-            else:
-                self._logger.info("found checksum cache file until epoch %d", cache_epoch)
-                if cache_epoch > backend_epoch: # something wrong
-                    self._logger.error("cachefile %s epoch is higher than backend epoch, deleting file", cache_file)
-                    os.unlink(absfilename)
-                    cache_epoch = 2
-        return absfilename, cache_epoch
+        returns: data, headers
+        """
+        if self._advisor is None or not self._advisor.wanted(hint):
+            return data, None
+        compressed = zlib.compress(data, 1)
+        ratio = len(compressed) / len(data)
+        self._advisor.record(hint, ratio)
+        if ratio > self._advisor.max_ratio:
+            return data, None
+        self._logger.debug("sending block compressed with ratio %0.2f", ratio)
+        return compressed, {"content-encoding" : "deflate"}
 
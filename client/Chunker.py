@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+Chunkers to cut file like objects into blocks to store in BlockStorage
+
+FixedChunker cuts at fixed blocksize offsets, the classic way
+GearChunker cuts content defined with a FastCDC style gear rolling hash,
+so inserted or deleted bytes only change the blocks around the edit
+"""
+import os
+import io
+import stat
+import mmap
+import hashlib
+import logging
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# gear table, derived from sha1 to be the same on every client
+# otherwise equal data would be cut differently and not deduplicate
+GEAR = [int.from_bytes(hashlib.sha1(bytes((index, ))).digest()[:4], "big") for index in range(256)]
+MASK32 = 0xFFFFFFFF
+WINDOW = 32 # after 32 shifts every older byte has left the 32 bit hash
+
+
+class FixedChunker(object):
+    """
+    cut data at fixed offsets
+
+    the data is read with readinto in a ring of preallocated buffers and
+    yielded as memoryview slices, so no new bytes object is allocated per block,
+    a yielded block is only valid until the ring has turned around,
+    this is after buffers * readahead more blocks
+
+    with use_mmap regular files are mapped to memory and sliced directly
+    """
+
+    method = "fixed"
+
+    def __init__(self, blocksize, readahead=1, buffers=2, use_mmap=False):
+        """
+        readahead ... number of blocks to read at once
+        buffers ... number of buffers in ring, 0 to read into new bytes objects
+        use_mmap ... map regular files to memory instead of reading
+        """
+        self.blocksize = blocksize
+        self.readahead = readahead
+        self.buffers = buffers
+        self.use_mmap = use_mmap
+        self._ring = []
+
+    @property
+    def recipe_info(self):
+        """information to store in recipe"""
+        return {"method" : self.method, "blocksize" : self.blocksize}
+
+    def clone(self):
+        """return chunker with same settings and its own buffers, for another thread"""
+        return FixedChunker(self.blocksize, self.readahead, self.buffers, self.use_mmap)
+
+    def chunks(self, fh):
+        """
+        yield blocks of fileobject, every block is blocksize long,
+        only the last one is shorter
+        """
+        if self.use_mmap and self._mappable(fh):
+            yield from self._chunks_mmap(fh)
+        elif self.buffers and hasattr(fh, "readinto"):
+            yield from self._chunks_readinto(fh)
+        else:
+            yield from self._chunks_read(fh)
+
+    def _chunks_read(self, fh):
+        """
+        every read returns a new bytes object
+        """
+        data = fh.read(self.blocksize * self.readahead)
+        while data:
+            for offset in range(0, len(data), self.blocksize):
+                yield data[offset:offset + self.blocksize]
+            data = fh.read(self.blocksize * self.readahead)
+
+    def _chunks_readinto(self, fh):
+        """
+        read into ring of preallocated buffers
+        """
+        size = self.blocksize * self.readahead
+        if len(self._ring) != self.buffers or len(self._ring[0]) != size:
+            self._ring = [bytearray(size) for _ in range(self.buffers)]
+        index = 0
+        while True:
+            view = memoryview(self._ring[index])
+            length = 0
+            while length < size: # read till buffer is full or EOF
+                count = fh.readinto(view[length:])
+                if not count:
+                    break
+                length += count
+            for offset in range(0, length, self.blocksize):
+                yield view[offset:min(offset + self.blocksize, length)]
+            if length < size:
+                break
+            index = (index + 1) % self.buffers
+
+    def _mappable(self, fh):
+        """
+        return True if fh is a regular, not empty, file
+        """
+        try:
+            stats = os.fstat(fh.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        return stat.S_ISREG(stats.st_mode) and stats.st_size > 0 and fh.tell() == 0
+
+    def _chunks_mmap(self, fh):
+        """
+        slice memory mapped file, the mapping is freed
+        when the last yielded block is released
+        """
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        for offset in range(0, len(view), self.blocksize):
+            yield view[offset:offset + self.blocksize]
+
+
+class GearChunker(object):
+    """
+    content defined chunking with gear rolling hash and normalized chunking
+
+    blocks are min_size to max_size long, on average around avg_size
+    till avg_size a stricter mask is used, afterwards a looser one,
+    so the block lengths concentrate around avg_size
+
+    if numpy is available the gear hashes are calculated vectorized,
+    otherwise table driven in pure python
+    """
+
+    method = "gear"
+
+    def __init__(self, max_size, avg_size=None, min_size=None):
+        self.max_size = max_size
+        self.avg_size = avg_size or max_size // 4
+        self.min_size = min_size or self.avg_size // 4
+        if not WINDOW <= self.min_size < self.avg_size < self.max_size:
+            raise ValueError("%d <= min_size (%d) < avg_size (%d) < max_size (%d) is necessary" % (WINDOW, self.min_size, self.avg_size, self.max_size))
+        bits = self.avg_size.bit_length() - 1
+        # use the upper bits, these depend on the most bytes of the window
+        self._mask_s = ((1 << (bits + 2)) - 1) << (32 - bits - 2)
+        self._mask_l = ((1 << (bits - 2)) - 1) << (32 - bits + 2)
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if numpy is not None:
+            self._gear = numpy.array(GEAR, dtype=numpy.uint32)
+            self._cut = self._cut_numpy
+        else:
+            self._cut = self._cut_python
+
+    @property
+    def recipe_info(self):
+        """information to store in recipe"""
+        return {"method" : self.method, "min_size" : self.min_size, "avg_size" : self.avg_size, "max_size" : self.max_size}
+
+    def clone(self):
+        """chunks uses no shared buffers, so the same chunker could be used on every thread"""
+        return self
+
+    def chunks(self, fh):
+        """
+        yield content defined blocks of fileobject
+        """
+        buf = bytearray()
+        start = 0
+        eof = False
+        while True:
+            if not eof and len(buf) - start < self.max_size:
+                del buf[:start] # compact, only the unprocessed tail is moved
+                start = 0
+                data = fh.read(4 * self.max_size)
+                if data:
+                    buf += data
+                else:
+                    eof = True
+            end = min(len(buf), start + self.max_size)
+            if end == start:
+                break
+            length = self._cut(buf, start, end)
+            with memoryview(buf) as view: # copy only once
+                data = bytes(view[start:start + length])
+            yield data
+            start += length
+
+    def _cut_python(self, buf, start, end):
+        """
+        return length of next block starting at start, end is the maximum
+        """
+        if end - start <= self.min_size:
+            return end - start
+        gear = GEAR
+        hashval = 0
+        # warm up the window before the first possible cut
+        for pos in range(start + self.min_size - WINDOW, start + self.min_size):
+            hashval = ((hashval << 1) + gear[buf[pos]]) & MASK32
+        barrier = min(start + self.avg_size, end)
+        mask = self._mask_s
+        for pos in range(start + self.min_size, barrier):
+            hashval = ((hashval << 1) + gear[buf[pos]]) & MASK32
+            if not hashval & mask:
+                return pos + 1 - start
+        mask = self._mask_l
+        for pos in range(barrier, end):
+            hashval = ((hashval << 1) + gear[buf[pos]]) & MASK32
+            if not hashval & mask:
+                return pos + 1 - start
+        return end - start
+
+    def _hashes_numpy(self, buf, first, last):
+        """
+        return gear hashes of positions first to last (exclusive)
+
+        every hash is the sum of gear[byte] << age over the last 32 bytes,
+        calculated by doubling the window in five vectorized steps
+        """
+        data = numpy.frombuffer(buf, dtype=numpy.uint8, count=last - first + WINDOW - 1, offset=first - WINDOW + 1)
+        hashes = self._gear[data]
+        width = 1
+        while width < WINDOW:
+            hashes[width:] += hashes[:-width] << numpy.uint32(width)
+            width *= 2
+        return hashes[WINDOW - 1:]
+
+    def _cut_numpy(self, buf, start, end):
+        """
+        return length of next block starting at start, end is the maximum
+        """
+        if end - start <= self.min_size:
+            return end - start
+        barrier = min(start + self.avg_size, end)
+        for first, last, mask in ((start + self.min_size, barrier, self._mask_s), (barrier, end, self._mask_l)):
+            if first == last:
+                continue
+            hashes = self._hashes_numpy(buf, first, last)
+            found = numpy.flatnonzero((hashes & numpy.uint32(mask)) == 0)
+            if len(found):
+                return first + int(found[0]) + 1 - start
+        return end - start
+
+
+def get_chunker(method, blocksize, readahead=1, buffers=2, use_mmap=False):
+    """
+    return chunker for method, blocks are never longer than blocksize
+    readahead, buffers and use_mmap are used for fixed chunking only
+    """
+    if method == "fixed":
+        return FixedChunker(blocksize, readahead, buffers, use_mmap)
+    if method == "gear":
+        return GearChunker(blocksize)
+    raise ValueError("unknown chunking method %s, use fixed or gear" % method)
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+compiled matcher for exclude files of wstar
+"""
+import re
+import logging
+
+
+class AhoCorasick(object):
+    """
+    automaton to find if any of many substrings is in some string,
+    with one dictionary lookup per character, regardless of the number of substrings
+
+    the transitions are completed at build time, so there are no failure links
+    to follow while matching
+    """
+
+    def __init__(self, patterns):
+        self._delta = [{}]
+        self._final = set()
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._delta[state]:
+                    self._delta.append({})
+                    self._delta[state][char] = len(self._delta) - 1
+                state = self._delta[state][char]
+            self._final.add(state)
+        self._complete()
+
+    def _complete(self):
+        """
+        breadth first over the trie, the failure state of every state is
+        less deep and therefore already completed, missing transitions
+        are copied from it, transitions back to the root are left out
+        """
+        alphabet = set()
+        for transitions in self._delta:
+            alphabet.update(transitions)
+        fail = [0] * len(self._delta)
+        queue = [0]
+        for state in queue:
+            for char, child in list(self._delta[state].items()):
+                if state != 0:
+                    fail[child] = self._delta[fail[state]].get(char, 0)
+                if fail[child] in self._final: # some suffix is a pattern
+                    self._final.add(child)
+                queue.append(child)
+            if state != 0:
+                for char in alphabet.difference(self._delta[state]):
+                    target = self._delta[fail[state]].get(char, 0)
+                    if target:
+                        self._delta[state][char] = target
+
+    def search(self, string):
+        """
+        return True if any pattern is a substring of string
+        """
+        delta = self._delta
+        final = self._final
+        state = 0
+        for char in string:
+            state = delta[state].get(char, 0)
+            if state in final:
+                return True
+        return 0 in final # empty pattern
+
+
+class ExcludeMatcher(object):
+    """
+    decide if a path is excluded by rules of an exclude file
+
+    every rule is a line "- pattern" to exclude or "+ pattern" to include,
+    include rules win over exclude rules, a pattern is
+
+    re:<regex> ... regular expression, searched in path
+    <glob> ... with *, ? or [], * and ? do not match /, ** matches anything,
+        starting with / it must match from the start of path,
+        otherwise from the start of some path component,
+        ending with / it matches a directory and everything below
+    <string> ... substring of path, as before
+
+    all substrings are matched by one AhoCorasick automaton,
+    all globs and regexes by one combined regular expression
+    """
+
+    def __init__(self, excludes=(), includes=()):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._excludes = self._compile(excludes)
+        self._includes = self._compile(includes) if includes else None
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        read exclude file and return ExcludeMatcher
+        """
+        excludes = []
+        includes = []
+        with open(filename, "rt") as exclude_file:
+            for row in exclude_file:
+                if len(row) <= 1:
+                    continue
+                if row[0] == "#":
+                    continue
+                operator = row.strip()[0] # -/+
+                pattern = row.strip()[2:]
+                if operator == "-":
+                    excludes.append(pattern)
+                elif operator == "+":
+                    includes.append(pattern)
+        return cls(excludes, includes)
+
+    @staticmethod
+    def _glob_to_regex(glob):
+        """
+        return regex for glob, and True if it matches directories
+        """
+        parts = ["^" if glob.startswith("/") else "(?:^|/)"]
+        is_dir = glob.endswith("/")
+        index = 0
+        while index < len(glob):
+            char = glob[index]
+            if glob.startswith("**", index):
+                parts.append(".*")
+                index += 2
+                continue
+            if char == "*":
+                parts.append("[^/]*")
+            elif char == "?":
+                parts.append("[^/]")
+            elif char == "[":
+                end = glob.find("]", index + 2)
+                if end == -1:
+                    parts.append(re.escape(char))
+                else:
+                    inner = glob[index + 1:end]
+                    if inner.startswith("!"):
+                        inner = "^" + inner[1:]
+                    parts.append("[%s]" % inner.replace("\\", "\\\\"))
+                    index = end
+            else:
+                parts.append(re.escape(char))
+            index += 1
+        if not is_dir:
+            parts.append(r"\Z")
+        return "".join(parts), is_dir
+
+    def _compile(self, patterns):
+        """
+        return substring automaton, regex for all patterns, regex for prefix safe patterns
+        """
+        substrings = []
+        regexes = []
+        dir_regexes = []
+        for pattern in patterns:
+            if pattern.startswith("re:"):
+                regexes.append(pattern[3:])
+            elif any(char in pattern for char in "*?["):
+                regex, is_dir = self._glob_to_regex(pattern)
+                regexes.append(regex)
+                if is_dir:
+                    dir_regexes.append(regex)
+            else:
+                substrings.append(pattern)
+        self._logger.debug("compiled %d substrings and %d regexes", len(substrings), len(regexes))
+        automaton = AhoCorasick(substrings) if substrings else None
+        combined = re.compile("|".join("(?:%s)" % regex for regex in regexes)) if regexes else None
+        combined_dir = re.compile("|".join("(?:%s)" % regex for regex in dir_regexes)) if dir_regexes else None
+        return automaton, combined, combined_dir
+
+    @staticmethod
+    def _match(compiled, path, prefix_safe=False):
+        automaton, combined, combined_dir = compiled
+        if automaton is not None and automaton.search(path):
+            return True
+        regex = combined_dir if prefix_safe else combined
+        return regex is not None and regex.search(path) is not None
+
+    def __call__(self, absfilename):
+        """
+        return True if absfilename is excluded
+        """
+        if not self._match(self._excludes, absfilename):
+            return False
+        return self._includes is None or not self._match(self._includes, absfilename)
+
+    def prune(self, absdirname):
+        """
+        return True if every path below absdirname is excluded,
+        so the directory has not to be walked
+
+        only substrings and directory globs are used, whatever matches
+        absdirname/ also matches every path below, if there are include
+        rules nothing is pruned, they could match something below
+        """
+        if self._includes is not None:
+            return False
+        return self._match(self._excludes, absdirname.rstrip("/") + "/", prefix_safe=True)
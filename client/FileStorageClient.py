@@ -3,13 +3,77 @@
 """
 RestFUL Webclient to use FileStorage WebApp
 """
+import os
+import copy
 import json
+import base64
+import struct
+import hashlib
 import logging
+import itertools
+import threading
 # own modules
 from webstorageClient.ClientConfig import ClientConfig
 from webstorageClient.BlockStorageClient import BlockStorageClient
+from webstorageClient.Chunker import get_chunker
+from webstorageClient.BlockPipeline import BlockPipeline
+from webstorageClient.RecipeReader import RecipeReader
+from webstorageClient import RecipeFormat
 from webstorageClient.WebStorageClient import WebStorageClient
 
+PAGE_ENTRIES = 4096 # blocks per recipe page, 4GB of data with blocks of 1MB
+PAGE_ENTRY = struct.Struct(">20sI") # binary sha1 digest and length of block
+RECIPE_VERSION = 2 # 1 or missing ... blockchain only, 2 ... inline or pages
+
+
+class FileDigest(object):
+    """
+    running checksum of file data, like the one used to identify recipes
+
+    identity sha1 ... sha1 of the whole file data
+    identity blocklist ... sha1 of the ordered binary block digests followed by
+        the file size as 8 byte big endian, so no byte is hashed twice
+        if the block digests are already known
+    """
+
+    identities = ("sha1", "blocklist")
+
+    def __init__(self, identity="sha1"):
+        if identity not in self.identities:
+            raise ValueError("unknown identity %s, use sha1 or blocklist" % identity)
+        self.identity = identity
+        self.size = 0
+        self._digest = hashlib.sha1()
+
+    def update(self, data, checksum=None):
+        """
+        add next block of data, checksum is the hexdigest of this block if known
+        for identity blocklist, update has to be called once per block
+        """
+        self.size += len(data)
+        if self.identity == "blocklist":
+            if checksum is None:
+                checksum = hashlib.sha1(data).hexdigest()
+            self._digest.update(bytes.fromhex(checksum))
+        else:
+            self._digest.update(data)
+
+    def update_block(self, checksum, length):
+        """
+        add next block known only by checksum and length, identity blocklist only
+        """
+        if self.identity != "blocklist":
+            raise ValueError("identity %s needs the data of every block" % self.identity)
+        self.size += length
+        self._digest.update(bytes.fromhex(checksum))
+
+    def hexdigest(self):
+        if self.identity == "blocklist":
+            digest = self._digest.copy()
+            digest.update(self.size.to_bytes(8, "big"))
+            return digest.hexdigest()
+        return self._digest.hexdigest()
+
 
 class FileStorageClient(WebStorageClient):
     """
@@ -19,8 +83,15 @@ class FileStorageClient(WebStorageClient):
 
     __version = "1.1"
 
-    def __init__(self, url=None, cache=True):
-        """__init__"""
+    def __init__(self, url=None, cache=True, compress=False, chunking="fixed", identity="sha1", threads=1, use_mmap=False, inline_size=0):
+        """
+        compress ... compress blocks on the wire, decided adaptive by file type
+        chunking ... fixed to cut at blocksize offsets, gear for content defined blocks
+        identity ... sha1 of whole file or blocklist to derive the file checksum from block checksums
+        threads ... hash and upload blocks of one file on this number of threads
+        use_mmap ... map regular files to memory instead of reading them, fixed chunking only
+        inline_size ... files up to this size are stored inline in the recipe, 0 to disable
+        """
         self._logger = logging.getLogger(self.__class__.__name__)
         self._client_config = ClientConfig()
         if not url:
@@ -28,10 +99,46 @@ class FileStorageClient(WebStorageClient):
         else:
             self._url = url
         super().__init__()
-        self._bs = BlockStorageClient(cache=cache)
+        self._bs = BlockStorageClient(cache=cache, compress=compress)
         self._info = self._get_json("info") # TODO: use it
+        self._binary_recipes = "binary" in self._info.get("recipe_formats", ())
+        self._bulk = self._info.get("bulk", False)
         self._cache = cache
         self._checksums = set()
+        if cache is True: # load local cache of recipe checksums, and append epochs added since the last run
+            self._checksums = self._sync_checksums()
+        # 2 * threads blocks are in flight in pipeline, read ahead threads blocks
+        # so 4 buffers of the ring are enough to not overwrite any of them
+        self._chunker = get_chunker(chunking, self._bs.blocksize, readahead=threads, buffers=2 if threads == 1 else 4, use_mmap=use_mmap)
+        self._pipeline = None
+        self._local = threading.local()
+        if threads > 1:
+            self._pipeline = BlockPipeline(self._put_block, threads)
+        if identity not in FileDigest.identities:
+            raise ValueError("unknown identity %s, use one of %s" % (identity, FileDigest.identities))
+        self._identity = identity
+        self._inline_size = inline_size
+
+    def clone(self):
+        """
+        return copy with its own sessions, chunker and pipeline,
+        to put files on another thread, the known checksums are shared
+        """
+        clone = copy.copy(self)
+        clone._session = self._new_session()
+        clone._bs = self._bs.clone()
+        clone._chunker = self._chunker.clone()
+        clone._local = threading.local()
+        if self._pipeline is not None:
+            clone._pipeline = BlockPipeline(clone._put_block, self._pipeline.threads)
+        return clone
+
+    def close(self):
+        """
+        shutdown thread pool of pipeline, if any
+        """
+        if self._pipeline is not None:
+            self._pipeline.close()
 
     @property
     def blockstorage(self):
@@ -39,11 +146,12 @@ class FileStorageClient(WebStorageClient):
 
     @property
     def checksums(self):
-        if self._cache is True and not self._checksums:
-            self._logger.info("getting existing checksums from backend")
-            self._checksums = set(self._get_json())
         return self._checksums
 
+    @property
+    def inline_size(self):
+        return self._inline_size
+
     @property
     def info(self):
         return self._info # TODO: is this necessary
@@ -52,58 +160,293 @@ class FileStorageClient(WebStorageClient):
         """
         save data of fileobject in Blockstorage
 
-        data is read in blocks
+        data is read in blocks, mostly as memoryview of some reused buffer
         every block will be checksummed and tested if exists against
         BlockStorage
           if not existing, put it into BlockStorage
         the whole file is also checksummed and tested against FileStorage
           if not existing, put it into FileStorage
+
+        how the data is cut into blocks is stored in chunking,
+        for content defined blocks also the length of every block
+
+        with identity blocklist the file checksum is derived from the block
+        checksums, see FileDigest, and stored in identity of the recipe
+
+        files up to inline_size are stored base64 encoded in inline of the
+        recipe, without any block, always with identity sha1
+        """
+        if self._inline_size and fh.seekable():
+            data = fh.read(self._inline_size + 1)
+            if len(data) <= self._inline_size:
+                return self._store_inline(data, mime_type)
+            fh.seek(0)
+        return self._store(fh, mime_type, FileDigest(self._identity))
+
+    def _store_inline(self, data, mime_type):
+        """
+        put recipe with data inline in FileStorage
         """
         metadata = {
             "blockchain" : [],
-            "size" : 0,
+            "chunking" : self._chunker.recipe_info,
+            "size" : len(data),
+            "checksum" : self._blockdigest(data),
+            "mime_type" : mime_type,
+            "identity" : "sha1",
+            "inline" : base64.b64encode(data).decode("ascii"),
+            "version" : 2, # older clients would read an empty blockchain
+            "filehash_exists" : False,
+            "blockhash_exists" : 0,
+        }
+        return self._put_recipe(metadata)
+
+    def put_append(self, fh, checksum, mime_type="application/octet-stream"):
+        """
+        save data of fileobject, which is the file of recipe checksum
+        with some data appended, like growing log files
+
+        the last complete block of the old recipe is read and verified,
+        if it matches, all blocks before are reused and only the data
+        after them is read, otherwise the whole file is read with put,
+        changes in front of this block are not detected
+
+        only with identity blocklist, with sha1 the whole file has to be
+        read and hashed anyway, so it is always put, sending only new blocks
+        """
+        if self._identity != "blocklist":
+            return self.put(fh, mime_type)
+        try:
+            recipe = self.get(checksum)
+        except KeyError:
+            self._logger.info("recipe %s not found, reading whole file", checksum)
+            recipe = None
+        prefix = None
+        if recipe is not None:
+            prefix = self._verified_prefix(fh, recipe)
+        if prefix is None:
+            fh.seek(0)
+            return self.put(fh, mime_type)
+        blockchain, blocksizes = prefix
+        self._logger.debug("reusing %d blocks of %s, reading from offset %d", len(blockchain), checksum, sum(blocksizes))
+        fh.seek(sum(blocksizes))
+        filehash = FileDigest(self._identity)
+        for block_checksum, length in zip(blockchain, blocksizes):
+            filehash.update_block(block_checksum, length)
+        return self._store(fh, mime_type, filehash, blockchain, blocksizes)
+
+    def _verified_prefix(self, fh, recipe):
+        """
+        return blockchain, blocksizes of recipe without the last block,
+        if the last of these blocks matches the data in fh, otherwise None
+        """
+        if "inline" in recipe:
+            self._logger.info("recipe is inline, reading whole file")
+            return None
+        chunking = recipe.get("chunking", {"method" : "fixed", "blocksize" : self._bs.blocksize})
+        if chunking != self._chunker.recipe_info:
+            self._logger.info("recipe is chunked differently, reading whole file")
+            return None
+        blocks = list(self.blocks(recipe))
+        if len(blocks) < 2: # nothing to reuse
+            return None
+        blockchain, blocksizes = [list(values) for values in zip(*blocks)]
+        fh.seek(sum(blocksizes[:-2]))
+        data = fh.read(blocksizes[-2])
+        if len(data) != blocksizes[-2] or self._blockdigest(data) != blockchain[-2]:
+            self._logger.info("last complete block has changed, reading whole file")
+            return None
+        return blockchain[:-1], blocksizes[:-1]
+
+    def blocks(self, recipe):
+        """
+        yield checksum, length of every block in recipe,
+        pages of indirect recipes are fetched one at a time
+        """
+        if "pages" in recipe:
+            for page in recipe["pages"]:
+                for checksum, length in self.get_page(page):
+                    yield checksum, length
+        else:
+            for checksum, length in zip(recipe["blockchain"], self.block_lengths(recipe)):
+                yield checksum, length
+
+    def get_page(self, checksum):
+        """
+        return list of checksum, length of the blocks in recipe page
+        """
+        return [(digest.hex(), length) for digest, length in PAGE_ENTRY.iter_unpack(self._bs.get(checksum))]
+
+    def block_lengths(self, recipe):
+        """
+        return list of lengths of every block in recipe
+        """
+        if "pages" in recipe:
+            return [length for _, length in self.blocks(recipe)]
+        if "blocksizes" in recipe:
+            return recipe["blocksizes"]
+        blocksize = recipe.get("chunking", {}).get("blocksize", self._bs.blocksize)
+        count = len(recipe["blockchain"])
+        if count == 0:
+            return []
+        return [blocksize] * (count - 1) + [recipe["size"] - blocksize * (count - 1)]
+
+    def _store(self, fh, mime_type, filehash, blockchain=(), blocksizes=()):
+        """
+        put remaining data of fh in BlockStorage, appended to already
+        stored blocks blockchain of blocksizes, and recipe in FileStorage
+
+        filehash ... <FileDigest> updated with the data of blockchain already
+        """
+        metadata = {
+            "blockchain" : list(blockchain),
+            "chunking" : self._chunker.recipe_info,
+            "size" : sum(blocksizes),
             "checksum" : None,
             "mime_type" : mime_type,
+            "identity" : filehash.identity,
             "filehash_exists" : False, # indicate if the filehash already
-            "blockhash_exists" : 0, # how many blocks existed already
+            "blockhash_exists" : len(blockchain), # how many blocks existed already
         }
-        filehash = self.hashfunc()
+        # file extension if available to decide on compression
+        hint = os.path.splitext(str(getattr(fh, "name", "")))[1].lower() or mime_type
+        if self._chunker.method != "fixed":
+            metadata["blocksizes"] = list(blocksizes)
         # Put blocks in Blockstorage
-        data = fh.read(self._bs.blocksize)
-        while data:
+        for data, (checksum, status) in self._put_blocks(self._chunker.chunks(fh), hint):
             metadata["size"] += len(data)
-            filehash.update(data) # running filehash until end
-            checksum, status = self._bs.put(data, use_cache=True)
+            filehash.update(data, checksum) # running filehash until end
             self._logger.debug("PUT blockcount: %d, checksum: %s, status: %s", len(metadata["blockchain"]), checksum, status)
             # 202 - skipped, block in cache, 201 - rewritten, block existed
             if status in (201, 202):
                 metadata["blockhash_exists"] += 1
             metadata["blockchain"].append(checksum)
-            data = fh.read(self._bs.blocksize)
+            if "blocksizes" in metadata:
+                metadata["blocksizes"].append(len(data))
         self._logger.debug("put %d blocks in BlockStorage, %d existed already", len(metadata["blockchain"]), metadata["blockhash_exists"])
-        # put file composition into filestorage
-        filedigest = filehash.hexdigest()
-        metadata["checksum"] = filedigest
+        metadata["checksum"] = filehash.hexdigest()
+        self._paginate(metadata)
+        return self._put_recipe(metadata)
+
+    def _paginate(self, metadata):
+        """
+        move blockchain of recipes with more than PAGE_ENTRIES blocks to pages,
+        stored as blocks in BlockStorage, like indirect blocks of an inode
+
+        every page is the binary digest and length of PAGE_ENTRIES blocks,
+        pages always start at the same block index, so unchanged parts
+        of large files share their pages with older versions
+        """
+        if len(metadata["blockchain"]) <= PAGE_ENTRIES:
+            return
+        blockchain = metadata["blockchain"]
+        blocksizes = self.block_lengths(metadata)
+        metadata["pages"] = []
+        metadata["pagesizes"] = [] # bytes of data in every page
+        for start in range(0, len(blockchain), PAGE_ENTRIES):
+            lengths = blocksizes[start:start + PAGE_ENTRIES]
+            page = b"".join(PAGE_ENTRY.pack(bytes.fromhex(checksum), length) for checksum, length in zip(blockchain[start:start + PAGE_ENTRIES], lengths))
+            checksum, _ = self._bs.put(page, use_cache=True)
+            metadata["pages"].append(checksum)
+            metadata["pagesizes"].append(sum(lengths))
+        self._logger.debug("stored %d blocks in %d pages", len(blockchain), len(metadata["pages"]))
+        metadata["blockchain"] = []
+        metadata.pop("blocksizes", None)
+        metadata["version"] = 2 # older clients would read an empty blockchain
+
+    def _put_recipe(self, metadata):
+        """
+        put file composition into filestorage, if not already stored
+        """
+        filedigest = metadata["checksum"]
         if self.exists(filedigest) is not True: # check if filehash is already stored
             self._logger.debug("storing recipe for filechecksum: %s", filedigest)
-            res = self._put(filedigest, data=json.dumps(metadata))
+            if self._binary_recipes:
+                res = self._put(filedigest, data=RecipeFormat.encode(metadata), headers={"content-type" : RecipeFormat.MIME_TYPE})
+            else:
+                res = self._put(filedigest, data=json.dumps(metadata))
             if res.status_code == 201: # could only be true at some rare race conditions
                 self._logger.debug("recipe for checksum %s exists already", filedigest)
                 metadata["filehash_exists"] = True
+            self._checksums.add(filedigest) # add to local cache
             return metadata
         self._logger.debug("filehash %s already stored", filedigest)
         metadata["filehash_exists"] = True
         return metadata
 
-    def read(self, checksum):
+    def _put_blocks(self, blocks, hint):
+        """
+        put blocks in BlockStorage, on the pipeline if there is one
+        yields data, (checksum, status) in order of blocks
+        """
+        if self._pipeline is not None:
+            for result in self._pipeline.run(blocks, use_cache=True, hint=hint):
+                yield result
+        else:
+            for data in blocks:
+                yield data, self._bs.put(data, use_cache=True, hint=hint)
+
+    def read(self, checksum, threads=1):
         """
         return data as generator
         yields data blocks of self.blocksize
         the last block is almost all times less than self.blocksize
+
+        threads ... download the next blocks on this number of threads,
+            every thread with its own session, the blocks are still
+            yielded in order, so the result could be streamed
         """
-        for block in self._get_json(checksum)["blockchain"]:
+        recipe = self._get_recipe(checksum)
+        if "inline" in recipe: # tiny file, no BlockStorage request
+            yield base64.b64decode(recipe["inline"])
+            return
+        blockchain = (block for block, _ in self.blocks(recipe))
+        if threads > 1:
+            for data in self._read_parallel(blockchain, threads):
+                yield data
+            return
+        for block in blockchain:
             yield self._bs.get(block)
 
+    def _put_block(self, data, **kwds):
+        """
+        put block with the blockstorage clone of the current pool thread,
+        sessions are not thread safe
+        """
+        if not hasattr(self._local, "bs"):
+            self._local.bs = self._bs.clone()
+        return self._local.bs.put(data, **kwds)
+
+    def _read_parallel(self, blockchain, threads):
+        """
+        yield data of blocks in blockchain, downloaded on a pool of threads
+        """
+        local = threading.local()
+        def get_block(block):
+            if not hasattr(local, "bs"):
+                local.bs = self._bs.clone()
+            return local.bs.get(block)
+        pipeline = BlockPipeline(get_block, threads)
+        try:
+            for _, data in pipeline.run(blockchain):
+                yield data
+        finally:
+            pipeline.close()
+
+    def open(self, checksum, cache_blocks=8):
+        """
+        return seekable read-only file object of data defined by hexdigest,
+        only blocks touched by reads are downloaded
+        """
+        return RecipeReader(self, self._get_recipe(checksum), cache_blocks)
+
+    def file_digest(self, checksum):
+        """
+        return empty FileDigest to verify data of file defined by hexdigest,
+        feed it with the blocks yielded by read
+        """
+        return FileDigest(self._get_recipe(checksum).get("identity", "sha1"))
+
     def delete(self, checksum):
         """
         delete blockchain defined by hexdigest
@@ -117,15 +460,98 @@ class FileStorageClient(WebStorageClient):
 
         this is not the data of this file, only the plan how to assemble the file
         """
-        return self._get_json(checksum)
+        return self._get_recipe(checksum)
+
+    def get_many(self, checksums, batch_size=1000):
+        """
+        yield checksum, recipe for every checksum in given order,
+        recipe is None if not found, one streamed request per batch_size checksums,
+        if the stream ends early, the checksums not answered follow with None
+        """
+        checksums = iter(checksums)
+        while True:
+            batch = list(itertools.islice(checksums, batch_size))
+            if not batch:
+                return
+            if not self._bulk: # older FileStorage
+                for checksum in batch:
+                    try:
+                        yield checksum, self.get(checksum)
+                    except KeyError:
+                        yield checksum, None
+                continue
+            res = self._post("bulk/get", data=json.dumps(batch), headers={"content-type" : "application/json"}, stream=True)
+            answered = set()
+            for line in res.iter_lines():
+                if line:
+                    entry = json.loads(line.decode("utf-8"))
+                    answered.add(entry["checksum"])
+                    yield entry["checksum"], self._check_version(entry.get("recipe"))
+            for checksum in batch: # stream ended early
+                if checksum not in answered:
+                    self._logger.error("no answer for recipe %s in bulk stream", checksum)
+                    answered.add(checksum)
+                    yield checksum, None
+
+    def put_many(self, recipes, batch_size=1000):
+        """
+        store recipes with one request per batch_size recipes,
+        recipes already known to exist are not sent,
+        return recipes with filehash_exists set
+        """
+        recipes = list(recipes)
+        pending = []
+        for metadata in recipes:
+            metadata["filehash_exists"] = metadata["checksum"] in self._checksums
+            if not metadata["filehash_exists"]:
+                pending.append(metadata)
+        if not self._bulk: # older FileStorage
+            for metadata in pending:
+                self._put_recipe(metadata)
+            return recipes
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            data = "\n".join(json.dumps(metadata, default=list) for metadata in batch) # DigestList to list
+            results = self._post("bulk/put", data=data.encode("utf-8"), headers={"content-type" : "application/x-ndjson"}).json()
+            for metadata in batch:
+                status = results.get(metadata["checksum"])
+                if status not in ("stored", "exists"):
+                    raise IOError("recipe %s not stored : %s" % (metadata["checksum"], status))
+                metadata["filehash_exists"] = status == "exists"
+                self._checksums.add(metadata["checksum"])
+        self._logger.debug("put %d recipes, %d were known to exist", len(recipes), len(recipes) - len(pending))
+        return recipes
+
+    def _get_recipe(self, checksum):
+        """
+        get recipe, binary if FileStorage is able to, blockchain and pages
+        of binary recipes are compact DigestList instead of list of str
+        """
+        if not self._binary_recipes:
+            return self._check_version(self._get_json(checksum))
+        res = self._get(checksum, headers={"accept" : "%s, application/json;q=0.5" % RecipeFormat.MIME_TYPE})
+        if res.headers.get("content-type", "").startswith(RecipeFormat.MIME_TYPE):
+            return self._check_version(RecipeFormat.decode(res.content))
+        return self._check_version(res.json())
+
+    def _check_version(self, recipe):
+        """
+        return recipe, raise ValueError if its version is unknown to this client
+        """
+        if recipe is not None and recipe.get("version", 1) > RECIPE_VERSION:
+            raise ValueError("recipe %s has version %s, only up to %d is supported, update this client" % (recipe.get("checksum"), recipe["version"], RECIPE_VERSION))
+        return recipe
 
     def exists(self, checksum):
         """
-        exists method if caching is on
-        if the searched checksum is not available, the filestorage backend is queried
+        exists method if caching is on, the local cache is complete
+        up to the epoch of the last sync, so it is answered locally
+        if caching is off, the filestorage backend is queried
         """
         if checksum in self._checksums:
             return True
+        if self._cache is True:
+            return False
         if self._exists(checksum):
             self._checksums.add(checksum)
             return True
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+BlockStorage and FileStorage of server/ running in this process, used by the Test_* modules
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+# non std
+from werkzeug.serving import make_server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+import blockstorage
+import filestorage
+import recipestore
+
+
+class LocalBackend(object):
+    """
+    fresh BlockStorage and FileStorage served on free ports of localhost,
+    with a home directory holding the client config and cachefiles
+
+    HOME points to this home directory until close, so clients created
+    meanwhile use these backends, only one LocalBackend at a time,
+    the flask apps are module globals
+    """
+
+    def __init__(self, blocksize=4096, compression=None, recipe_store="sqlite"):
+        """
+        blocksize ... of BlockStorage, small to get many blocks of small test files
+        compression ... compression config of BlockStorage, like {"codecs" : ["zlib"]}
+        recipe_store ... files or sqlite
+        """
+        for logger in (logging.getLogger("werkzeug"), blockstorage.logger, filestorage.logger):
+            logger.setLevel(logging.CRITICAL) # every call of 127.0.0.1 is logged as error
+        self.root = tempfile.mkdtemp()
+        self.home = os.path.join(self.root, "home")
+        self._servers = []
+        self.blockstorage = blockstorage # server modules, to look at app and bc
+        self.filestorage = filestorage
+        blockstorage.app.config["hashfunc_func"] = hashlib.sha1
+        blockstorage.app.config["compression"] = compression
+        self.blockstorage_url = self._serve(blockstorage, "bs", blocksize)
+        filestorage.app.config["recipe_format"] = "json"
+        filestorage.app.config["recipe_store"] = recipe_store
+        self.filestorage_url = self._serve(filestorage, "fs", blocksize)
+        filestorage.app.config["store"] = recipestore.get_store(filestorage.app.config)
+        os.makedirs(os.path.join(self.home, ".webstorage"))
+        with open(os.path.join(self.home, ".webstorage", "WebStorageClient.json"), "wt") as outfile:
+            json.dump({
+                "blockstorages" : [{"url" : self.blockstorage_url, "default" : True}],
+                "filestorages" : [{"url" : self.filestorage_url, "default" : True}],
+                "archives" : [{"url" : "http://127.0.0.1:1", "default" : True}],
+                "request_verify" : True,
+                "apikey" : "test",
+                "proxies" : {},
+            }, outfile)
+        self._home = os.environ.get("HOME")
+        os.environ["HOME"] = self.home
+
+    @property
+    def homepath(self):
+        return os.path.join(self.home, ".webstorage")
+
+    def _serve(self, module, name, blocksize):
+        """
+        initialize app of module like its application() does, and serve it
+        returning: url
+        """
+        config = module.app.config
+        config.update({
+            "id" : "%s-test" % name,
+            "blocksize" : blocksize,
+            "hashfunc" : "sha1",
+            "maxlength" : 40,
+            "storage_dir" : os.path.join(self.root, name),
+            "blockchain_db" : os.path.join(self.root, "%s.db" % name),
+            "apikeys" : {},
+            "remote_addrs" : ["127.0.0.1"],
+            "blockchain_seed" : hashlib.sha256(("%s-test" % name).encode("ascii")).hexdigest(),
+        })
+        os.mkdir(config["storage_dir"])
+        module.bc.set_db(config["blockchain_db"])
+        module.bc.init(config["blockchain_seed"])
+        config["checksums"] = module.bc.checksums()
+        server = make_server("127.0.0.1", 0, module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        return "http://127.0.0.1:%d" % server.server_port
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        if self._home is None:
+            del os.environ["HOME"]
+        else:
+            os.environ["HOME"] = self._home
+        shutil.rmtree(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
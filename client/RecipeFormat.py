@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+binary encoding of recipes, like FileStorage stores and serves them
+
+header ... magic, version, flags, number of digests, length of meta data
+meta ... json of all small fields of the recipe, like size, checksum, mime_type
+digests ... binary 20 byte sha1 of every block, or of every page
+blocksizes ... 4 byte big endian length of every block, only with FLAG_BLOCKSIZES
+pagesizes ... 8 byte big endian bytes of data in every page, only with FLAG_PAGES
+"""
+import json
+import struct
+import collections.abc
+
+MIME_TYPE = "application/x-webstorage-recipe"
+MAGIC = b"WSRC"
+VERSION = 1
+HEADER = struct.Struct(">4sBBII") # magic, version, flags, count, meta length
+FLAG_BLOCKSIZES = 1
+FLAG_PAGES = 2
+DIGEST_SIZE = 20
+
+
+class DigestList(collections.abc.Sequence):
+    """
+    read-only list of hex digests backed by the packed binary digests,
+    a hex string is only created for the item accessed, so large
+    recipes are parsed without creating millions of strings
+    """
+
+    def __init__(self, data):
+        self._data = bytes(data)
+
+    def __len__(self):
+        return len(self._data) // DIGEST_SIZE
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[item] for item in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("digest index out of range")
+        return self._data[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE].hex()
+
+    def __iter__(self):
+        for offset in range(0, len(self._data), DIGEST_SIZE):
+            yield self._data[offset:offset + DIGEST_SIZE].hex()
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    @property
+    def binary(self):
+        """
+        packed binary digests
+        """
+        return self._data
+
+
+def _binary_digests(digests):
+    if isinstance(digests, DigestList):
+        return digests.binary
+    return b"".join(bytes.fromhex(digest) for digest in digests)
+
+def encode(recipe):
+    """
+    return recipe dict as binary
+    """
+    flags = 0
+    digests = recipe["blockchain"]
+    if "pages" in recipe:
+        if digests or "blocksizes" in recipe:
+            raise ValueError("paged recipe with blockchain or blocksizes")
+        flags |= FLAG_PAGES
+        digests = recipe["pages"]
+    if "blocksizes" in recipe:
+        flags |= FLAG_BLOCKSIZES
+    meta = json.dumps({key: value for key, value in recipe.items() if key not in ("blockchain", "blocksizes", "pages", "pagesizes")}).encode("utf-8")
+    parts = [HEADER.pack(MAGIC, VERSION, flags, len(digests), len(meta)), meta, _binary_digests(digests)]
+    if flags & FLAG_BLOCKSIZES:
+        parts.append(struct.pack(">%dI" % len(digests), *recipe["blocksizes"]))
+    if flags & FLAG_PAGES:
+        parts.append(struct.pack(">%dQ" % len(digests), *recipe["pagesizes"]))
+    return b"".join(parts)
+
+def decode(data):
+    """
+    return recipe dict of binary data, blockchain and pages as DigestList,
+    raise ValueError if malformed
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("recipe too short")
+    magic, version, flags, count, meta_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a binary recipe")
+    if version != VERSION:
+        raise ValueError("unknown recipe version %d" % version)
+    offset = HEADER.size + meta_length
+    expected = offset + count * DIGEST_SIZE + (count * 4 if flags & FLAG_BLOCKSIZES else 0) + (count * 8 if flags & FLAG_PAGES else 0)
+    if len(data) != expected:
+        raise ValueError("recipe has %d bytes, expected %d" % (len(data), expected))
+    recipe = json.loads(data[HEADER.size:offset].decode("utf-8"))
+    digests = DigestList(data[offset:offset + count * DIGEST_SIZE])
+    offset += count * DIGEST_SIZE
+    recipe["blockchain"] = DigestList(b"")
+    if flags & FLAG_PAGES:
+        recipe["pages"] = digests
+        recipe["pagesizes"] = list(struct.unpack_from(">%dQ" % count, data, offset))
+    else:
+        recipe["blockchain"] = digests
+    if flags & FLAG_BLOCKSIZES:
+        recipe["blocksizes"] = list(struct.unpack_from(">%dI" % count, data, offset))
+    return recipe
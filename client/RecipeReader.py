@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+seekable read-only file object over the data of one recipe
+"""
+import io
+import bisect
+import base64
+import logging
+import itertools
+import collections
+
+
+class RecipeReader(io.RawIOBase):
+    """
+    random access to the data of a file stored in FileStorage,
+    only the blocks touched by reads are downloaded
+
+    the offset of every block is derived from the block lengths of the
+    recipe, a position is mapped to its block by bisection, pages of
+    indirect recipes are mapped the same way and loaded only when touched
+
+    the last cache_blocks blocks fetched are kept, so small reads
+    next to each other cost only one request per block
+
+    wrap it in io.BufferedReader for efficient small reads or readline
+    """
+
+    def __init__(self, filestorage, recipe, cache_blocks=8, cache_pages=4):
+        """
+        filestorage ... <FileStorageClient> to get block lengths and blocks
+        recipe ... <dict> recipe of file to read
+        cache_blocks ... <int> number of blocks to keep in memory
+        cache_pages ... <int> number of pages of indirect recipes to keep in memory
+        """
+        super().__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._fs = filestorage
+        self._bs = filestorage.blockstorage
+        self.size = recipe["size"]
+        self._cache = collections.OrderedDict() # (page, index) : data, least recently used first
+        self._pages = collections.OrderedDict() # page : (blockchain, offsets), least recently used first
+        if "pages" in recipe: # indirect recipe, pages are loaded when touched
+            self._page_checksums = recipe["pages"]
+            self._page_offsets = list(itertools.accumulate([0] + recipe["pagesizes"]))
+        else: # whole recipe is one page
+            self._page_checksums = [None]
+            self._page_offsets = [0, self.size]
+            if "inline" in recipe: # tiny file, one block in recipe itself
+                self._pages[0] = ([None], self._page_offsets)
+                self._cache[(0, 0)] = base64.b64decode(recipe["inline"])
+            else:
+                self._pages[0] = (recipe["blockchain"], list(itertools.accumulate([0] + filestorage.block_lengths(recipe)))) # start of every block, last one is size
+        self._cache_blocks = max(cache_blocks, 1)
+        self._cache_pages = max(cache_pages, 1)
+        self._position = 0
+        self.fetched = 0 # number of blocks downloaded
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("invalid whence %s" % whence)
+        if position < 0:
+            raise ValueError("negative seek position %d" % position)
+        self._position = position
+        return position
+
+    def tell(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        return self._position
+
+    def readinto(self, buffer):
+        """
+        fill buffer with data from current position, across block
+        boundaries, return number of bytes read, 0 at end of file
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        with memoryview(buffer) as view, view.cast("B") as target:
+            done = 0
+            while done < len(target) and self._position < self.size:
+                page = bisect.bisect_right(self._page_offsets, self._position) - 1
+                blockchain, offsets = self._page(page)
+                index = bisect.bisect_right(offsets, self._position) - 1
+                data = self._block((page, index), blockchain[index], offsets[index + 1] - offsets[index])
+                start = self._position - offsets[index]
+                length = min(len(target) - done, len(data) - start)
+                target[done:done + length] = data[start:start + length]
+                done += length
+                self._position += length
+        return done
+
+    def readall(self):
+        """
+        read from current position to end of file at once
+        """
+        buffer = bytearray(max(self.size - self.tell(), 0))
+        length = self.readinto(buffer)
+        return bytes(buffer[:length])
+
+    def _page(self, page):
+        """
+        return blockchain and absolute offsets of blocks in page
+        """
+        value = self._pages.get(page)
+        if value is not None:
+            self._pages.move_to_end(page)
+            return value
+        entries = self._fs.get_page(self._page_checksums[page])
+        offsets = list(itertools.accumulate([self._page_offsets[page]] + [length for _, length in entries]))
+        if offsets[-1] != self._page_offsets[page + 1]:
+            raise IOError("page %s has %d bytes of data, recipe expects %d" % (self._page_checksums[page], offsets[-1] - offsets[0], self._page_offsets[page + 1] - self._page_offsets[page]))
+        value = ([checksum for checksum, _ in entries], offsets)
+        self._pages[page] = value
+        if len(self._pages) > self._cache_pages:
+            self._pages.popitem(last=False)
+        return value
+
+    def _block(self, key, checksum, length):
+        """
+        return data of block checksum, from cache if possible
+        """
+        data = self._cache.get(key)
+        if data is not None:
+            self._cache.move_to_end(key)
+            return data
+        data = self._bs.get(checksum)
+        self.fetched += 1
+        if len(data) != length:
+            raise IOError("block %s has length %d, recipe expects %d" % (checksum, len(data), length))
+        self._cache[key] = data
+        if len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+        return data
+
+    def close(self):
+        self._cache.clear()
+        super().close()
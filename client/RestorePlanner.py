@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+restore many files from FileStorage at once
+"""
+import os
+import base64
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import collections
+# own modules
+from webstorageClient.BlockPipeline import BlockPipeline
+
+
+class RestorePlanner(object):
+    """
+    restore many files with every unique block downloaded only once
+
+    all recipes are fetched first, in batches of batch_size, then a map of every block to its
+    occurrences in the files is built, the blocks are downloaded on
+    a pool of threads and written to every occurrence with os.pwrite
+
+    the files are created in their final size before, all-zero blocks
+    are not downloaded nor written, they stay holes in sparse files,
+    files without holes are preallocated with posix_fallocate
+
+    at most max_open files are kept open at once, metadata like mode,
+    times and ownership is left to the caller
+
+    files added with sync are updated in place, every block of the recipe
+    is compared with the local data by sha1 and only differing blocks
+    are downloaded, so resuming an interrupted restore is cheap,
+    files with more than one link are copied first, the other links
+    keep their data
+    """
+
+    batch_size = 1000 # recipes fetched with one request
+
+    def __init__(self, filestorage, threads=4, max_open=128):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._fs = filestorage
+        self._bs = filestorage.blockstorage
+        self._threads = threads
+        self._max_open = max_open
+        self._local = threading.local()
+        self._targets = [] # filename, checksum, offset, length, sync
+        self._fds = collections.OrderedDict() # filename : fd, least recently used first
+        self.blocks = 0 # number of blocks downloaded
+        self.writes = 0 # number of block occurrences written
+        self.unchanged = 0 # number of blocks already correct in synced files
+
+    def add(self, filename, checksum, offset=0, length=None, sync=False):
+        """
+        restore data of recipe checksum to filename,
+        or only length bytes starting at offset, like for packed files
+
+        sync ... keep existing file and write only blocks which differ, whole recipes only
+        """
+        if sync and (offset or length is not None):
+            raise ValueError("sync is only possible for whole recipes")
+        self._targets.append((filename, checksum, offset, length, sync))
+
+    def run(self):
+        """
+        restore all files added, return list of filenames restored
+        """
+        checksums = sorted({target[1] for target in self._targets})
+        batches = (checksums[start:start + self.batch_size] for start in range(0, len(checksums), self.batch_size))
+        recipes = {}
+        pipeline = BlockPipeline(self._get_recipes, self._threads)
+        try:
+            for _, result in pipeline.run(batches):
+                recipes.update(result)
+        finally:
+            pipeline.close()
+        missing = {checksum for checksum in checksums if recipes.get(checksum) is None}
+        for filename, checksum, _, _, _ in self._targets:
+            if checksum in missing:
+                self._logger.error("recipe %s of %s not found, skipping", checksum, filename)
+        self._targets = [target for target in self._targets if target[1] not in missing]
+        synced = [(filename, recipes[checksum]) for filename, checksum, offset, length, sync in self._targets if sync and os.path.isfile(filename)]
+        matching = {} # filename : set of block indices already correct
+        pipeline = BlockPipeline(self._matching_blocks, self._threads)
+        try:
+            for (filename, _), indices in pipeline.run(synced):
+                matching[filename] = indices
+                self.unchanged += len(indices)
+        finally:
+            pipeline.close()
+        blockmap = collections.OrderedDict() # checksum : list of (filename, file offset, start, end in block)
+        sizes = collections.OrderedDict() # filename : size
+        sparse = set()
+        inline = []
+        for filename, checksum, offset, length, sync in self._targets:
+            recipe = recipes[checksum]
+            if length is None:
+                length = recipe["size"] - offset
+            sizes[filename] = length
+            if "inline" in recipe:
+                inline.append((filename, base64.b64decode(recipe["inline"])[offset:offset + length]))
+                continue
+            keep = matching.get(filename, ())
+            position = 0 # of block in recipe data
+            for index, (block, blocklength) in enumerate(self._fs.blocks(recipe)):
+                start = max(offset, position)
+                end = min(offset + length, position + blocklength)
+                if start < end and index not in keep:
+                    if self._bs.zero_length(block) is None or filename in matching: # no holes in existing files
+                        blockmap.setdefault(block, []).append((filename, start - offset, start - position, end - position))
+                    else:
+                        sparse.add(filename)
+                position += blocklength
+                if position >= offset + length:
+                    break
+        self._logger.info("restoring %d files with %d unique blocks, %d blocks unchanged", len(sizes), len(blockmap), self.unchanged)
+        restored = [filename for filename, size in sizes.items() if self._create(filename, size, filename not in sparse, filename in matching)]
+        failed = set(sizes).difference(restored)
+        pipeline = BlockPipeline(self._get_block, self._threads)
+        try:
+            for filename, data in inline:
+                if filename not in failed:
+                    os.pwrite(self._fd(filename), data, 0)
+            for block, data in pipeline.run(iter(blockmap)):
+                self.blocks += 1
+                with memoryview(data) as view:
+                    for filename, file_offset, start, end in blockmap[block]:
+                        if filename not in failed:
+                            os.pwrite(self._fd(filename), view[start:end], file_offset)
+                            self.writes += 1
+        finally:
+            pipeline.close()
+            while self._fds:
+                os.close(self._fds.popitem(last=False)[1])
+        return restored
+
+    def _local_fs(self):
+        """
+        return clone of filestorage of current pool thread
+        """
+        if not hasattr(self._local, "fs"):
+            self._local.fs = self._fs.clone()
+        return self._local.fs
+
+    def _get_recipes(self, checksums):
+        """
+        runs on pool threads, every thread uses its own session,
+        return dict checksum : recipe, None if not found
+        """
+        return dict(self._local_fs().get_many(checksums, self.batch_size))
+
+    def _get_block(self, checksum):
+        """
+        runs on pool threads, every thread uses its own session
+        """
+        if not hasattr(self._local, "bs"):
+            self._local.bs = self._bs.clone()
+        return self._local.bs.get(checksum)
+
+    def _matching_blocks(self, target):
+        """
+        runs on pool threads, return set of indices of blocks in recipe,
+        which are already the same in the existing file
+        """
+        filename, recipe = target
+        indices = set()
+        if "inline" in recipe:
+            return indices
+        try:
+            with open(filename, "rb") as infile:
+                for index, (block, blocklength) in enumerate(self._local_fs().blocks(recipe)):
+                    data = infile.read(blocklength)
+                    if len(data) < blocklength:
+                        break
+                    if hashlib.sha1(data).hexdigest() == block:
+                        indices.add(index)
+        except OSError as exc:
+            self._logger.error("unable to read %s : %s", filename, exc)
+        return indices
+
+    def _create(self, filename, size, allocate, keep=False):
+        """
+        create empty file of size, existing files are replaced, not overwritten,
+        they could be hardlinked to some other file,
+        with keep an existing file is only truncated or extended to size,
+        a hardlinked one is replaced by a copy before
+        """
+        try:
+            if keep:
+                if os.stat(filename).st_nlink > 1:
+                    self._unlink_copy(filename)
+                fd = os.open(filename, os.O_WRONLY)
+                try:
+                    os.ftruncate(fd, size)
+                finally:
+                    os.close(fd)
+                return True
+            if os.path.lexists(filename):
+                os.unlink(filename)
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                os.ftruncate(fd, size)
+                if allocate and size and hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except OSError as exc: # not supported by every filesystem
+                        self._logger.debug("posix_fallocate %s : %s", filename, exc)
+            finally:
+                os.close(fd)
+            return True
+        except OSError as exc:
+            self._logger.error("unable to create %s : %s", filename, exc)
+            return False
+
+    def _unlink_copy(self, filename):
+        """
+        replace filename by a copy of itself, to write to it in place
+        without changing the data of other hardlinks
+        """
+        fd, tmpname = tempfile.mkstemp(prefix=".%s." % os.path.basename(filename), dir=os.path.dirname(filename))
+        try:
+            with os.fdopen(fd, "wb") as outfile, open(filename, "rb") as infile:
+                shutil.copyfileobj(infile, outfile, 1024 * 1024)
+            shutil.copymode(filename, tmpname)
+            os.replace(tmpname, filename)
+        except OSError:
+            os.unlink(tmpname)
+            raise
+        self._logger.debug("unlinked %s from its other links", filename)
+
+    def _fd(self, filename):
+        """
+        return file descriptor of filename, opened for writing
+        """
+        fd = self._fds.get(filename)
+        if fd is not None:
+            self._fds.move_to_end(filename)
+            return fd
+        if len(self._fds) >= self._max_open:
+            os.close(self._fds.popitem(last=False)[1])
+        fd = os.open(filename, os.O_WRONLY)
+        self._fds[filename] = fd
+        return fd
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+pack many small files into shared packs, to save round trips per file
+"""
+import io
+import dbm
+import json
+import hashlib
+import logging
+import threading
+
+
+class SmallFilePacker(object):
+    """
+    concatenate the data of small files to packs of up to blocksize,
+    every pack is stored like any other file in FileStorage,
+    a small file is identified by pack checksum, offset and length
+
+    a local index maps the sha1 of the data of every packed file to
+    its location, so identical small files are only packed once,
+    also across backupsets
+
+    add could be called from many threads, the packs are stored
+    with a clone of filestorage, one at a time
+    """
+
+    mime_type = "application/x-webstorage-pack"
+
+    def __init__(self, filestorage, index_filename, max_size=4096):
+        """
+        filestorage ... <FileStorageClient> to store packs
+        index_filename ... <str> dbm file of the local index
+        max_size ... <int> files up to this size are packed
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._fs = filestorage.clone()
+        self.pack_size = filestorage.blockstorage.blocksize
+        if not 0 < max_size <= self.pack_size:
+            raise ValueError("max_size has to be between 1 and blocksize %d" % self.pack_size)
+        self.max_size = max_size
+        self._index = dbm.open(index_filename, "c")
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._pending = {} # checksum : (offset, length) in buffer
+        self._packs = set() # packs known to exist
+        self.packs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, data):
+        """
+        add data of some small file to the current pack,
+        return sha1 checksum of data and True if data was not packed already
+        """
+        checksum = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            if checksum in self._pending or self._lookup(checksum) is not None:
+                return checksum, False
+            if len(self._buffer) + len(data) > self.pack_size:
+                self._flush()
+            self._pending[checksum] = (len(self._buffer), len(data))
+            self._buffer += data
+        return checksum, True
+
+    def location(self, checksum):
+        """
+        return pack checksum, offset, length of packed data, or None if unknown,
+        data added after the last flush is not located yet
+        """
+        with self._lock:
+            return self._lookup(checksum)
+
+    def _lookup(self, checksum):
+        value = self._index.get(checksum)
+        if value is None:
+            return None
+        pack, offset, length = json.loads(value.decode("ascii"))
+        if pack not in self._packs:
+            if not self._fs.exists(pack):
+                self._logger.info("pack %s is missing, packing %s again", pack, checksum)
+                del self._index[checksum]
+                return None
+            self._packs.add(pack)
+        return [pack, offset, length]
+
+    def flush(self):
+        """
+        store current pack, even if not full
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        metadata = self._fs.put(io.BytesIO(bytes(self._buffer)), self.mime_type)
+        pack = metadata["checksum"]
+        self._logger.debug("stored pack %s with %d files, %d bytes", pack, len(self._pending), len(self._buffer))
+        self._packs.add(pack)
+        for checksum, (offset, length) in self._pending.items():
+            self._index[checksum] = json.dumps((pack, offset, length))
+        self._buffer = bytearray()
+        self._pending = {}
+        self.packs += 1
+
+    def close(self):
+        """
+        store last pack and close index
+        """
+        with self._lock:
+            if self._index is not None:
+                self._flush()
+                self._index.close()
+                self._index = None
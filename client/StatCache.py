@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+persistent local cache of file identity to checksum of file content
+"""
+import dbm
+import json
+import time
+import logging
+import threading
+
+
+class StatCache(object):
+    """
+    remember the checksum of files, keyed by (st_dev, st_ino)
+    an entry is only valid if size, mtime and ctime are still the same,
+    ctime changes on every write and could not be set by utime,
+    so a changed file is never taken for the old one
+
+    files modified within the last racy_seconds are not cached,
+    they could be modified again within the same timestamp granularity
+
+    dbm is not thread safe, so every access is serialized
+    """
+
+    def __init__(self, filename, racy_seconds=2):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._logger.info("using stat cache %s", filename)
+        self._db = dbm.open(filename, "c")
+        self._racy_ns = racy_seconds * 1000000000
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _key(stats):
+        return "%d:%d" % (stats.st_dev, stats.st_ino)
+
+    def get(self, stats):
+        """
+        return checksum of file with stats, or None if unknown or changed
+        """
+        key = self._key(stats)
+        with self._lock:
+            value = self._db.get(key)
+            if value is not None:
+                st_size, st_mtime_ns, st_ctime_ns, checksum = json.loads(value.decode("ascii"))
+                if (st_size, st_mtime_ns, st_ctime_ns) == (stats.st_size, stats.st_mtime_ns, stats.st_ctime_ns):
+                    self.hits += 1
+                    return checksum
+                del self._db[key] # stale, inode reused or file changed
+            self.misses += 1
+        return None
+
+    def put(self, stats, checksum):
+        """
+        remember checksum of file with stats
+        """
+        if max(stats.st_mtime_ns, stats.st_ctime_ns) > time.time_ns() - self._racy_ns:
+            return
+        with self._lock:
+            self._db[self._key(stats)] = json.dumps((stats.st_size, stats.st_mtime_ns, stats.st_ctime_ns, checksum))
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+import time
+import random
+import threading
+import unittest
+from BlockPipeline import BlockPipeline
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def put(self, data, fail_on=None):
+        with self.lock:
+            self.calls.append(data)
+        time.sleep(random.random() / 100) # finish out of order
+        if data == fail_on:
+            raise IOError("put of block %d failed" % data)
+        return data * 2
+
+    def test_order(self):
+        pipeline = BlockPipeline(self.put, threads=4)
+        try:
+            results = list(pipeline.run(range(50)))
+            self.assertEqual(results, [(data, data * 2) for data in range(50)])
+            self.assertEqual(list(pipeline.run(range(3))), [(0, 0), (1, 2), (2, 4)]) # pool is reused
+        finally:
+            pipeline.close()
+
+    def test_window(self):
+        pipeline = BlockPipeline(self.put, threads=2, window=3)
+        try:
+            for data, _ in pipeline.run(range(20)):
+                with self.lock:
+                    self.assertLessEqual(len(self.calls), data + 1 + 3) # at most window blocks ahead
+        finally:
+            pipeline.close()
+
+    def test_error(self):
+        pipeline = BlockPipeline(self.put, threads=2)
+        try:
+            results = []
+            with self.assertRaises(IOError):
+                for result in pipeline.run(range(100), fail_on=10):
+                    results.append(result)
+            self.assertEqual(results, [(data, data * 2) for data in range(10)]) # every block before the failed one
+            time.sleep(0.1)
+            self.assertLess(len(self.calls), 10 + 1 + 4 + 1) # pending blocks are cancelled
+            self.assertEqual(list(pipeline.run(range(3))), [(0, 0), (1, 2), (2, 4)]) # still usable
+        finally:
+            pipeline.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+import io
+import random
+import tempfile
+import unittest
+import Chunker
+
+
+def random_data(size, seed=0):
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "big") if size else b""
+
+
+class TestFixed(unittest.TestCase):
+
+    def test_lengths(self):
+        chunker = Chunker.FixedChunker(1000)
+        for size in (0, 1, 999, 1000, 1001, 5500):
+            data = random_data(size)
+            blocks = [bytes(block) for block in chunker.chunks(io.BytesIO(data))]
+            self.assertEqual(b"".join(blocks), data)
+            self.assertTrue(all(len(block) == 1000 for block in blocks[:-1]))
+            self.assertEqual(len(blocks), (size + 999) // 1000)
+
+    def test_read_paths_equal(self):
+        data = random_data(10500)
+        expected = [data[offset:offset + 1000] for offset in range(0, len(data), 1000)]
+        for readahead, buffers in ((1, 0), (1, 2), (4, 2), (3, 4)):
+            chunker = Chunker.FixedChunker(1000, readahead, buffers)
+            # copy every block before the next one, the ring reuses its buffers
+            self.assertEqual([bytes(block) for block in chunker.chunks(io.BytesIO(data))], expected)
+        with tempfile.TemporaryFile() as tmp:
+            tmp.write(data)
+            tmp.seek(0)
+            self.assertEqual([bytes(block) for block in Chunker.FixedChunker(1000, use_mmap=True).chunks(tmp)], expected)
+
+    def test_ring_keeps_blocks_in_flight(self):
+        data = random_data(8000)
+        chunker = Chunker.FixedChunker(1000, readahead=2, buffers=2)
+        blocks = []
+        for block in chunker.chunks(io.BytesIO(data)):
+            blocks.append(block)
+            # blocks of the last readahead * (buffers - 1) reads are still valid
+            for back, previous in enumerate(reversed(blocks[-3:])):
+                index = len(blocks) - 1 - back
+                self.assertEqual(bytes(previous), data[index * 1000:(index + 1) * 1000])
+
+
+class TestGear(unittest.TestCase):
+
+    def test_python_and_numpy_cut_equal(self):
+        if Chunker.numpy is None:
+            self.skipTest("numpy not installed")
+        for max_size in (4096, 65536):
+            chunker = Chunker.GearChunker(max_size)
+            for size in (0, 1, chunker.min_size, chunker.min_size + 1, chunker.avg_size, 3 * max_size + 17, 20 * max_size):
+                for buf in (bytearray(random_data(size, size)), bytearray(size), bytearray(b"abc" * size)):
+                    start = 0
+                    while start < len(buf):
+                        end = min(len(buf), start + max_size)
+                        length = chunker._cut_numpy(buf, start, end)
+                        self.assertEqual(length, chunker._cut_python(buf, start, end), "size %d start %d" % (len(buf), start))
+                        start += length
+
+    def test_lengths(self):
+        chunker = Chunker.GearChunker(65536)
+        data = random_data(2000000)
+        blocks = list(chunker.chunks(io.BytesIO(data)))
+        self.assertEqual(b"".join(blocks), data)
+        self.assertTrue(all(chunker.min_size < len(block) <= chunker.max_size for block in blocks[:-1]))
+        average = len(data) / len(blocks)
+        self.assertTrue(chunker.avg_size / 2 < average < chunker.avg_size * 2, average)
+
+    def test_insert_changes_only_nearby_blocks(self):
+        chunker = Chunker.GearChunker(65536)
+        data = random_data(1000000)
+        changed = data[:500000] + b"inserted" + data[500000:]
+        blocks = list(chunker.chunks(io.BytesIO(data)))
+        changed_blocks = list(chunker.chunks(io.BytesIO(changed)))
+        self.assertTrue(len(set(blocks) - set(changed_blocks)) <= 2)
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            Chunker.GearChunker(1024, 512, 16) # min_size below window
+        with self.assertRaises(ValueError):
+            Chunker.GearChunker(1024, 1024)
+
+    def test_get_chunker(self):
+        self.assertEqual(Chunker.get_chunker("fixed", 1024).recipe_info, {"method" : "fixed", "blocksize" : 1024})
+        self.assertEqual(Chunker.get_chunker("gear", 1024 * 1024).recipe_info["max_size"], 1024 * 1024)
+        with self.assertRaises(ValueError):
+            Chunker.get_chunker("other", 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+import os
+import random
+import tempfile
+import unittest
+import ExcludeMatcher
+
+
+class TestAhoCorasick(unittest.TestCase):
+
+    def test_fuzz_against_substring_search(self):
+        rnd = random.Random(42)
+        for _ in range(500):
+            patterns = ["".join(rnd.choice("ab/c") for _ in range(rnd.randint(1, 5))) for _ in range(rnd.randint(1, 8))]
+            automaton = ExcludeMatcher.AhoCorasick(patterns)
+            for _ in range(50):
+                string = "".join(rnd.choice("ab/cd") for _ in range(rnd.randint(0, 20)))
+                self.assertEqual(automaton.search(string), any(pattern in string for pattern in patterns), (patterns, string))
+
+    def test_overlapping_patterns(self):
+        automaton = ExcludeMatcher.AhoCorasick(["he", "she", "his", "hers"])
+        self.assertTrue(automaton.search("ushers"))
+        self.assertTrue(automaton.search("ahis"))
+        self.assertFalse(automaton.search("hhs"))
+        self.assertTrue(ExcludeMatcher.AhoCorasick(["abcd", "bc"]).search("abce")) # suffix of a partial match
+
+    def test_empty_pattern(self):
+        self.assertTrue(ExcludeMatcher.AhoCorasick([""]).search("anything"))
+        self.assertFalse(ExcludeMatcher.AhoCorasick([]).search("anything"))
+
+
+class TestExcludeMatcher(unittest.TestCase):
+
+    def test_substring(self):
+        matcher = ExcludeMatcher.ExcludeMatcher(["/.cache/", ".tmp"])
+        self.assertTrue(matcher("/home/user/.cache/x"))
+        self.assertTrue(matcher("/home/user/file.tmp"))
+        self.assertFalse(matcher("/home/user/file.txt"))
+
+    def test_glob(self):
+        matcher = ExcludeMatcher.ExcludeMatcher(["*.o", "/var/lo?/", "build/**/out", "x?[0-9]"])
+        self.assertTrue(matcher("/src/main.o"))
+        self.assertFalse(matcher("/src/main.o/file")) # * does not match /
+        self.assertTrue(matcher("/var/log/syslog"))
+        self.assertFalse(matcher("/srv/var/log/syslog")) # anchored at start
+        self.assertTrue(matcher("/src/build/a/b/out"))
+        self.assertTrue(matcher("/data/xa1"))
+        self.assertFalse(matcher("/data/xa"))
+        self.assertFalse(matcher("/data/axa1")) # starts at path component
+
+    def test_regex_and_includes(self):
+        matcher = ExcludeMatcher.ExcludeMatcher(["re:\\.log$", "/var/"], ["/var/keep/"])
+        self.assertTrue(matcher("/srv/app.log"))
+        self.assertTrue(matcher("/var/lib/x"))
+        self.assertFalse(matcher("/var/keep/x"))
+        self.assertFalse(matcher.prune("/var")) # includes could match below
+
+    def test_prune(self):
+        matcher = ExcludeMatcher.ExcludeMatcher(["/proc/", "node_modules", "*.o", "re:/tmp/"])
+        self.assertTrue(matcher.prune("/proc"))
+        self.assertTrue(matcher.prune("/src/node_modules/"))
+        self.assertFalse(matcher.prune("/src"))
+        self.assertFalse(matcher.prune("/src/dir.o")) # file glob, directory is walked
+        self.assertFalse(matcher.prune("/tmp")) # regexes are not prefix safe
+
+    def test_prune_fuzz(self):
+        # every path below a pruned directory has to be excluded
+        rnd = random.Random(7)
+        names = ["a", "b", "ab", "x.o", "cache"]
+        for _ in range(200):
+            patterns = [rnd.choice(["/a/", "ab", "*.o", "/b/**/", "cache/", "b/a", "a?/"]) for _ in range(rnd.randint(1, 3))]
+            matcher = ExcludeMatcher.ExcludeMatcher(patterns)
+            for _ in range(20):
+                dirname = "/" + "/".join(rnd.choice(names) for _ in range(rnd.randint(1, 3)))
+                if matcher.prune(dirname):
+                    below = dirname + "/" + "/".join(rnd.choice(names) for _ in range(rnd.randint(1, 3)))
+                    self.assertTrue(matcher(below), (patterns, dirname, below))
+
+    def test_from_file(self):
+        with tempfile.NamedTemporaryFile("wt", suffix=".txt", delete=False) as outfile:
+            outfile.write("# comment\n\n- *.o\n+ keep.o\n")
+        try:
+            matcher = ExcludeMatcher.ExcludeMatcher.from_file(outfile.name)
+        finally:
+            os.unlink(outfile.name)
+        self.assertTrue(matcher("/src/main.o"))
+        self.assertFalse(matcher("/src/keep.o"))
+
+
+if __name__ == "__main__":
+    unittest.main()
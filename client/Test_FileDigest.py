@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+import os
+import hashlib
+import unittest
+from FileStorageClient import FileDigest
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = [os.urandom(1000), os.urandom(1000), os.urandom(17)]
+        self.data = b"".join(self.blocks)
+
+    def test_sha1(self):
+        digest = FileDigest("sha1")
+        for block in self.blocks:
+            digest.update(block)
+        self.assertEqual(digest.hexdigest(), hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(digest.size, len(self.data))
+        self.assertEqual(FileDigest().hexdigest(), hashlib.sha1(b"").hexdigest())
+
+    def test_blocklist(self):
+        expected = hashlib.sha1(b"".join(hashlib.sha1(block).digest() for block in self.blocks) + len(self.data).to_bytes(8, "big")).hexdigest()
+        by_data = FileDigest("blocklist")
+        by_checksum = FileDigest("blocklist")
+        by_block = FileDigest("blocklist")
+        for block in self.blocks:
+            checksum = hashlib.sha1(block).hexdigest()
+            by_data.update(block)
+            by_checksum.update(block, checksum)
+            by_block.update_block(checksum, len(block))
+        for digest in (by_data, by_checksum, by_block):
+            self.assertEqual(digest.hexdigest(), expected)
+        # hexdigest does not finish the running digest
+        by_data.update(b"more")
+        self.assertNotEqual(by_data.hexdigest(), expected)
+
+    def test_blocklist_depends_on_cut(self):
+        one = FileDigest("blocklist")
+        one.update(self.data)
+        two = FileDigest("blocklist")
+        for block in self.blocks:
+            two.update(block)
+        self.assertNotEqual(one.hexdigest(), two.hexdigest())
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            FileDigest("md5")
+        with self.assertRaises(ValueError):
+            FileDigest("sha1").update_block("0" * 40, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
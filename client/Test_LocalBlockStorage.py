@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+import os
+import zlib
+import hashlib
+import unittest
+from BlockStorageClient import BlockStorageClient, is_zero
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_no_cache(self):
+        cachefile = os.path.join(self.backend.homepath, "bs-test.bin")
+        data = os.urandom(4096)
+        self.assertEqual(BlockStorageClient().put(data), (hashlib.sha1(data).hexdigest(), 200))
+        self.assertEqual(BlockStorageClient().checksums, {hashlib.sha1(data).hexdigest()})
+        self.assertTrue(os.path.isfile(cachefile))
+        os.unlink(cachefile)
+        blockstorage = BlockStorageClient(cache=False)
+        self.assertFalse(os.path.isfile(cachefile)) # not synced
+        self.assertEqual(blockstorage.checksums, set())
+        self.assertTrue(blockstorage.exists(hashlib.sha1(data).hexdigest())) # asked backend
+        self.assertEqual(blockstorage.put(data, use_cache=True), (hashlib.sha1(data).hexdigest(), 201))
+        self.assertEqual(blockstorage.put(data, use_cache=True), (hashlib.sha1(data).hexdigest(), 202)) # put by this client
+        self.assertEqual(self.backend.blockstorage.bc.last()["epoch"], 2)
+
+    def test_compressed_round_trip(self):
+        self.backend.blockstorage.app.config["compression"] = {"codecs" : ["zlib", "lzma"], "min_saving" : 0.1}
+        blocks = [b"".join(b"line %d of some text\n" % index for index in range(200))[:4096], os.urandom(4096), os.urandom(100) * 10]
+        blockstorage = BlockStorageClient()
+        for data in blocks:
+            self.assertEqual(blockstorage.put(data), (hashlib.sha1(data).hexdigest(), 200))
+        for data in blocks:
+            self.assertEqual(blockstorage.get_verify(hashlib.sha1(data).hexdigest()), data)
+        self.assertEqual(blockstorage.info["compression"], ["zlib", "lzma"])
+
+    def test_wire_compression(self):
+        module = self.backend.blockstorage
+        text = b"".join(b"line %d of some text\n" % index for index in range(200))[:4096]
+        encodings = []
+        put_checksum = module.app.view_functions["put_checksum"]
+        module.app.view_functions["put_checksum"] = lambda checksum: encodings.append(module.request.headers.get("content-encoding")) or put_checksum(checksum)
+        try:
+            blockstorage = BlockStorageClient(compress=True)
+            for _ in range(6): # incompressible type, compressed only while probing
+                blockstorage.put(os.urandom(4096), hint=".jpg")
+            self.assertEqual(encodings, [None] * 6)
+            self.assertFalse(blockstorage._advisor.wanted(".jpg"))
+            blockstorage.put(text, hint=".txt")
+            self.assertEqual(encodings[-1], "deflate")
+            self.assertTrue(os.path.isfile(module._get_filename(hashlib.sha1(text).hexdigest()))) # inflated by server
+            module.app.config["compression"] = {"codecs" : ["zlib"], "min_saving" : 0.1}
+            text = text[1:] + text[:1]
+            blockstorage.put(text, hint=".txt")
+            with open(module._get_filename(hashlib.sha1(text).hexdigest(), "deflate"), "rb") as infile:
+                self.assertEqual(infile.read(), zlib.compress(text, 1)) # stored as received
+        finally:
+            module.app.view_functions["put_checksum"] = put_checksum
+        self.assertEqual(blockstorage.get_verify(hashlib.sha1(text).hexdigest()), text)
+
+    def test_zero_blocks(self):
+        self.assertTrue(is_zero(bytes(4096)) and is_zero(bytearray(5)) and is_zero(memoryview(bytes(2 * 1024 * 1024))) and is_zero(b""))
+        self.assertFalse(is_zero(bytes(4095) + b"\x01") or is_zero(memoryview(bytes(2 * 1024 * 1024) + b"\x01")))
+        app = self.backend.blockstorage.app
+        get_checksum = app.view_functions["get_checksum"]
+        gets = []
+        app.view_functions["get_checksum"] = lambda checksum: gets.append(checksum) or get_checksum(checksum)
+        try:
+            blockstorage = BlockStorageClient()
+            for length in (4096, 100, 4096):
+                checksum, _ = blockstorage.put(bytearray(length), use_cache=True)
+                self.assertEqual(checksum, hashlib.sha1(bytes(length)).hexdigest())
+                self.assertEqual(blockstorage.zero_length(checksum), length)
+                self.assertEqual(blockstorage.get_verify(checksum), bytes(length))
+            self.assertIsNone(blockstorage.zero_length(hashlib.sha1(b"x").hexdigest()))
+            self.assertEqual(BlockStorageClient().get(hashlib.sha1(bytes(4096)).hexdigest()), bytes(4096)) # known to every client
+        finally:
+            app.view_functions["get_checksum"] = get_checksum
+        self.assertEqual(gets, []) # never transfered
+        self.assertEqual(self.backend.blockstorage.bc.last()["epoch"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
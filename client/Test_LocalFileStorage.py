@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+import io
+import os
+import time
+import random
+import hashlib
+import itertools
+import tempfile
+import unittest
+from FileStorageClient import FileStorageClient
+from RecipeReader import RecipeReader
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+
+    def tearDown(self):
+        self.backend.close()
+
+    def read(self, filestorage, checksum):
+        return b"".join(bytes(data) for data in filestorage.read(checksum))
+
+    def test_repeated_blocks_on_threads(self):
+        filestorage = FileStorageClient(threads=4)
+        blocks = [os.urandom(4096), os.urandom(4096), bytes(4096)]
+        data = b"".join(blocks[index % 3] for index in range(60)) + bytes(10000)
+        app = self.backend.blockstorage.app
+        put_checksum = app.view_functions["put_checksum"]
+        puts = []
+        app.view_functions["put_checksum"] = lambda checksum: puts.append(checksum) or put_checksum(checksum)
+        try:
+            metadata = filestorage.put(io.BytesIO(data))
+        finally:
+            app.view_functions["put_checksum"] = put_checksum
+            filestorage.close()
+        self.assertEqual(self.read(filestorage, metadata["checksum"]), data)
+        self.assertEqual(len(metadata["blockchain"]), 63)
+        self.assertEqual(sorted(puts), sorted(set(puts))) # every block sent once
+        self.assertEqual(len(puts), 4) # 3 blocks and the short zero block at the end
+        self.assertEqual(metadata["blockhash_exists"], 59)
+        self.assertEqual(self.backend.blockstorage.bc.last()["epoch"], 1 + 4) # no second epoch
+
+    def test_zero_copy_paths(self):
+        data = os.urandom(100000)
+        with tempfile.TemporaryFile() as tmp:
+            tmp.write(data)
+            for threads, use_mmap in ((1, False), (3, False), (1, True), (3, True)):
+                tmp.seek(0)
+                filestorage = FileStorageClient(threads=threads, use_mmap=use_mmap)
+                try:
+                    metadata = filestorage.put(tmp) # memoryviews of ring buffers or mapping sent
+                finally:
+                    filestorage.close()
+                self.assertEqual(metadata["checksum"], hashlib.sha1(data).hexdigest())
+                self.assertEqual(self.read(filestorage, metadata["checksum"]), data)
+                self.assertEqual(metadata["blockchain"], [hashlib.sha1(data[offset:offset + 4096]).hexdigest() for offset in range(0, len(data), 4096)])
+
+    def append(self, filestorage, old, data):
+        """
+        put_append data to recipe of old, return metadata and True if whole file was read with put
+        """
+        put = filestorage.put
+        puts = []
+        filestorage.put = lambda *args: puts.append(args) or put(*args)
+        try:
+            metadata = filestorage.put_append(io.BytesIO(data), old)
+        finally:
+            del filestorage.put
+        return metadata, len(puts) == 1
+
+    def test_put_append(self):
+        filestorage = FileStorageClient(identity="blocklist")
+        data = os.urandom(10 * 4096 + 100)
+        appended = data + os.urandom(5000)
+        old = filestorage.put(io.BytesIO(data))["checksum"]
+        metadata, whole = self.append(filestorage, old, appended)
+        self.assertFalse(whole)
+        self.assertEqual(self.read(filestorage, metadata["checksum"]), appended)
+        self.assertEqual(metadata["identity"], "blocklist")
+        self.assertEqual(metadata["blockhash_exists"], 10) # reused, not read again
+        self.assertEqual(metadata["size"], len(appended))
+        self.assertEqual(metadata["checksum"], FileStorageClient(identity="blocklist").put(io.BytesIO(appended))["checksum"]) # same as whole file
+        # with identity sha1 the whole file is read
+        filestorage = FileStorageClient()
+        old = filestorage.put(io.BytesIO(data))["checksum"]
+        metadata, whole = self.append(filestorage, old, appended)
+        self.assertTrue(whole)
+        self.assertEqual(metadata["identity"], "sha1")
+        self.assertEqual(metadata["checksum"], hashlib.sha1(appended).hexdigest())
+
+    def test_put_append_mismatch(self):
+        filestorage = FileStorageClient(identity="blocklist")
+        data = os.urandom(10 * 4096 + 100)
+        old = filestorage.put(io.BytesIO(data))["checksum"]
+        changed = data[:9 * 4096] + os.urandom(4096) + data[10 * 4096:] + os.urandom(5000) # last complete block
+        metadata, whole = self.append(filestorage, old, changed)
+        self.assertTrue(whole)
+        self.assertEqual(self.read(filestorage, metadata["checksum"]), changed)
+        changed = data[:8 * 4096] + os.urandom(4096) + data[9 * 4096:] + os.urandom(5000)
+        metadata, whole = self.append(filestorage, old, changed)
+        self.assertFalse(whole) # not detected, the documented limit
+        self.assertEqual(self.read(filestorage, metadata["checksum"]), data[:10 * 4096] + changed[10 * 4096:])
+
+    def test_put_append_fallback(self):
+        data = os.urandom(10 * 4096)
+        inline = FileStorageClient(inline_size=100, identity="blocklist").put(io.BytesIO(data[:50]))["checksum"]
+        self.assertIn("inline", FileStorageClient().get(inline))
+        cases = (
+            (FileStorageClient(identity="blocklist"), hashlib.sha1(b"unknown").hexdigest()),
+            (FileStorageClient(identity="blocklist"), inline),
+            (FileStorageClient(identity="blocklist"), FileStorageClient(identity="blocklist").put(io.BytesIO(data[:4000]))["checksum"]), # one block only
+            (FileStorageClient(identity="blocklist", chunking="gear"), FileStorageClient(identity="blocklist").put(io.BytesIO(data[:-5000]))["checksum"]),
+        )
+        for filestorage, old in cases:
+            metadata, whole = self.append(filestorage, old, data)
+            self.assertTrue(whole)
+            self.assertEqual(self.read(filestorage, metadata["checksum"]), data)
+
+    def test_inline(self):
+        filestorage = FileStorageClient(inline_size=100)
+        for data in (b"", b"x", os.urandom(100)):
+            metadata = filestorage.put(io.BytesIO(data))
+            recipe = filestorage.get(metadata["checksum"])
+            self.assertEqual((recipe["version"], recipe["identity"], recipe["blockchain"], recipe["size"]), (2, "sha1", [], len(data)))
+            self.assertEqual(self.read(filestorage, metadata["checksum"]), data)
+            self.assertEqual(RecipeReader(filestorage, recipe).read(), data)
+        self.assertEqual(self.backend.blockstorage.bc.last()["epoch"], 1) # no block stored
+        metadata = filestorage.put(io.BytesIO(os.urandom(101)))
+        self.assertNotIn("inline", filestorage.get(metadata["checksum"]))
+        self.assertEqual(len(metadata["blockchain"]), 1)
+
+    def test_read_parallel(self):
+        filestorage = FileStorageClient(identity="blocklist")
+        data = os.urandom(50 * 4096) + bytes(3 * 4096) + os.urandom(100)
+        checksum = filestorage.put(io.BytesIO(data))["checksum"]
+        app = self.backend.blockstorage.app
+        get_checksum = app.view_functions["get_checksum"]
+        app.view_functions["get_checksum"] = lambda checksum: time.sleep(random.random() / 100) or get_checksum(checksum) # complete out of order
+        try:
+            for threads in (1, 4):
+                blocks = [bytes(block) for block in filestorage.read(checksum, threads=threads)]
+                self.assertEqual(b"".join(blocks), data)
+                self.assertEqual([len(block) for block in blocks], [4096] * 53 + [100])
+        finally:
+            app.view_functions["get_checksum"] = get_checksum
+
+    def test_bulk(self):
+        for recipe_store in ("sqlite", "files"):
+            self.backend.close()
+            self.backend = LocalBackend(recipe_store=recipe_store)
+            filestorage = FileStorageClient()
+            recipes = [filestorage.put(io.BytesIO(os.urandom(5000))) for _ in range(5)]
+            checksums = [recipe["checksum"] for recipe in recipes]
+            missing = hashlib.sha1(b"missing").hexdigest()
+            results = list(filestorage.get_many(checksums[::-1] + [missing], batch_size=2))
+            self.assertEqual([checksum for checksum, _ in results], checksums[::-1] + [missing])
+            self.assertEqual([recipe["blockchain"] for _, recipe in results[:-1]], [recipe["blockchain"] for recipe in recipes[::-1]])
+            self.assertIsNone(results[-1][1])
+            # known ones are not sent again, a new client has them in its cache
+            recipes = [dict(recipe) for recipe in recipes]
+            new = dict(recipes[0], blockchain=recipes[0]["blockchain"] + recipes[1]["blockchain"], size=10000, checksum=None)
+            new["checksum"] = hashlib.sha1(b"".join(self.read(filestorage, checksum) for checksum in checksums[:2])).hexdigest()
+            stored = FileStorageClient().put_many(recipes[1:] + [new], batch_size=2)
+            self.assertEqual([metadata["filehash_exists"] for metadata in stored], [True] * 4 + [False])
+            self.assertEqual(self.read(filestorage, new["checksum"]), b"".join(self.read(filestorage, checksum) for checksum in checksums[:2]))
+            self.assertEqual(self.backend.filestorage.bc.last()["epoch"], 1 + 6)
+
+    def test_bulk_stream_ends_early(self):
+        filestorage = FileStorageClient()
+        checksums = [filestorage.put(io.BytesIO(os.urandom(5000)))["checksum"] for _ in range(3)]
+        app = self.backend.filestorage.app
+        get_many = app.view_functions["get_many"]
+        def get_two():
+            response = get_many()
+            response.response = itertools.islice(response.response, 2)
+            return response
+        app.view_functions["get_many"] = get_two
+        try:
+            results = list(filestorage.get_many(checksums))
+        finally:
+            app.view_functions["get_many"] = get_many
+        self.assertEqual([checksum for checksum, _ in results], checksums)
+        self.assertEqual([recipe is None for _, recipe in results], [False, False, True])
+
+    def test_stale_cache(self):
+        first = FileStorageClient()
+        second = FileStorageClient() # synced before first stores anything
+        data = os.urandom(10000)
+        self.assertFalse(first.put(io.BytesIO(data))["filehash_exists"])
+        self.assertFalse(second.exists(hashlib.sha1(data).hexdigest())) # answered locally
+        metadata = second.put(io.BytesIO(data)) # 201 from backend
+        self.assertTrue(metadata["filehash_exists"])
+        self.assertTrue(second.exists(metadata["checksum"]))
+        self.assertEqual(self.backend.filestorage.bc.last()["epoch"], 2)
+
+    def test_cache_resync(self):
+        cachefile = os.path.join(self.backend.homepath, "fs-test.bin")
+        checksums = [FileStorageClient().put(io.BytesIO(os.urandom(100)))["checksum"] for _ in range(3)]
+        self.assertEqual(FileStorageClient().checksums, set(checksums))
+        self.assertEqual(os.stat(cachefile).st_size, 3 * 20)
+        # only epochs added since are appended
+        checksums.append(FileStorageClient().put(io.BytesIO(os.urandom(100)))["checksum"])
+        with open(cachefile, "rb") as infile:
+            cached = infile.read()
+        self.assertEqual(FileStorageClient().checksums, set(checksums))
+        with open(cachefile, "rb") as infile:
+            self.assertEqual(infile.read()[:60], cached[:60])
+        # cachefile not matching the blockchain is fetched again
+        with open(cachefile, "r+b") as outfile:
+            outfile.write(bytes(20))
+        self.assertEqual(FileStorageClient().checksums, set(checksums))
+        with open(cachefile, "rb") as infile:
+            self.assertEqual([infile.read(20).hex() for _ in range(4)], checksums)
+        # as well as a cachefile longer than the blockchain or of odd size
+        for data in (bytes(5 * 20), bytes(21)):
+            with open(cachefile, "wb") as outfile:
+                outfile.write(data)
+            self.assertEqual(FileStorageClient().checksums, set(checksums))
+            self.assertEqual(os.stat(cachefile).st_size, 4 * 20)
+
+    def test_no_cache(self):
+        FileStorageClient().put(io.BytesIO(b"some data"))
+        filestorage = FileStorageClient(cache=False)
+        self.assertEqual(filestorage.checksums, set())
+        self.assertTrue(filestorage.exists(hashlib.sha1(b"some data").hexdigest())) # asked backend
+        self.assertFalse(filestorage.exists(hashlib.sha1(b"other data").hexdigest()))
+
+
+if __name__ == "__main__":
+    unittest.main()
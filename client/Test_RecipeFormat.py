@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+import os
+import sys
+import struct
+import random
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+import RecipeFormat
+import recipeformat # the copy of the server, has to produce the same wire format
+
+
+def make_recipe(blocks, blocksizes=False, pages=False):
+    rnd = random.Random(blocks)
+    recipe = {
+        "blockchain" : ["%040x" % rnd.getrandbits(160) for _ in range(blocks)],
+        "chunking" : {"method" : "fixed", "blocksize" : 1024 * 1024},
+        "size" : blocks * 1024 * 1024,
+        "checksum" : "%040x" % rnd.getrandbits(160),
+        "mime_type" : "application/octet-stream",
+        "identity" : "blocklist",
+    }
+    if blocksizes:
+        recipe["blocksizes"] = [rnd.randint(1, 1024 * 1024) for _ in range(blocks)]
+        recipe["size"] = sum(recipe["blocksizes"])
+    if pages:
+        recipe["pages"] = recipe["blockchain"]
+        recipe["pagesizes"] = [rnd.randint(1, 2 ** 40) for _ in range(blocks)]
+        recipe["size"] = sum(recipe["pagesizes"])
+        recipe["blockchain"] = []
+    return recipe
+
+
+class Test(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for kwds in ({}, {"blocksizes" : True}, {"pages" : True}):
+            for blocks in (0, 1, 100):
+                recipe = make_recipe(blocks, **kwds)
+                for codec in (RecipeFormat, recipeformat):
+                    decoded = codec.decode(codec.encode(recipe))
+                    self.assertEqual(list(decoded["blockchain"]), recipe["blockchain"])
+                    self.assertEqual({key: (list(value) if key in ("blockchain", "pages") else value) for key, value in decoded.items()}, recipe)
+
+    def test_same_wire_format(self):
+        for kwds in ({}, {"blocksizes" : True}, {"pages" : True}):
+            recipe = make_recipe(50, **kwds)
+            data = RecipeFormat.encode(recipe)
+            self.assertEqual(data, recipeformat.encode(recipe))
+            self.assertEqual(recipeformat.decode(data)["size"], recipe["size"])
+            self.assertEqual(list(RecipeFormat.decode(recipeformat.encode(recipe))["blockchain"]), recipe["blockchain"])
+        for name in ("MIME_TYPE", "MAGIC", "VERSION", "FLAG_BLOCKSIZES", "FLAG_PAGES", "DIGEST_SIZE"):
+            self.assertEqual(getattr(RecipeFormat, name), getattr(recipeformat, name))
+        self.assertEqual(RecipeFormat.HEADER.format, recipeformat.HEADER.format)
+
+    def test_digestlist(self):
+        recipe = make_recipe(10)
+        decoded = RecipeFormat.decode(RecipeFormat.encode(recipe))
+        digests = decoded["blockchain"]
+        self.assertEqual(len(digests), 10)
+        self.assertEqual(digests[-1], recipe["blockchain"][-1])
+        self.assertEqual(digests[2:5], recipe["blockchain"][2:5])
+        self.assertEqual(digests, recipe["blockchain"])
+        with self.assertRaises(IndexError):
+            digests[10]
+        # encoding a decoded recipe uses the packed digests as is
+        self.assertEqual(RecipeFormat.encode(decoded), RecipeFormat.encode(recipe))
+
+    def test_malformed(self):
+        data = RecipeFormat.encode(make_recipe(3, blocksizes=True))
+        for codec in (RecipeFormat, recipeformat):
+            for bad in (b"", data[:10], b"XXXX" + data[4:], data[:-1], data + b"\0"):
+                with self.assertRaises(ValueError):
+                    codec.decode(bad)
+            with self.assertRaises(ValueError):
+                codec.decode(data[:4] + bytes([2]) + data[5:]) # unknown version
+
+    def test_not_encodable(self):
+        recipe = make_recipe(3, pages=True)
+        recipe["blocksizes"] = [1, 2, 3]
+        for codec in (RecipeFormat, recipeformat):
+            with self.assertRaises(ValueError):
+                codec.encode(recipe)
+            with self.assertRaises(struct.error):
+                codec.encode(dict(make_recipe(3), blocksizes=[2 ** 32, 1, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+import io
+import sys
+import base64
+import random
+import hashlib
+import logging
+import unittest
+from FileStorageClient import FileStorageClient
+from RecipeReader import RecipeReader
+
+
+class FakeBlockStorage(object):
+    """
+    blocks in memory, counting gets
+    """
+
+    blocksize = 1000
+
+    def __init__(self):
+        self.blocks = {}
+        self.gets = 0
+
+    def zero_length(self, checksum):
+        return None # zero blocks are stored like any other
+
+    def get(self, checksum):
+        self.gets += 1
+        return self.blocks[checksum]
+
+    def put(self, data, use_cache=False):
+        checksum = hashlib.sha1(data).hexdigest()
+        self.blocks[checksum] = bytes(data)
+        return checksum, 200
+
+
+def make_filestorage():
+    filestorage = object.__new__(FileStorageClient)
+    filestorage._bs = FakeBlockStorage()
+    filestorage._logger = logging.getLogger("FileStorageClient")
+    return filestorage
+
+
+def random_data(size, seed=0):
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "big") if size else b""
+
+
+def store(filestorage, data, lengths=None):
+    """
+    return recipe of data cut into lengths, fixed blocks if lengths is None
+    """
+    bs = filestorage._bs
+    recipe = {"size" : len(data), "blockchain" : [], "chunking" : {"method" : "fixed", "blocksize" : bs.blocksize}}
+    if lengths is None:
+        lengths = [bs.blocksize] * (len(data) // bs.blocksize) + ([len(data) % bs.blocksize] if len(data) % bs.blocksize else [])
+    else:
+        recipe["blocksizes"] = lengths
+        recipe["chunking"] = {"method" : "gear"}
+    offset = 0
+    for length in lengths:
+        checksum, _ = bs.put(data[offset:offset + length])
+        recipe["blockchain"].append(checksum)
+        offset += length
+    return recipe
+
+
+def check_random_access(test, reader, data, seed=0):
+    """
+    compare random seeks and reads of reader with data
+    """
+    rnd = random.Random(seed)
+    for _ in range(300):
+        position = rnd.randint(0, len(data) + 10)
+        length = rnd.randint(0, 2500)
+        whence = rnd.choice((io.SEEK_SET, io.SEEK_CUR, io.SEEK_END))
+        if whence == io.SEEK_SET:
+            test.assertEqual(reader.seek(position), position)
+        elif whence == io.SEEK_CUR:
+            position = reader.tell() + rnd.randint(-reader.tell(), 1000)
+            test.assertEqual(reader.seek(position - reader.tell(), io.SEEK_CUR), position)
+        else:
+            position = max(len(data) - rnd.randint(0, 3000), 0)
+            test.assertEqual(reader.seek(position - len(data), io.SEEK_END), position)
+        if rnd.random() < 0.5:
+            test.assertEqual(reader.read(length), data[position:position + length])
+        else:
+            buffer = bytearray(length)
+            done = reader.readinto(buffer)
+            test.assertEqual(bytes(buffer[:done]), data[position:position + length])
+        test.assertEqual(reader.tell(), max(position, min(position + length, len(data))))
+    reader.seek(0)
+    test.assertEqual(reader.readall(), data)
+    test.assertEqual(reader.read(10), b"")
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = make_filestorage()
+
+    def test_fixed_blocks(self):
+        for size in (0, 1, 999, 1000, 1001, 7500):
+            data = random_data(size, size)
+            recipe = store(self.fs, data)
+            self.assertEqual(self.fs.block_lengths(recipe), [len(self.fs._bs.blocks[checksum]) for checksum in recipe["blockchain"]])
+            check_random_access(self, RecipeReader(self.fs, recipe), data, size)
+
+    def test_blocksizes(self):
+        rnd = random.Random(1)
+        lengths = [rnd.randint(1, 2000) for _ in range(20)]
+        data = random_data(sum(lengths))
+        check_random_access(self, RecipeReader(self.fs, store(self.fs, data, lengths)), data)
+
+    def test_inline(self):
+        data = b"tiny file"
+        reader = RecipeReader(self.fs, {"size" : len(data), "blockchain" : [], "inline" : base64.b64encode(data).decode("ascii"), "version" : 2})
+        check_random_access(self, reader, data)
+        self.assertEqual(reader.fetched, 0)
+        self.assertEqual(self.fs._bs.gets, 0)
+
+    def test_fetched_and_cache(self):
+        data = random_data(10000)
+        reader = RecipeReader(self.fs, store(self.fs, data), cache_blocks=2)
+        reader.seek(1500)
+        self.assertEqual(reader.read(1000), data[1500:2500]) # two blocks
+        self.assertEqual(reader.fetched, 2)
+        reader.seek(1000)
+        reader.read(10) # cached
+        self.assertEqual(reader.fetched, 2)
+        reader.seek(5000)
+        reader.read(10)
+        reader.seek(0)
+        reader.read(10) # evicted before
+        self.assertEqual(reader.fetched, 4)
+        with io.BufferedReader(RecipeReader(self.fs, store(self.fs, data)), buffer_size=1000) as buffered:
+            self.assertEqual(buffered.read(3), data[:3])
+            self.assertEqual(buffered.raw.fetched, 1)
+
+    def test_errors(self):
+        data = random_data(3000)
+        recipe = store(self.fs, data)
+        reader = RecipeReader(self.fs, recipe)
+        with self.assertRaises(ValueError):
+            reader.seek(-1)
+        with self.assertRaises(ValueError):
+            reader.seek(0, 5)
+        self.fs._bs.blocks[recipe["blockchain"][1]] = b"short"
+        reader.seek(1000)
+        with self.assertRaises(IOError):
+            reader.read(10)
+        reader.close()
+        with self.assertRaises(ValueError):
+            reader.read(10)
+
+
+class TestPages(unittest.TestCase):
+
+    def setUp(self):
+        self.module = sys.modules[FileStorageClient.__module__]
+        self.page_entries = self.module.PAGE_ENTRIES
+        self.module.PAGE_ENTRIES = 4
+        self.fs = make_filestorage()
+
+    def tearDown(self):
+        self.module.PAGE_ENTRIES = self.page_entries
+
+    def paginated(self, data, lengths=None):
+        recipe = store(self.fs, data, lengths)
+        blocks = list(zip(recipe["blockchain"], self.fs.block_lengths(recipe)))
+        self.fs._paginate(recipe)
+        return recipe, blocks
+
+    def test_paginate(self):
+        rnd = random.Random(2)
+        for lengths in (None, [rnd.randint(1, 2000) for _ in range(11)]):
+            data = random_data(sum(lengths) if lengths else 10500)
+            recipe, blocks = self.paginated(data, lengths)
+            self.assertEqual(recipe["version"], 2)
+            self.assertEqual(recipe["blockchain"], [])
+            self.assertNotIn("blocksizes", recipe)
+            self.assertEqual(len(recipe["pages"]), 3)
+            self.assertEqual(sum(recipe["pagesizes"]), len(data))
+            self.assertEqual(list(self.fs.blocks(recipe)), blocks)
+            self.assertEqual(self.fs.block_lengths(recipe), [length for _, length in blocks])
+            reader = RecipeReader(self.fs, recipe, cache_pages=1)
+            check_random_access(self, reader, data)
+
+    def test_small_recipe_unchanged(self):
+        recipe, _ = self.paginated(random_data(4000))
+        self.assertNotIn("pages", recipe)
+        self.assertNotIn("version", recipe)
+        self.assertEqual(len(recipe["blockchain"]), 4)
+
+    def test_shared_pages(self):
+        data = random_data(10500)
+        recipe, _ = self.paginated(data)
+        changed, _ = self.paginated(data[:9000] + b"x" * 1500)
+        self.assertEqual(recipe["pages"][:2], changed["pages"][:2])
+        self.assertNotEqual(recipe["pages"][2], changed["pages"][2])
+
+    def test_pages_loaded_when_touched(self):
+        data = random_data(10500)
+        recipe, _ = self.paginated(data)
+        self.fs._bs.gets = 0
+        reader = RecipeReader(self.fs, recipe)
+        self.assertEqual(self.fs._bs.gets, 0)
+        reader.seek(9000)
+        self.assertEqual(reader.read(10), data[9000:9010])
+        self.assertEqual((self.fs._bs.gets, reader.fetched), (2, 1)) # last page and one block
+
+    def test_page_size_mismatch(self):
+        recipe, _ = self.paginated(random_data(10500))
+        recipe["pagesizes"][0] += 1
+        recipe["size"] += 1
+        with self.assertRaises(IOError):
+            RecipeReader(self.fs, recipe).read(10)
+
+
+if __name__ == "__main__":
+    unittest.main()
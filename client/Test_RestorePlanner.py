@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+import io
+import os
+import hashlib
+import logging
+import unittest
+from FileStorageClient import FileStorageClient
+from RestorePlanner import RestorePlanner
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger("RestorePlanner").setLevel(logging.CRITICAL)
+        self.backend = LocalBackend()
+        self.target = os.path.join(self.backend.root, "target")
+        os.mkdir(self.target)
+        self.filestorage = FileStorageClient(inline_size=10)
+        blocks = [os.urandom(4096) for _ in range(4)]
+        self.files = {
+            "a" : b"".join(blocks) + b"tail", # 5 blocks
+            "b" : b"".join(blocks[::-1]), # same blocks, other order
+            "c" : blocks[0] + bytes(3 * 4096) + blocks[1], # holes
+            "d" : b"tiny", # inline
+            "e" : b"", # empty, inline
+        }
+        self.checksums = {name : self.filestorage.put(io.BytesIO(data))["checksum"] for name, data in self.files.items()}
+
+    def tearDown(self):
+        self.backend.close()
+
+    def filename(self, name):
+        return os.path.join(self.target, name)
+
+    def read(self, name):
+        with open(self.filename(name), "rb") as infile:
+            return infile.read()
+
+    def test_restore(self):
+        planner = RestorePlanner(self.filestorage, threads=3, max_open=2)
+        for name, checksum in self.checksums.items():
+            planner.add(self.filename(name), checksum)
+        self.assertEqual(sorted(planner.run()), sorted(self.filename(name) for name in self.files))
+        for name, data in self.files.items():
+            self.assertEqual(self.read(name), data)
+        self.assertEqual(planner.blocks, 5) # every unique block once, zero blocks not at all
+        self.assertEqual(planner.writes, 5 + 4 + 2)
+        self.assertLess(os.stat(self.filename("c")).st_blocks * 512, 5 * 4096) # sparse, depends on the filesystem
+
+    def test_slices_and_missing(self):
+        planner = RestorePlanner(self.filestorage)
+        planner.add(self.filename("slice"), self.checksums["a"], 4000, 200) # across two blocks
+        planner.add(self.filename("inline"), self.checksums["d"], 1, 2)
+        planner.add(self.filename("missing"), hashlib.sha1(b"missing").hexdigest())
+        self.assertEqual(sorted(planner.run()), [self.filename("inline"), self.filename("slice")])
+        self.assertEqual(self.read("slice"), self.files["a"][4000:4200])
+        self.assertEqual(self.read("inline"), b"in")
+        self.assertFalse(os.path.exists(self.filename("missing")))
+        with self.assertRaises(ValueError):
+            planner.add(self.filename("slice"), self.checksums["a"], 4000, 200, sync=True)
+
+    def test_replace_keeps_links(self):
+        with open(self.filename("a"), "wb") as outfile:
+            outfile.write(b"old content")
+        os.link(self.filename("a"), self.filename("link"))
+        planner = RestorePlanner(self.filestorage)
+        planner.add(self.filename("a"), self.checksums["a"])
+        planner.run()
+        self.assertEqual(self.read("a"), self.files["a"])
+        self.assertEqual(self.read("link"), b"old content") # replaced, not overwritten
+
+    def test_sync(self):
+        existing = {
+            "a" : self.files["a"][:4096] + os.urandom(4096) + self.files["a"][8192:], # one block changed
+            "b" : self.files["b"] + b"longer", # truncated
+            "c" : self.files["c"][:-4096], # extended, holes are written in existing files
+            "d" : b"tine", # inline
+        }
+        for name, data in existing.items():
+            with open(self.filename(name), "wb") as outfile:
+                outfile.write(data)
+        os.link(self.filename("a"), self.filename("link"))
+        planner = RestorePlanner(self.filestorage)
+        for name, checksum in self.checksums.items():
+            planner.add(self.filename(name), checksum, sync=True)
+        planner.run()
+        for name, data in self.files.items():
+            self.assertEqual(self.read(name), data)
+        self.assertEqual(planner.unchanged, 4 + 4 + 4) # a without the changed block, b, c without the last one
+        self.assertEqual(planner.blocks, 1) # the changed block of a is the last one of c
+        self.assertEqual(self.read("link"), existing["a"]) # other link not changed
+        self.assertEqual(os.stat(self.filename("a")).st_nlink, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+import os
+import json
+import dbm
+import hashlib
+import unittest
+from FileStorageClient import FileStorageClient
+from SmallFilePacker import SmallFilePacker
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+        self.index_filename = os.path.join(self.backend.root, "packs.db")
+        self.filestorage = FileStorageClient()
+
+    def tearDown(self):
+        self.backend.close()
+
+    def slice(self, location):
+        pack, offset, length = location
+        return b"".join(bytes(data) for data in self.filestorage.read(pack))[offset:offset + length]
+
+    def test_pack(self):
+        files = [os.urandom(size) for size in (1, 1000, 2000, 1500, 4096, 10)]
+        files.append(files[1])
+        with SmallFilePacker(self.filestorage, self.index_filename, max_size=4096) as packer:
+            for index, data in enumerate(files):
+                self.assertEqual(packer.add(data), (hashlib.sha1(data).hexdigest(), index < 6))
+            self.assertIsNone(packer.location(hashlib.sha1(files[5]).hexdigest())) # not flushed yet
+            packer.flush()
+            locations = [packer.location(hashlib.sha1(data).hexdigest()) for data in files]
+            self.assertEqual(packer.packs, 4) # packs of up to blocksize
+        for data, location in zip(files, locations):
+            self.assertEqual(self.slice(location), data)
+        self.assertEqual(len({location[0] for location in locations}), 4)
+        self.assertEqual(locations[-1], locations[1])
+        self.assertTrue(all(self.filestorage.get(location[0])["mime_type"] == SmallFilePacker.mime_type for location in locations))
+
+    def test_index(self):
+        data = os.urandom(100)
+        with SmallFilePacker(self.filestorage, self.index_filename) as packer:
+            packer.add(data)
+        with SmallFilePacker(self.filestorage, self.index_filename) as packer: # known across backupsets
+            self.assertEqual(packer.add(data), (hashlib.sha1(data).hexdigest(), False))
+            self.assertEqual(packer.packs, 0)
+        with dbm.open(self.index_filename, "w") as index: # pack removed from FileStorage meanwhile
+            index[hashlib.sha1(data).hexdigest()] = json.dumps((hashlib.sha1(b"missing").hexdigest(), 0, 100))
+        with SmallFilePacker(self.filestorage, self.index_filename) as packer:
+            self.assertEqual(packer.add(data), (hashlib.sha1(data).hexdigest(), True)) # packed again
+            packer.flush()
+            self.assertEqual(self.slice(packer.location(hashlib.sha1(data).hexdigest())), data)
+
+    def test_max_size(self):
+        with self.assertRaises(ValueError):
+            SmallFilePacker(self.filestorage, self.index_filename, max_size=4097)
+
+
+if __name__ == "__main__":
+    unittest.main()
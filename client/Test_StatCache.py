@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import StatCache
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "file")
+        with open(self.filename, "wb") as outfile:
+            outfile.write(b"data")
+        past = time.time() - 60
+        os.utime(self.filename, (past, past))
+        self.cache = StatCache.StatCache(os.path.join(self.tmpdir, "stat.db"), racy_seconds=0)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit_and_miss(self):
+        stats = os.stat(self.filename)
+        self.assertIsNone(self.cache.get(stats))
+        self.cache.put(stats, "a" * 40)
+        self.assertEqual(self.cache.get(os.stat(self.filename)), "a" * 40)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file(self):
+        self.cache.put(os.stat(self.filename), "a" * 40)
+        with open(self.filename, "ab") as outfile:
+            outfile.write(b"more")
+        self.assertIsNone(self.cache.get(os.stat(self.filename)))
+
+    def test_mtime_reset_is_detected(self):
+        stats = os.stat(self.filename)
+        self.cache.put(stats, "a" * 40)
+        time.sleep(0.01)
+        with open(self.filename, "r+b") as outfile: # same size
+            outfile.write(b"DATA")
+        os.utime(self.filename, ns=(stats.st_atime_ns, stats.st_mtime_ns)) # ctime changes anyway
+        self.assertIsNone(self.cache.get(os.stat(self.filename)))
+
+    def test_racy_files_not_cached(self):
+        cache = StatCache.StatCache(os.path.join(self.tmpdir, "racy.db"), racy_seconds=3600)
+        try:
+            cache.put(os.stat(self.filename), "a" * 40) # ctime is now
+            self.assertIsNone(cache.get(os.stat(self.filename)))
+        finally:
+            cache.close()
+
+    def test_persistent(self):
+        self.cache.put(os.stat(self.filename), "a" * 40)
+        self.cache.close()
+        with StatCache.StatCache(os.path.join(self.tmpdir, "stat.db")) as cache:
+            self.assertEqual(cache.get(os.stat(self.filename)), "a" * 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+import io
+import os
+import unittest
+from WebStorageClient import BufferReader
+
+
+class TestBufferReader(unittest.TestCase):
+
+    def test_read(self):
+        data = bytearray(os.urandom(10000))
+        reader = BufferReader(memoryview(data)[100:])
+        self.assertEqual(len(reader), 9900)
+        self.assertEqual(reader.read(1000), data[100:1100])
+        buf = bytearray(500)
+        self.assertEqual(reader.readinto(buf), 500)
+        self.assertEqual(buf, data[1100:1600])
+        self.assertEqual(reader.tell(), 1500)
+        self.assertEqual(reader.read(), data[1600:])
+        self.assertEqual(reader.read(10), b"")
+        self.assertEqual(reader.readinto(buf), 0)
+
+    def test_seek(self):
+        data = bytearray(1000)
+        reader = BufferReader(data)
+        self.assertEqual(reader.seek(0, io.SEEK_END), 1000) # used by requests to get content-length
+        self.assertEqual(reader.seek(-10, io.SEEK_CUR), 990)
+        self.assertEqual(reader.seek(2000), 1000)
+        self.assertEqual(reader.seek(-1), 0)
+        data[:3] = b"abc" # a view, not a copy
+        self.assertEqual(reader.read(3), b"abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+import os
+import time
+import hashlib
+import unittest
+import concurrent.futures
+# non-stdlib
+import requests
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+        self.module = self.backend.blockstorage
+
+    def tearDown(self):
+        self.backend.close()
+
+    def put(self, data, headers=None):
+        return requests.put("%s/%s" % (self.backend.blockstorage_url, hashlib.sha1(data).hexdigest()), data=data, headers=headers)
+
+    def test_concurrent_put_one_epoch(self):
+        data = os.urandom(4096)
+        compress_block = self.module._compress_block
+        def slow_compress_block(*args):
+            time.sleep(0.2) # every request has passed the first existence check
+            return compress_block(*args)
+        self.module._compress_block = slow_compress_block
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                statuses = sorted(res.status_code for res in executor.map(lambda _: self.put(data), range(8)))
+        finally:
+            self.module._compress_block = compress_block
+        self.assertEqual(statuses, [200] + [201] * 7)
+        self.assertEqual(self.module.bc.last()["epoch"], 2)
+        self.assertEqual(self.module.app.config["checksums"], [hashlib.sha1(data).hexdigest()])
+        self.assertEqual(self.put(data).status_code, 201)
+
+    def test_compression_at_rest(self):
+        text = b"".join(b"line %d of some text\n" % index for index in range(200))[:4096]
+        binary = os.urandom(4096)
+        for codecs, encoding in ((["zlib"], "deflate"), (["lzma"], "xz"), (["zlib", "lzma"], "xz")):
+            self.module.app.config["compression"] = {"codecs" : codecs, "min_saving" : 0.1} # reset by next LocalBackend
+            text = text[1:] + text[:1] # not stored yet
+            for data, stored in ((text, encoding), (binary, None)):
+                checksum = hashlib.sha1(data).hexdigest()
+                self.assertIn(self.put(data).status_code, (200, 201))
+                self.assertTrue(os.path.isfile(self.module._get_filename(checksum, stored)))
+                res = requests.get("%s/%s" % (self.backend.blockstorage_url, checksum), headers={"accept-encoding" : "identity"})
+                self.assertEqual(res.content, data) # decompressed by server
+                res = requests.get("%s/%s" % (self.backend.blockstorage_url, checksum), headers={"accept-encoding" : "gzip, deflate, xz"}, stream=True)
+                self.assertEqual(res.headers.get("content-encoding"), stored)
+                with open(self.module._get_filename(checksum, stored), "rb") as infile:
+                    self.assertEqual(res.raw.read(), infile.read()) # sent as stored
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+import os
+import sys
+import gzip
+import json
+import hashlib
+import unittest
+# non-stdlib
+from flask import Flask, request
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+import checksumlisting
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.checksums = [hashlib.sha1(str(index).encode("ascii")).hexdigest() for index in range(10000)]
+        app = Flask(__name__)
+
+        @app.route("/", methods=["GET"])
+        def get():
+            return checksumlisting.listing(request, self.checksums)
+
+        self.client = app.test_client()
+
+    def test_chunks(self):
+        for start, end in ((0, 0), (0, 1), (5, 5000), (0, 10000), (4095, 4097)):
+            self.assertEqual(json.loads("".join(checksumlisting.json_chunks(self.checksums, start, end))), self.checksums[start:end])
+            data = b"".join(checksumlisting.binary_chunks(self.checksums, start, end))
+            self.assertEqual([data[index:index + 20].hex() for index in range(0, len(data), 20)], self.checksums[start:end])
+            self.assertEqual(gzip.decompress(b"".join(checksumlisting.gzip_chunks(checksumlisting.json_chunks(self.checksums, start, end)))), "".join(checksumlisting.json_chunks(self.checksums, start, end)).encode("ascii"))
+
+    def test_listing_json(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_json(), self.checksums)
+        self.assertEqual(response.headers["X-Total-Count"], "10000")
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_listing_binary_gzip(self):
+        response = self.client.get("/?format=binary", headers={"Accept-Encoding" : "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.mimetype, checksumlisting.BINARY_MIME_TYPE)
+        data = gzip.decompress(response.data)
+        self.assertEqual(len(data), 20 * len(self.checksums))
+        self.assertEqual(data[-20:].hex(), self.checksums[-1])
+
+    def test_pagination(self):
+        collected = []
+        cursor = 0
+        while True:
+            response = self.client.get("/?cursor=%d&limit=3000" % cursor)
+            collected.extend(response.get_json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            cursor = int(response.headers["X-Next-Cursor"])
+        self.assertEqual(collected, self.checksums)
+        self.assertEqual(self.client.get("/?cursor=20000").get_json(), []) # clamped to end
+        self.assertEqual(self.client.get("/?cursor=-5&limit=2").get_json(), self.checksums[:2])
+
+    def test_bad_parameters(self):
+        for query in ("cursor=x", "limit=1.5", "format=xml"):
+            self.assertEqual(self.client.get("/?" + query).status_code, 400, query)
+
+
+if __name__ == "__main__":
+    unittest.main()
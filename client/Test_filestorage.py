@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+import json
+import base64
+import hashlib
+import unittest
+# non-stdlib
+import requests
+from LocalBackend import LocalBackend
+
+
+def make_recipe(data, blocksize=4096):
+    """
+    return recipe of data with identity sha1, blocks are not stored
+    """
+    blocks = [data[offset:offset + blocksize] for offset in range(0, len(data), blocksize)]
+    return {
+        "blockchain" : [hashlib.sha1(block).hexdigest() for block in blocks],
+        "chunking" : {"method" : "fixed", "blocksize" : blocksize},
+        "size" : len(data),
+        "checksum" : hashlib.sha1(data).hexdigest(),
+        "mime_type" : "application/octet-stream",
+        "identity" : "sha1",
+    }
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalBackend()
+        self.module = self.backend.filestorage
+        self.url = self.backend.filestorage_url
+
+    def tearDown(self):
+        self.backend.close()
+
+    def put(self, recipe):
+        return requests.put("%s/%s" % (self.url, recipe["checksum"]), data=json.dumps(recipe))
+
+    def get(self, checksum):
+        return requests.get("%s/%s" % (self.url, checksum)).json()
+
+    def test_put_never_overwrites(self):
+        recipe = make_recipe(b"x" * 10000)
+        self.assertEqual(self.put(recipe).status_code, 200)
+        forged = dict(recipe, blockchain=[hashlib.sha1(b"other").hexdigest()] * 3) # sha1 identity could not be verified
+        self.assertEqual(self.put(forged).status_code, 201)
+        self.assertEqual(self.get(recipe["checksum"])["blockchain"], recipe["blockchain"])
+        res = requests.post("%s/bulk/put" % self.url, data=json.dumps(forged))
+        self.assertEqual(res.json(), {recipe["checksum"] : "exists"})
+        self.assertEqual(self.get(recipe["checksum"])["blockchain"], recipe["blockchain"])
+        self.assertEqual(self.module.bc.last()["epoch"], 2) # no second epoch
+
+    def test_inline(self):
+        data = b"tiny file"
+        recipe = dict(make_recipe(data), blockchain=[], inline=base64.b64encode(data).decode("ascii"))
+        self.assertEqual(self.put(recipe).text, "Bad Request: inline or paged recipe needs version 2")
+        recipe["version"] = 2
+        for key, value, error in (
+                ("inline", "not base64!", "inline data is not base64"),
+                ("size", 8, "inline recipe inconsistent"),
+                ("identity", "blocklist", "inline recipe inconsistent"),
+                ("blockchain", [hashlib.sha1(data).hexdigest()], "inline recipe inconsistent"),
+                ("inline", base64.b64encode(b"tiny filE").decode("ascii"), "inline checksum mismatch")):
+            res = self.put(dict(recipe, **{key : value}))
+            self.assertEqual((res.status_code, res.text), (400, "Bad Request: %s" % error))
+        self.assertEqual(self.put(recipe).status_code, 200)
+        self.assertEqual(self.get(recipe["checksum"]), recipe)
+        self.assertEqual(self.module.bc.last()["epoch"], 2)
+
+    def test_bulk_get(self):
+        recipes = [make_recipe(bytes([index]) * 5000) for index in range(3)]
+        for recipe in recipes:
+            self.assertEqual(self.put(recipe).status_code, 200)
+        missing = hashlib.sha1(b"missing").hexdigest()
+        checksums = [recipes[2]["checksum"], missing, recipes[0]["checksum"], "short", recipes[2]["checksum"]]
+        res = requests.post("%s/bulk/get" % self.url, data=json.dumps(checksums))
+        self.assertEqual(res.headers["content-type"], "application/x-ndjson")
+        self.assertEqual([json.loads(line) for line in res.text.splitlines()], [
+            {"checksum" : recipes[2]["checksum"], "recipe" : recipes[2]},
+            {"checksum" : missing, "error" : "not found"},
+            {"checksum" : recipes[0]["checksum"], "recipe" : recipes[0]},
+            {"checksum" : "short", "error" : "not found"},
+            {"checksum" : recipes[2]["checksum"], "recipe" : recipes[2]},
+        ]) # in requested order
+        for data in ("no json", json.dumps({"checksum" : missing})):
+            self.assertEqual(requests.post("%s/bulk/get" % self.url, data=data).status_code, 400)
+
+    def test_bulk_put(self):
+        recipes = [make_recipe(bytes([index]) * 5000) for index in range(3)]
+        self.assertEqual(self.put(recipes[0]).status_code, 200)
+        invalid = dict(make_recipe(b"invalid"), identity="md5")
+        data = "\n".join(json.dumps(recipe) for recipe in recipes + [recipes[1], invalid]) + "\n\n"
+        res = requests.post("%s/bulk/put" % self.url, data=data)
+        self.assertEqual(res.json(), {
+            recipes[0]["checksum"] : "exists",
+            recipes[1]["checksum"] : "exists", # twice in this request
+            recipes[2]["checksum"] : "stored",
+            invalid["checksum"] : "unknown identity",
+        })
+        self.assertEqual([self.get(recipe["checksum"]) for recipe in recipes], recipes)
+        self.assertEqual(self.module.bc.last()["epoch"], 4) # one epoch per recipe
+        self.assertEqual(self.module.app.config["checksums"], [recipe["checksum"] for recipe in recipes])
+        for data in ("no json", json.dumps([recipes[0]]), json.dumps(dict(recipes[0], checksum="short"))):
+            self.assertEqual(requests.post("%s/bulk/put" % self.url, data=data).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
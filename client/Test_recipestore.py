@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import unittest
+import concurrent.futures
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+import recipestore
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        self.checksums = [hashlib.sha1(str(index).encode("ascii")).hexdigest() for index in range(10)]
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    def stores(self):
+        yield recipestore.get_store({"recipe_store" : "files", "storage_dir" : self.storage_dir})
+        yield recipestore.get_store({"recipe_store" : "sqlite", "storage_dir" : self.storage_dir})
+
+    def test_get_store(self):
+        stores = list(self.stores())
+        self.assertIsInstance(stores[0], recipestore.FileRecipeStore)
+        self.assertIsInstance(stores[1], recipestore.SqliteRecipeStore)
+        self.assertTrue(os.path.isfile(os.path.join(self.storage_dir, "recipes.db")))
+        store = recipestore.get_store({"recipe_store" : "sqlite", "storage_dir" : self.storage_dir, "recipe_db" : os.path.join(self.storage_dir, "other.db")})
+        self.assertTrue(os.path.isfile(os.path.join(self.storage_dir, "other.db")))
+        self.assertFalse(store.exists(self.checksums[0]))
+
+    def test_put_get(self):
+        for store in self.stores():
+            checksum = self.checksums[0]
+            self.assertIsNone(store.get(checksum))
+            self.assertFalse(store.exists(checksum))
+            store.put(checksum, b'{"size": 0}')
+            self.assertTrue(store.exists(checksum))
+            self.assertEqual(store.get(checksum), b'{"size": 0}')
+            store.put(checksum, b"\x00binary", binary=True) # other format replaces the recipe
+            self.assertEqual(store.get(checksum), b"\x00binary")
+            store.put_many((checksum, b"%d" % index, False) for index, checksum in enumerate(self.checksums[1:], 1))
+            self.assertEqual(sorted(store.checksums()), sorted(self.checksums))
+            self.assertEqual([store.get(checksum) for checksum in self.checksums[1:]], [b"%d" % index for index in range(1, 10)])
+
+    def test_threads(self):
+        for store in self.stores():
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda checksum: store.put(checksum, checksum.encode("ascii")), self.checksums))
+                self.assertEqual(list(executor.map(store.get, self.checksums)), [checksum.encode("ascii") for checksum in self.checksums])
+        self.assertEqual(len([name for name in os.listdir(self.storage_dir) if name.endswith(".json")]), 10)
+        self.assertEqual(sorted(recipestore.SqliteRecipeStore(os.path.join(self.storage_dir, "recipes.db")).checksums()), sorted(self.checksums))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+import io
+import os
+import sys
+import logging
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import wsget
+from FileStorageClient import FileStorageClient
+from LocalBackend import LocalBackend
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger("").setLevel(logging.CRITICAL)
+        self.backend = LocalBackend()
+        self.output = os.path.join(self.backend.root, "output")
+        self.data = os.urandom(20 * 4096) + bytes(5 * 4096) + os.urandom(10)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_get(self):
+        for identity in ("sha1", "blocklist"):
+            filestorage = FileStorageClient(identity=identity)
+            checksum = filestorage.put(io.BytesIO(self.data))["checksum"]
+            for threads in (1, 4):
+                if threads > 1:
+                    wsget.get_parallel(filestorage, checksum, self.output, threads)
+                else:
+                    wsget.get_sequential(filestorage, checksum, self.output)
+                with open(self.output, "rb") as infile:
+                    self.assertEqual(infile.read(), self.data)
+                self.assertTrue(wsget.verify(filestorage, checksum, self.output))
+                with open(self.output, "r+b") as outfile:
+                    outfile.write(b"changed")
+                self.assertFalse(wsget.verify(filestorage, checksum, self.output))
+                os.unlink(self.output)
+
+    def test_inline(self):
+        filestorage = FileStorageClient(inline_size=100)
+        checksum = filestorage.put(io.BytesIO(b"tiny"))["checksum"]
+        wsget.get_parallel(filestorage, checksum, self.output, 4)
+        self.assertTrue(wsget.verify(filestorage, checksum, self.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import shutil
+import random
+import logging
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import wstar
+from FileStorageClient import FileStorageClient
+from SmallFilePacker import SmallFilePacker
+from LocalBackend import LocalBackend
+
+
+def make_tree(root, seed=0):
+    """
+    create some files below root, with some of the same content,
+    return list of absfilenames
+    """
+    rnd = random.Random(seed)
+    contents = [rnd.getrandbits(8 * size).to_bytes(size, "big") for size in (1, 100, 4096, 5000, 20000)] + [b"", bytes(9000)]
+    absfilenames = []
+    for index in range(30):
+        dirname = os.path.join(root, "dir%d" % (index % 4))
+        os.makedirs(dirname, exist_ok=True)
+        absfilename = os.path.join(dirname, "file%02d" % index)
+        with open(absfilename, "wb") as outfile:
+            outfile.write(contents[index % len(contents)])
+        absfilenames.append(absfilename)
+    return absfilenames
+
+
+class TestPutFiles(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger("").setLevel(logging.CRITICAL)
+        self.backend = LocalBackend()
+        self.root = tempfile.mkdtemp()
+        self.absfilenames = make_tree(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        self.backend.close()
+
+    def test_failed_files_are_reported(self):
+        filestorage = FileStorageClient()
+        missing = os.path.join(self.root, "missing")
+        work = [(absfilename, os.stat(absfilename), None) for absfilename in self.absfilenames]
+        work.insert(5, (missing, work[0][1], None))
+        for jobs in (1, 4):
+            failed = []
+            results = list(wstar.put_files(filestorage, iter(work), jobs, failed=failed))
+            self.assertEqual(failed, [missing])
+            self.assertEqual(sorted(result[0] for result in results), sorted(self.absfilenames))
+
+    def test_create_parallel_is_deterministic(self):
+        archives = []
+        for jobs in (1, 4, 4):
+            failed = []
+            archive = wstar.create(FileStorageClient(threads=2), self.root, lambda absfilename: False, jobs=jobs, failed=failed)
+            self.assertEqual(failed, [])
+            self.assertEqual(list(archive["filedata"]), sorted(self.absfilenames))
+            archives.append(json.dumps({absfilename: (entry["checksum"], entry["stat"][0], entry["stat"][-1]) for absfilename, entry in archive["filedata"].items()})) # atime changes by reading
+        self.assertEqual(archives[1], archives[0])
+        self.assertEqual(archives[2], archives[0])
+
+    def test_create_packed(self):
+        filestorage = FileStorageClient()
+        with SmallFilePacker(filestorage, os.path.join(self.root, "packs.db"), 4096) as packer:
+            archive = wstar.create(filestorage, os.path.join(self.root, "dir0"), lambda absfilename: False, jobs=4, packer=packer)
+        read = wstar.get_reader(filestorage)
+        for absfilename, filedata in archive["filedata"].items():
+            with open(absfilename, "rb") as infile:
+                data = infile.read()
+            self.assertEqual("pack" in filedata, 0 < len(data) <= 4096, absfilename)
+            self.assertEqual(b"".join(bytes(block) for block in read(filedata)), data)
+        self.assertEqual(packer.packs, 2) # 1, 100 and 4096 bytes, one of them twice
+
+
+class TestHardlinks(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger("").setLevel(logging.CRITICAL)
+        self.backend = LocalBackend()
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "data")
+        os.makedirs(os.path.join(self.path, "sub"))
+        self.data = os.urandom(10000)
+        for name, data in (("b", self.data), ("other", self.data)):
+            with open(os.path.join(self.path, name), "wb") as outfile:
+                outfile.write(data)
+        os.link(os.path.join(self.path, "b"), os.path.join(self.path, "sub", "c"))
+        os.link(os.path.join(self.path, "b"), os.path.join(self.path, "a"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        self.backend.close()
+
+    def test_tracker(self):
+        tracker = wstar.HardlinkTracker()
+        names = [os.path.join(self.path, name) for name in ("sub/c", "other", "b", "a")]
+        self.assertEqual([tracker.seen(name, os.stat(name)) for name in names], [False, False, True, True])
+        filedata = {names[0] : {"checksum" : "x", "stat" : [0] * 7}, names[1] : {"checksum" : "y", "stat" : [0] * 7}}
+        tracker.add_skipped(filedata)
+        self.assertEqual(sorted(filedata), sorted(names))
+        self.assertEqual(filedata[names[2]]["checksum"], "x")
+        tracker.mark_links(filedata)
+        self.assertEqual({name : entry.get("link") for name, entry in filedata.items()}, {names[0] : names[3], names[1] : None, names[2] : names[3], names[3] : None}) # first in sorted order
+
+    def test_create_and_restore(self):
+        filestorage = FileStorageClient()
+        put = filestorage.put
+        puts = []
+        filestorage.put = lambda fh, *args: puts.append(fh.name) or put(fh, *args)
+        archive = wstar.create(filestorage, self.path, lambda absfilename: False)
+        self.assertEqual(len(puts), 2) # every inode read once
+        filedata = archive["filedata"]
+        self.assertEqual({name[len(self.path):] : entry.get("link") for name, entry in filedata.items()}, {"/a" : None, "/b" : os.path.join(self.path, "a"), "/sub/c" : os.path.join(self.path, "a"), "/other" : None})
+        target = os.path.join(self.root, "restored")
+        wstar.restore(filestorage, archive, target)
+        inodes = {name : os.stat(os.path.join(target, name)).st_ino for name in ("a", "b", "sub/c", "other")}
+        self.assertEqual(len({inodes["a"], inodes["b"], inodes["sub/c"]}), 1)
+        self.assertNotEqual(inodes["other"], inodes["a"])
+        self.assertEqual(os.stat(os.path.join(target, "a")).st_nlink, 3)
+        for name in inodes:
+            with open(os.path.join(target, name), "rb") as infile:
+                self.assertEqual(infile.read(), self.data)
+
+    def test_restore_sync(self):
+        filestorage = FileStorageClient()
+        archive = wstar.create(filestorage, self.path, lambda absfilename: False)
+        target = os.path.join(self.root, "restored")
+        wstar.restore(filestorage, archive, target)
+        changed = os.urandom(10000)
+        with open(os.path.join(target, "other"), "r+b") as outfile:
+            outfile.write(changed)
+        os.link(os.path.join(target, "other"), os.path.join(self.root, "outside"))
+        os.unlink(os.path.join(target, "b")) # link lost
+        shutil.copy(os.path.join(target, "a"), os.path.join(target, "b"))
+        wstar.restore(filestorage, archive, target, sync=True)
+        with open(os.path.join(self.root, "outside"), "rb") as infile:
+            self.assertEqual(infile.read(), changed) # hardlink to restored file not changed
+        for name in ("a", "b", "sub/c", "other"):
+            with open(os.path.join(target, name), "rb") as infile:
+                self.assertEqual(infile.read(), self.data)
+        self.assertEqual(len({os.stat(os.path.join(target, name)).st_ino for name in ("a", "b", "sub/c")}), 1)
+
+
+class TestWriteBlocks(unittest.TestCase):
+
+    def test_holes(self):
+        blocks = [os.urandom(4096), bytes(1024 * 1024), os.urandom(4096), bytes(1024 * 1024)]
+        with tempfile.TemporaryFile() as outfile:
+            wstar.write_blocks(outfile, iter(blocks))
+            outfile.flush()
+            stats = os.fstat(outfile.fileno())
+            self.assertEqual(stats.st_size, 2 * 4096 + 2 * 1024 * 1024) # truncated to the final hole
+            self.assertLess(stats.st_blocks * 512, 1024 * 1024) # sparse, depends on the filesystem
+            outfile.seek(0)
+            self.assertEqual(outfile.read(), b"".join(blocks))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# pylint: disable=line-too-long
+"""
+walk directory trees with os.scandir to find files to backup
+"""
+import os
+import stat
+import logging
+import threading
+import concurrent.futures
+
+
+class TreeWalker(object):
+    """
+    find regular files below some path, yielding absolute filename and stat
+
+    the file type is taken from the directory entry, so regular files
+    only need one lstat call, symlinks are followed like os.stat does,
+    symlinks to directories are not descended into, like os.walk does
+
+    directories for which prune_func returns True are skipped as a whole,
+    files for which exclude_func returns True are not yielded
+
+    with threads > 1 subtrees are scanned in parallel, scandir and stat
+    release the GIL, the order of the files is not defined then
+
+    directories which could not be scanned are listed in failed, files
+    below them are unknown, not deleted
+    """
+
+    def __init__(self, exclude_func=None, prune_func=None, threads=1):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._exclude_func = exclude_func or (lambda absfilename: False)
+        self._prune_func = prune_func or (lambda absdirname: False)
+        self._threads = threads
+        self.excluded = 0
+        self.pruned = 0
+        self.failed = [] # directories scandir failed on
+        self._lock = threading.Lock() # counters are updated by every scanning thread
+
+    def walk(self, path):
+        """
+        yield absfilename, stats of every regular file below path
+        """
+        if self._threads > 1:
+            yield from self._walk_parallel(path)
+        else:
+            stack = [path]
+            while stack:
+                files, subdirs = self._scan(stack.pop())
+                yield from files
+                stack.extend(reversed(subdirs))
+
+    def _walk_parallel(self, path):
+        """
+        every directory is scanned as one task, subdirectories found
+        are scanned as new tasks, files are yielded as tasks complete
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._threads) as executor:
+            pending = {executor.submit(self._scan, path)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs = future.result()
+                    for subdir in subdirs:
+                        pending.add(executor.submit(self._scan, subdir))
+                    yield from files
+
+    def _scan(self, dirname):
+        """
+        return list of (absfilename, stats) of files and list of subdirectories to descend into
+        """
+        files = []
+        subdirs = []
+        pruned = excluded = 0
+        try:
+            with os.scandir(dirname) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self._prune_func(entry.path):
+                                self._logger.debug("%8s %s", "PRUNE", entry.path)
+                                pruned += 1
+                            else:
+                                subdirs.append(entry.path)
+                            continue
+                        if self._exclude_func(entry.path): # before stat, saves a syscall
+                            self._logger.debug("%8s %s", "EXCLUDE", entry.path)
+                            excluded += 1
+                            continue
+                        if entry.is_symlink():
+                            stats = os.stat(entry.path) # target of symlink
+                            if not stat.S_ISREG(stats.st_mode):
+                                continue
+                        elif entry.is_file(follow_symlinks=False):
+                            stats = entry.stat(follow_symlinks=False)
+                        else:
+                            continue # only save regular files
+                        files.append((entry.path, stats))
+                    except OSError as exc: # vanished or dangling symlink
+                        self._logger.debug("%8s %s %s", "NOFILE", entry.path, exc)
+        except OSError as exc:
+            self._logger.error(exc)
+            with self._lock:
+                self.failed.append(dirname)
+        with self._lock:
+            self.pruned += pruned
+            self.excluded += excluded
+        return files, subdirs
+
+    def is_failed(self, absfilename):
+        """
+        return True if absfilename is below some directory which could not be scanned
+        """
+        return any(absfilename.startswith(os.path.join(dirname, "")) for dirname in self.failed)
@@ -4,6 +4,7 @@
 RestFUL Webclient to use BlockStorage WebApps
 """
 import os
+import io
 import sys
 import hashlib
 import logging
@@ -14,6 +15,51 @@ import requests
 from webstorageClient.ClientConfig import ClientConfig
 
 
+class BufferReader(io.RawIOBase):
+    """
+    file like view on memoryview or bytearray, to send it as request body
+    in small pieces, without copying the whole buffer to a new bytes object
+    """
+
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, min(offset, len(self._view)))
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._view) - self._pos
+        data = bytes(self._view[self._pos:self._pos + size])
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buf):
+        data = self._view[self._pos:self._pos + len(buf)]
+        buf[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
 class WebStorageClient(object):
     """basic super class for WebStorage Client Classes"""
 
@@ -29,18 +75,26 @@ class WebStorageClient(object):
             logging.info("TLS Certificate verification will be disabled")
             import urllib3
             urllib3.disable_warnings()
-        self._session = requests.Session()
-        self._session.verify = self._client_config.requests_verify
-        self._session.proxies = self._client_config.proxies
         self._headers = {
             "user-agent": "%s-%s" % (self.__class__.__name__, self._version),
             "x-apikey" : self._client_config.apikey,
             "connection" : "keep-alive",
         }
-        self._session.headers.update(self._headers)
-        self._session.timeout = 180
+        self._session = self._new_session()
         self.hashfunc = hashlib.sha1
 
+    def _new_session(self):
+        """
+        return new requests session, sessions are not thread safe,
+        so every thread needs its own one
+        """
+        session = requests.Session()
+        session.verify = self._client_config.requests_verify
+        session.proxies = self._client_config.proxies
+        session.headers.update(self._headers)
+        session.timeout = 180
+        return session
+
     def _call(self, *args, **kwds):
         """
         most basic method to make a http call
@@ -66,7 +120,7 @@ class WebStorageClient(object):
         else:
             raise NotImplementedError("HTTP Method %s is not implemented" % method)
         if res.status_code < 500: # everything below 500 is acceptable
-            if res.status_code == 200:
+            if res.status_code in (200, 201): # 201 - existed already, like blocks put twice
                 return res
             if res.status_code == 401:
                 raise IOError("unauthorized to access %s" % r_args[0])
@@ -89,26 +143,28 @@ class WebStorageClient(object):
         url = "/".join((self._url, path))
         return self._call("DELETE", url)
 
-    def _get(self, path, params=None):
+    def _get(self, path, params=None, headers=None):
         """
         single point of request
         """
         url = "/".join((self._url, path))
-        return self._call("GET", url, params=params)
+        return self._call("GET", url, params=params, headers=headers)
 
-    def _put(self, path, data=None):
+    def _put(self, path, data=None, headers=None):
         """
         single point of request
         """
         url = "/".join((self._url, path))
-        return self._call("PUT", url, data=data)
+        if isinstance(data, (memoryview, bytearray)):
+            data = BufferReader(data)
+        return self._call("PUT", url, data=data, headers=headers)
 
-    def _post(self, path, data=None):
+    def _post(self, path, data=None, headers=None, stream=False):
         """
         single point of request
         """
         url = "/".join((self._url, path))
-        return self._call("POST", url, data=data)
+        return self._call("POST", url, data=data, headers=headers, stream=stream)
 
     def _get_json(self, path, params=None):
         """
@@ -124,6 +180,143 @@ class WebStorageClient(object):
         url = "/".join((self._url, path))
         return self._call("GET", url, params=params, stream=True)
 
+    def _iter_checksums(self, path="", params=None):
+        """
+        yield hex checksums of streamed listing as they arrive,
+        asking for binary 20 byte digests, json if the backend
+        does not support them
+        """
+        params = dict(params or {}, format="binary")
+        res = self._get_chunked(path, params=params)
+        if not res.headers.get("content-type", "").startswith("application/octet-stream"):
+            yield from res.json()
+            return
+        rest = b""
+        for chunk in res.iter_content(64 * 1024):
+            data = rest + chunk
+            end = len(data) - len(data) % 20
+            for index in range(0, end, 20):
+                yield data[index:index + 20].hex()
+            rest = data[end:]
+        if rest:
+            raise IOError("checksum listing truncated, %d bytes left over" % len(rest))
+
+    def get_epoch(self, epoch):
+        """
+        return blockchain data at epoch
+        """
+        return self._get_json("epoch/%d" % epoch)
+
+    def _sync_checksums(self):
+        """
+        load local cache of checksums in homepath, and append only the
+        epochs added to the backend since the last run
+
+        the blockchain of the cached and appended checksums is recalculated
+        and has to match blockchain_checksum of the backend, otherwise
+        the cachefile is deleted and fetched again from scratch, if this
+        fails too, the unverified listing of the backend is used
+
+        using: self._info
+        returning: checksums
+        """
+        for _ in range(2):
+            try:
+                return self._update_cachefile()
+            except (IOError, KeyError) as exc:
+                self._logger.error(exc)
+            self._info = self._get_json("info") # the backend could have moved on
+        self._logger.warning("using unverified list of checksums of backend, without local cache")
+        return set(self._iter_checksums())
+
+    def _update_cachefile(self):
+        """
+        bring cachefile up to the backend epoch, raise IOError if its
+        blockchain does not match, the cachefile is deleted then
+
+        returning: checksums
+        """
+        backend_epoch = self._info["blockchain_epoch"]
+        cachefile, cache_epoch = self._choose_cachefile(self._client_config.homepath, self._info["id"], backend_epoch)
+        checksums, sha256 = self._load_checksums(cachefile)
+        if cache_epoch > 1 and sha256 != self.get_epoch(cache_epoch)["sha256"]:
+            self._logger.error("cachefile %s does not match blockchain of backend, deleting file", cachefile)
+            os.unlink(cachefile)
+            cache_epoch = 1
+            checksums, sha256 = self._load_checksums(cachefile)
+        if cache_epoch < backend_epoch:
+            self._logger.info("updating cachefile %s from epoch %d to %d", cachefile, cache_epoch, backend_epoch)
+            sha256 = self._dump_checksums(cachefile, checksums, sha256, cache_epoch, backend_epoch)
+        if sha256 != self._info["blockchain_checksum"]:
+            os.unlink(cachefile)
+            raise IOError("checksums of backend do not match blockchain checksum %s, deleted cachefile %s" % (self._info["blockchain_checksum"], cachefile))
+        return checksums
+
+    def _chain(self, sha256, epoch, checksum):
+        """
+        return blockchain sha256 of checksum added at epoch, like the backend
+        """
+        return hashlib.sha256(("%d%s%s" % (epoch - 1, sha256, checksum)).encode("ascii")).hexdigest()
+
+    def _dump_checksums(self, cachefile, checksums, sha256, cache_epoch, backend_epoch):
+        """
+        append checksums of epochs after cache_epoch until backend_epoch
+        to cachefile and checksums
+
+        the checksum of epoch n is at index n - 2 of the listing,
+        epoch 1 is the seed
+        returning: sha256 of blockchain at backend_epoch
+        """
+        params = {"cursor" : cache_epoch - 1, "limit" : backend_epoch - cache_epoch}
+        with open(cachefile, "ab") as outfile:
+            for epoch, checksum in enumerate(self._iter_checksums("", params=params), cache_epoch + 1):
+                outfile.write(bytes.fromhex(checksum))
+                checksums.add(checksum)
+                sha256 = self._chain(sha256, epoch, checksum)
+        return sha256
+
+    def _load_checksums(self, cachefile):
+        """
+        loading list of checksums from locally stored binary blob
+
+        using: cachefile
+        returning: checksums, sha256 of blockchain at last cached epoch
+        """
+        checksums = set()
+        sha256 = self._info["blockchain_seed"]
+        if not os.path.isfile(cachefile):
+            return checksums, sha256
+        self._logger.info("using cachefile %s", cachefile)
+        with open(cachefile, "rb") as infile:
+            data = infile.read()
+        for epoch, index in enumerate(range(0, len(data), 20), 2):
+            checksum = data[index:index + 20].hex()
+            checksums.add(checksum)
+            sha256 = self._chain(sha256, epoch, checksum)
+        self._logger.info("loaded %d checksum from cache", len(checksums))
+        return checksums, sha256
+
+    def _choose_cachefile(self, directory, backend_id, backend_epoch):
+        """
+        try to find the best cachefile available, one per backend id
+        returning: cachefile, cachefile_epoch
+        """
+        cache_epoch = 1 # nothing cached, epoch 1 is the seed
+        absfilename = os.path.join(directory, "%s.bin" % backend_id)
+        self._logger.info("absfilename: %s", absfilename)
+        if os.path.isfile(absfilename):
+            size = os.stat(absfilename).st_size
+            if size % 20 != 0:
+                self._logger.error("cachefile %s is corrupted, deleting file", absfilename)
+                os.unlink(absfilename)
+            elif size // 20 + 1 > backend_epoch: # something wrong
+                self._logger.error("cachefile %s epoch is higher than backend epoch, deleting file", absfilename)
+                os.unlink(absfilename)
+            else:
+                cache_epoch = size // 20 + 1
+                self._logger.info("found checksum cache file until epoch %d", cache_epoch)
+        return absfilename, cache_epoch
+
     def _blockdigest(self, data):
         """
         single point of digesting return hexdigest of data
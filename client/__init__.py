@@ -7,4 +7,14 @@ from webstorageClient.WebStorageClient import WebStorageClient
 from webstorageClient.BlockStorageClient import BlockStorageClient
 from webstorageClient.BlockStorageClient import BlockStorageError
 from webstorageClient.FileStorageClient import FileStorageClient
+from webstorageClient.FileStorageClient import FileDigest
+from webstorageClient.Chunker import FixedChunker
+from webstorageClient.Chunker import GearChunker
+from webstorageClient.BlockPipeline import BlockPipeline
 from webstorageClient.WebStorageArchiveClient import WebStorageArchiveClient
+from webstorageClient.StatCache import StatCache
+from webstorageClient.TreeWalker import TreeWalker
+from webstorageClient.ExcludeMatcher import ExcludeMatcher
+from webstorageClient.SmallFilePacker import SmallFilePacker
+from webstorageClient.RestorePlanner import RestorePlanner
+from webstorageClient.RecipeReader import RecipeReader
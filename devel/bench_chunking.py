@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+benchmark fixed against content defined chunking
+
+builds a corpus of one base file and some edited versions of it
+(bytes inserted, deleted or overwritten at random offsets),
+then measures throughput and how many bytes of the edited versions
+are found as already existing blocks
+"""
+import os
+import io
+import time
+import random
+import hashlib
+import argparse
+# own modules
+from webstorageClient import Chunker
+
+
+def build_corpus(size, versions, seed=0):
+    """
+    return base data and list of edited versions
+    half random data, half text like data, to look like the real world
+    """
+    rnd = random.Random(seed)
+    words = [bytes(rnd.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(2, 10))) for _ in range(2000)]
+    parts = []
+    length = 0
+    while length < size:
+        if rnd.random() < 0.5:
+            part = rnd.getrandbits(8 * 65536).to_bytes(65536, "big")
+        else:
+            part = b" ".join(rnd.choice(words) for _ in range(12000))
+        parts.append(part)
+        length += len(part)
+    base = b"".join(parts)[:size]
+    edited = []
+    for _ in range(versions):
+        data = bytearray(base)
+        for _ in range(rnd.randint(1, 5)):
+            offset = rnd.randint(0, len(data) - 1)
+            action = rnd.choice(("insert", "delete", "overwrite"))
+            length = rnd.randint(1, 4096)
+            if action == "insert":
+                data[offset:offset] = os.urandom(length)
+            elif action == "delete":
+                del data[offset:offset + length]
+            else:
+                data[offset:offset + length] = os.urandom(length)
+        edited.append(bytes(data))
+    return base, edited
+
+def run(chunker, base, edited):
+    """
+    return MB/s and dedup ratio of edited versions against base
+    """
+    known = set()
+    total = 0
+    starttime = time.time()
+    for block in chunker.chunks(io.BytesIO(base)):
+        known.add(hashlib.sha1(block).digest())
+        total += len(block)
+    found = 0
+    size = 0
+    blocks = 0
+    for data in edited:
+        for block in chunker.chunks(io.BytesIO(data)):
+            digest = hashlib.sha1(block).digest()
+            if digest in known:
+                found += len(block)
+            size += len(block)
+            blocks += 1
+        total += len(data)
+    duration = time.time() - starttime
+    return total / duration / 1024 / 1024, found / size, size / blocks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark chunking methods")
+    parser.add_argument("--size", type=int, default=64, help="size of base file in MiB, default %(default)s")
+    parser.add_argument("--versions", type=int, default=8, help="number of edited versions, default %(default)s")
+    parser.add_argument("--blocksize", type=int, default=1024 * 1024, help="maximum blocksize, default %(default)s")
+    args = parser.parse_args()
+    base, edited = build_corpus(args.size * 1024 * 1024, args.versions)
+    chunkers = [("fixed", Chunker.FixedChunker(args.blocksize)), ("gear", Chunker.GearChunker(args.blocksize))]
+    if Chunker.numpy is not None:
+        python_chunker = Chunker.GearChunker(args.blocksize)
+        python_chunker._cut = python_chunker._cut_python
+        chunkers.append(("gear (no numpy)", python_chunker))
+    print("%-16s %10s %8s %12s" % ("method", "MB/s", "dedup", "avg block"))
+    for name, chunker in chunkers:
+        speed, ratio, avg_block = run(chunker, base, edited)
+        print("%-16s %10.1f %7.1f%% %12d" % (name, speed, ratio * 100, avg_block))
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+"""
+benchmark exclude matching of wstar, the old closure testing every
+substring pattern on its own against the compiled ExcludeMatcher
+
+patterns and paths are random but reproducible, some of the paths
+contain some of the patterns
+"""
+import re
+import time
+import random
+import argparse
+# own modules
+from webstorageClient.ExcludeMatcher import ExcludeMatcher
+
+WORDS = ["home", "user", "src", "lib", "python3", "site-packages", "node_modules", "cache", "build", "dist", "docs", "tmp", "var", "log", "data", "test", "include", "share", "local", "opt", "etc", "project", "backup", "mail", "photos"]
+
+
+def make_patterns(count, rnd):
+    patterns = set()
+    while len(patterns) < count:
+        patterns.add("/%s%d/" % (rnd.choice(WORDS), rnd.randint(0, 10 * count)))
+    return sorted(patterns)
+
+
+def make_paths(count, patterns, rnd, hit_ratio):
+    paths = []
+    for _ in range(count):
+        parts = ["%s%d" % (rnd.choice(WORDS), rnd.randint(0, 100000)) for _ in range(rnd.randint(3, 8))]
+        path = "/" + "/".join(parts) + ".dat"
+        if rnd.random() < hit_ratio:
+            position = path.find("/", 1)
+            path = path[:position] + rnd.choice(patterns) + path[position + 1:]
+        paths.append(path)
+    return paths
+
+
+def old_blacklist(patterns):
+    """
+    like create_blacklist before
+    """
+    def blacklist_func(filename):
+        return any((pattern in filename for pattern in patterns))
+    return blacklist_func
+
+
+def regex_blacklist(patterns):
+    """
+    one regex alternation of all patterns, for comparison
+    """
+    regex = re.compile("|".join(re.escape(pattern) for pattern in patterns))
+    return lambda filename: regex.search(filename) is not None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark exclude pattern matching")
+    parser.add_argument("--patterns", type=int, default=500, help="number of substring patterns, default %(default)s")
+    parser.add_argument("--paths", type=int, default=1000000, help="number of paths to match, default %(default)s")
+    parser.add_argument("--hit-ratio", type=float, default=0.05, help="ratio of paths containing a pattern, default %(default)s")
+    args = parser.parse_args()
+    rnd = random.Random(42)
+    patterns = make_patterns(args.patterns, rnd)
+    paths = make_paths(args.paths, patterns, rnd, args.hit_ratio)
+    starttime = time.time()
+    matcher = ExcludeMatcher(patterns)
+    print("compiled %d patterns in %0.3f s" % (len(patterns), time.time() - starttime))
+    results = None
+    for name, func in (("any substring", old_blacklist(patterns)), ("regex alternation", regex_blacklist(patterns)), ("ExcludeMatcher", matcher)):
+        starttime = time.time()
+        matched = [func(path) for path in paths]
+        duration = time.time() - starttime
+        if results is None:
+            results = matched
+        assert matched == results, "%s differs" % name
+        print("%-18s %8d excluded %8.2f s %10.0f paths/s" % (name, sum(matched), duration, len(paths) / duration))
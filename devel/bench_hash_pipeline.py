@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+benchmark hashing pipeline of FileStorageClient.put against thread count
+
+a local file is cut into blocks and every block goes through the same
+BlockPipeline FileStorageClient uses, the BlockStorage backend is replaced
+by a stub, which only hashes and optionally waits some latency
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+# own modules
+from webstorageClient.Chunker import FixedChunker
+from webstorageClient.BlockPipeline import BlockPipeline
+from webstorageClient.FileStorageClient import FileDigest
+
+
+class StubBlockStorage(object):
+    """answers like BlockStorageClient.put without any network"""
+
+    def __init__(self, latency=0.0):
+        self._latency = latency
+
+    def put(self, data, use_cache=False, hint=None):
+        checksum = hashlib.sha1(data).hexdigest()
+        if self._latency:
+            time.sleep(self._latency)
+        return checksum, 202
+
+
+def put_file(filename, blocksize, threads, identity, latency):
+    """
+    same loop as FileStorageClient.put, returns file checksum
+    """
+    stub = StubBlockStorage(latency)
+    chunker = FixedChunker(blocksize, readahead=threads)
+    filehash = FileDigest(identity)
+    with open(filename, "rb") as infile:
+        if threads > 1:
+            pipeline = BlockPipeline(stub.put, threads)
+            results = pipeline.run(chunker.chunks(infile), use_cache=True)
+        else:
+            results = ((data, stub.put(data)) for data in chunker.chunks(infile))
+        for data, (checksum, status) in results:
+            filehash.update(data, checksum)
+        if threads > 1:
+            pipeline.close()
+    return filehash.hexdigest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark block hashing pipeline")
+    parser.add_argument("--size", type=int, default=1024, help="size of test file in MiB, default %(default)s")
+    parser.add_argument("--blocksize", type=int, default=1024 * 1024, help="blocksize, default %(default)s")
+    parser.add_argument("--threads", default="1,2,4,8", help="comma separated thread counts, default %(default)s")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated backend latency per block in s, default %(default)s")
+    parser.add_argument("--file", help="use existing file instead of a temporary one")
+    args = parser.parse_args()
+    filename = args.file
+    if filename is None:
+        fd, filename = tempfile.mkstemp(prefix="bench_hash_pipeline")
+        with os.fdopen(fd, "wb") as outfile:
+            for _ in range(args.size):
+                outfile.write(os.urandom(1024 * 1024))
+    try:
+        size = os.stat(filename).st_size
+        print("%-10s %8s %10s" % ("identity", "threads", "GB/s"))
+        for identity in ("sha1", "blocklist"):
+            for threads in [int(value) for value in args.threads.split(",")]:
+                starttime = time.time()
+                put_file(filename, args.blocksize, threads, identity, args.latency)
+                duration = time.time() - starttime
+                print("%-10s %8d %10.2f" % (identity, threads, size / duration / 1e9))
+                sys.stdout.flush()
+    finally:
+        if args.file is None:
+            os.unlink(filename)
@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+"""
+benchmark size and parse time of recipes of large files, json against
+the binary recipe format, fixed chunking and content defined chunking
+with blocksizes
+
+no server needed, recipes are made up of random digests
+"""
+import os
+import json
+import time
+import random
+import argparse
+# own modules
+from webstorageClient import RecipeFormat
+
+
+def make_recipe(blocks, blocksizes):
+    rnd = random.Random(42)
+    recipe = {
+        "blockchain" : [os.urandom(20).hex() for _ in range(blocks)],
+        "chunking" : {"method" : "fixed", "blocksize" : 1024 * 1024},
+        "size" : blocks * 1024 * 1024,
+        "checksum" : os.urandom(20).hex(),
+        "mime_type" : "application/octet-stream",
+        "identity" : "blocklist",
+        "filehash_exists" : False,
+        "blockhash_exists" : 0,
+    }
+    if blocksizes:
+        recipe["chunking"] = {"method" : "gear", "min_size" : 256 * 1024, "avg_size" : 1024 * 1024, "max_size" : 1024 * 1024}
+        recipe["blocksizes"] = [rnd.randint(256 * 1024, 1024 * 1024) for _ in range(blocks)]
+        recipe["size"] = sum(recipe["blocksizes"])
+    return recipe
+
+
+def measure(func, repeat):
+    starttime = time.time()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.time() - starttime) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark recipe encodings")
+    parser.add_argument("--blocks", type=int, default=1000000, help="number of blocks in recipe, default %(default)s")
+    parser.add_argument("--repeat", type=int, default=3, help="repeat every measurement, default %(default)s")
+    args = parser.parse_args()
+    for blocksizes in (False, True):
+        recipe = make_recipe(args.blocks, blocksizes)
+        json_data = json.dumps(recipe).encode("utf-8")
+        binary_data = RecipeFormat.encode(recipe)
+        _, json_duration = measure(lambda: json.loads(json_data.decode("utf-8")), args.repeat)
+        parsed, binary_duration = measure(lambda: RecipeFormat.decode(binary_data), args.repeat)
+        assert list(parsed["blockchain"]) == recipe["blockchain"]
+        print("%-6s json %10d bytes %7.3f s   binary %10d bytes %7.3f s   ratio %0.2f" % ("gear" if blocksizes else "fixed", len(json_data), json_duration, len(binary_data), binary_duration, len(binary_data) / len(json_data)))
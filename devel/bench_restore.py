@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""
+benchmark restore of many files sharing blocks, file by file like
+wstar did before against RestorePlanner with different thread counts
+
+FileStorage and BlockStorage are replaced by local stubs, which serve
+recipes and blocks from memory and wait some latency per request,
+so the number of requests dominates like with a real server
+"""
+import os
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+# own modules
+from webstorageClient.RestorePlanner import RestorePlanner
+
+
+class StubBlockStorage(object):
+    """answers like BlockStorageClient.get without any network"""
+
+    def __init__(self, blocks, latency):
+        self._blocks = blocks
+        self._latency = latency
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def clone(self):
+        return self
+
+    def zero_length(self, checksum):
+        return None
+
+    def get(self, checksum):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self._latency)
+        return self._blocks[checksum]
+
+
+class StubFileStorage(object):
+    """answers like FileStorageClient without any network"""
+
+    def __init__(self, recipes, blocks, latency):
+        self._recipes = recipes
+        self._latency = latency
+        self.blockstorage = StubBlockStorage(blocks, latency)
+
+    def clone(self):
+        return self
+
+    def get(self, checksum):
+        time.sleep(self._latency)
+        return self._recipes[checksum]
+
+    def get_many(self, checksums, batch_size=1000):
+        time.sleep(self._latency)
+        for checksum in checksums:
+            yield checksum, self._recipes.get(checksum)
+
+    def read(self, checksum):
+        for block in self.get(checksum)["blockchain"]:
+            yield self.blockstorage.get(block)
+
+    @staticmethod
+    def block_lengths(recipe):
+        return [len(block) for block in recipe["blocks"]]
+
+    def blocks(self, recipe):
+        return zip(recipe["blockchain"], self.block_lengths(recipe))
+
+
+def make_data(files, pool, blocks_per_file, blocksize):
+    """
+    files consisting of random blocks out of a pool of unique blocks
+    """
+    rnd = random.Random(42)
+    pool_data = [bytes(rnd.getrandbits(8) for _ in range(64)) * (blocksize // 64) for _ in range(pool)]
+    blocks = {hashlib.sha1(data).hexdigest(): data for data in pool_data}
+    checksums = list(blocks)
+    recipes = {}
+    for index in range(files):
+        chain = [rnd.choice(checksums) for _ in range(blocks_per_file)]
+        checksum = hashlib.sha1(("%d" % index).encode("ascii")).hexdigest()
+        recipes[checksum] = {"blockchain" : chain, "size" : blocksize * blocks_per_file, "blocks" : [blocks[block] for block in chain]}
+    return recipes, blocks
+
+
+def restore_sequential(filestorage, recipes, targetdir):
+    for index, checksum in enumerate(recipes):
+        with open(os.path.join(targetdir, "%d.dat" % index), "wb") as outfile:
+            for block in filestorage.read(checksum):
+                outfile.write(block)
+
+
+def restore_planner(filestorage, recipes, targetdir, threads):
+    planner = RestorePlanner(filestorage, threads=threads)
+    for index, checksum in enumerate(recipes):
+        planner.add(os.path.join(targetdir, "%d.dat" % index), checksum)
+    planner.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark multi file restore")
+    parser.add_argument("--files", type=int, default=2000, help="number of files, default %(default)s")
+    parser.add_argument("--pool", type=int, default=200, help="number of unique blocks, default %(default)s")
+    parser.add_argument("--blocks-per-file", type=int, default=4, help="blocks per file, default %(default)s")
+    parser.add_argument("--blocksize", type=int, default=64 * 1024, help="blocksize, default %(default)s")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated latency per request in s, default %(default)s")
+    parser.add_argument("--threads", default="1,4,16", help="comma separated thread counts, default %(default)s")
+    args = parser.parse_args()
+    recipes, blocks = make_data(args.files, args.pool, args.blocks_per_file, args.blocksize)
+    candidates = [("file by file", lambda fs, target: restore_sequential(fs, recipes, target))]
+    for threads in (int(value) for value in args.threads.split(",")):
+        candidates.append(("RestorePlanner threads=%d" % threads, lambda fs, target, threads=threads: restore_planner(fs, recipes, target, threads)))
+    for name, func in candidates:
+        filestorage = StubFileStorage(recipes, blocks, args.latency)
+        with tempfile.TemporaryDirectory() as targetdir:
+            starttime = time.time()
+            func(filestorage, targetdir)
+            duration = time.time() - starttime
+        size = args.files * args.blocks_per_file * args.blocksize
+        print("%-28s %6d block requests %8.2f s %8.1f MB/s" % (name, filestorage.blockstorage.requests, duration, size / duration / 1000000))
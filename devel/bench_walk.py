@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""
+benchmark tree walking for wstar, os.walk with isfile and stat per file,
+like wstar did before, against TreeWalker with different thread counts
+
+a synthetic tree of empty files is created once in --path and reused,
+for 5M files use a filesystem with enough inodes, and drop the page cache
+between runs (echo 3 > /proc/sys/vm/drop_caches) to measure cold walks
+"""
+import os
+import sys
+import time
+import argparse
+# own modules
+from webstorageClient.TreeWalker import TreeWalker
+
+
+def make_tree(path, files, fanout):
+    """
+    create files empty files in directories with fanout entries each
+    """
+    marker = os.path.join(path, ".complete_%d_%d" % (files, fanout))
+    if os.path.isfile(marker):
+        return
+    print("creating %d files in %s" % (files, path))
+    for index in range(files):
+        dirname = os.path.join(path, *("%03d" % (index // fanout ** level % fanout) for level in range(3, 0, -1)))
+        if index % fanout == 0:
+            os.makedirs(dirname, exist_ok=True)
+        with open(os.path.join(dirname, "%d.dat" % index), "wb"):
+            pass
+    with open(marker, "wb"):
+        pass
+
+
+def walk_os(path):
+    """
+    the old way, three syscalls per file
+    """
+    count = 0
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            absfilename = os.path.join(root, filename)
+            if not os.path.isfile(absfilename):
+                continue
+            os.stat(absfilename)
+            count += 1
+    return count
+
+
+def walk_scandir(path, threads):
+    count = 0
+    for _ in TreeWalker(threads=threads).walk(path):
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark tree walking")
+    parser.add_argument("--path", required=True, help="directory to create synthetic tree in")
+    parser.add_argument("--files", type=int, default=5000000, help="number of files in tree, default %(default)s")
+    parser.add_argument("--fanout", type=int, default=100, help="entries per directory, default %(default)s")
+    parser.add_argument("--threads", default="1,2,4,8", help="comma separated thread counts, default %(default)s")
+    args = parser.parse_args()
+    make_tree(args.path, args.files, args.fanout)
+    candidates = [("os.walk+isfile+stat", lambda: walk_os(args.path))]
+    for threads in (int(value) for value in args.threads.split(",")):
+        candidates.append(("TreeWalker threads=%d" % threads, lambda threads=threads: walk_scandir(args.path, threads)))
+    for name, func in candidates:
+        starttime = time.time()
+        count = func()
+        duration = time.time() - starttime
+        print("%-24s %9d files %8.2f s %10.0f files/s" % (name, count, duration, count / duration))
+        sys.stdout.flush()
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+benchmark allocations of the upload read path
+
+compares reading every block into a new bytes object with reading into
+a ring of preallocated buffers and with mmap, every block is hashed and
+sent through BufferReader like WebStorageClient._put does, to a stub
+reading the body in 16 KiB pieces like urllib3
+
+every mode runs in its own subprocess to get a clean maximum RSS,
+churn is the sum over all blocks of bytes allocated while processing the block,
+with mmap the RSS contains the mapped page cache of the file
+"""
+import os
+import sys
+import time
+import json
+import hashlib
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+# own modules
+from webstorageClient.Chunker import FixedChunker
+from webstorageClient.WebStorageClient import BufferReader
+
+MODES = {
+    "read" : {"buffers" : 0},
+    "readinto" : {"buffers" : 2},
+    "mmap" : {"use_mmap" : True},
+}
+
+def send(data):
+    """
+    stub of http layer, consume body in pieces
+    """
+    if isinstance(data, (memoryview, bytearray)):
+        data = BufferReader(data)
+    if isinstance(data, bytes):
+        return len(data) # sent as it is
+    length = 0
+    piece = data.read(16384)
+    while piece:
+        length += len(piece)
+        piece = data.read(16384)
+    return length
+
+def run_mode(filename, blocksize, mode):
+    """
+    put every block of filename, return statistics
+    throughput is measured in a first run without tracemalloc
+    """
+    chunker = FixedChunker(blocksize, **MODES[mode])
+    size = 0
+    starttime = time.time()
+    with open(filename, "rb") as infile:
+        for data in chunker.chunks(infile):
+            hashlib.sha1(data).hexdigest()
+            size += send(data)
+    speed = size / (time.time() - starttime)
+    del data
+    tracemalloc.start()
+    churn = 0
+    with open(filename, "rb") as infile:
+        blocks = chunker.chunks(infile)
+        while True:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            data = next(blocks, None)
+            if data is None:
+                break
+            hashlib.sha1(data).hexdigest()
+            send(data)
+            churn += tracemalloc.get_traced_memory()[1] - current
+            del data
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "mode" : mode,
+        "MB/s" : speed / 1e6,
+        "churn MiB" : churn / 1024 / 1024,
+        "peak MiB" : peak / 1024 / 1024,
+        "maxrss MiB" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark allocations of upload read path")
+    parser.add_argument("--size", type=int, default=512, help="size of test file in MiB, default %(default)s")
+    parser.add_argument("--blocksize", type=int, default=1024 * 1024, help="blocksize, default %(default)s")
+    parser.add_argument("--file", help="use existing file instead of a temporary one")
+    parser.add_argument("--mode", choices=list(MODES.keys()), help="run only this mode, used internally")
+    args = parser.parse_args()
+    if args.mode is not None:
+        print(json.dumps(run_mode(args.file, args.blocksize, args.mode)))
+        sys.exit(0)
+    filename = args.file
+    if filename is None:
+        fd, filename = tempfile.mkstemp(prefix="bench_zero_copy")
+        with os.fdopen(fd, "wb") as outfile:
+            for _ in range(args.size):
+                outfile.write(os.urandom(1024 * 1024))
+    try:
+        print("%-10s %10s %12s %10s %12s" % ("mode", "MB/s", "churn MiB", "peak MiB", "maxrss MiB"))
+        for mode in MODES:
+            output = subprocess.check_output([sys.executable, __file__, "--mode", mode, "--file", filename, "--blocksize", str(args.blocksize)])
+            result = json.loads(output.decode("utf-8"))
+            print("%(mode)-10s %(MB/s)10.1f %(churn MiB)12.1f %(peak MiB)10.1f %(maxrss MiB)12.1f" % result)
+    finally:
+        if args.file is None:
+            os.unlink(filename)
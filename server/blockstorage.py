@@ -9,8 +9,11 @@ import hashlib
 import io
 import json
 import time
+import zlib
+import lzma
 import sqlite3
 import logging
+import threading
 logging.basicConfig(level=logging.INFO)
 try:
     import mod_wsgi
@@ -23,11 +26,20 @@ from flask import Flask, request, send_file, send_from_directory, Response
 # own modules
 sys.path.append("/opt/webstorage/server") #TODO: remove ugly hack
 from blockchain import BlockChain
+import checksumlisting
 
 app = Flask(__name__)
 bc = BlockChain()
+checksums_lock = threading.Lock() # add to blockchain and list in RAM in the same order
 logger = logging.getLogger(name)
 
+# available codecs for block compression at rest
+# name : (http content-encoding and file suffix, compress function, decompress function)
+CODECS = {
+    "zlib" : ("deflate", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma" : ("xz", lambda data: lzma.compress(data, preset=1), lzma.decompress),
+}
+
 def xapikey(func):
     """
     decorator to check for existance and validity of X-APIKEY header
@@ -78,6 +90,7 @@ def info():
             "blockchain_epoch" : blockchain["epoch"], # blockchain epoch
             "blockchain_checksum" : blockchain["sha256_checksum"], # last blockchain hash
             "blockchain_seed" : app.config["blockchain_seed"], # initial seed used
+            "compression" : (app.config.get("compression") or {}).get("codecs", []), # codecs used at rest
             }),
         status=200,
         mimetype="application/json"
@@ -93,13 +106,14 @@ def get_meta():
     """
     def generator():
         for checksum in app.config["checksums"]:
-            filename = _get_filename(checksum)
+            filename, encoding = _find_block(checksum)
             stat = os.stat(filename)
             data = {
                 "filename" : checksum,
                 "st_size" : stat.st_size,
                 "st_mtime" : stat.st_mtime,
-                "st_ctime" : stat.st_ctime
+                "st_ctime" : stat.st_ctime,
+                "encoding" : encoding, # None if stored uncompressed
             }
             yield json.dumps(data) + "\n"
     return Response(generator(), mimetype="text/html")
@@ -135,11 +149,9 @@ def get_stream():
     def generator():
         length = 0
         for checksum in data["blockchain"]:
-            filename = _get_filename(checksum)
-            with open(filename, "rb") as infile:
-                bin_data = infile.read()
-                yield bin_data
-                length += len(bin_data)
+            bin_data = _read_block(checksum)
+            yield bin_data
+            length += len(bin_data)
         logger.info("streamed %d blocks containing %d bytes", len(data["blockchain"]), length)
         logger.info("size in request was %s", data["size"])
     return Response(generator(), mimetype=mimetype)
@@ -154,32 +166,17 @@ def get_checksums_stream(epoch=2):
     epoch to indicate from wich epoch number the cecksums should be delivered
     epoch = 2 means start (lowest rowid is 1, and first epoch is seed)
     """
-    mimetype = "application/octet-stream"
-    blocklength = 512
     start = max(0, epoch-2)
-    end = len(app.config["checksums"])
-    def generator():
-        for index in range(start, end, blocklength):
-            byte_buffer = b""
-            for checksum in app.config["checksums"][index:min(index+blocklength, end)]:
-                byte_buffer += int(checksum, 16).to_bytes(20, "big")
-            yield byte_buffer
-    return Response(generator(), mimetype=mimetype)
+    return checksumlisting.stream(request, app.config["checksums"], start, binary=True)
 
 @app.route('/', methods=["GET"])
 @xapikey
 def get_checksums():
     """
-    if no argument is given return a list of available blockchecksums
+    if no argument is given return a list of available blockchecksums,
+    streamed in chunks, see checksumlisting.listing for parameters
     """
-    starttime = time.time()
-    response = app.response_class(
-        response=json.dumps(app.config["checksums"]), # TODO: this could use much memory
-        status=200,
-        mimetype='application/json'
-    )
-    logger.info("response prepared in %0.2f" % (time.time() - starttime))
-    return response
+    return checksumlisting.listing(request, app.config["checksums"])
 
 @app.route('/journal/<int:epoch>', methods=["GET"])
 @xapikey
@@ -228,13 +225,23 @@ def get_checksum(checksum):
     """
     send binary block with checksum to client
     mimetype is always set to application/octet-stream
+
+    compressed stored blocks are sent as they are with Content-Encoding set,
+    if the client accepts this encoding, otherwise decompressed on the fly
     """
-    filename = _get_filename(checksum)
-    if os.path.isfile(filename):
-        return send_from_directory(app.config["storage_dir"], "%s.bin" % checksum, mimetype="application/octet-stream")
-    else:
-        logger.error("File %s does not exist", filename)
+    filename, encoding = _find_block(checksum)
+    if filename is None:
+        logger.error("File %s does not exist", _get_filename(checksum))
         return "checksum not found", 404
+    if encoding is None:
+        return send_from_directory(app.config["storage_dir"], os.path.basename(filename), mimetype="application/octet-stream")
+    if encoding in request.accept_encodings:
+        response = send_from_directory(app.config["storage_dir"], os.path.basename(filename), mimetype="application/octet-stream")
+        response.headers["Content-Encoding"] = encoding
+    else:
+        response = app.response_class(_read_block(checksum), status=200, mimetype="application/octet-stream")
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 @app.route('/<checksum>', methods=["PUT"])
 @xapikey
@@ -248,8 +255,24 @@ def put_checksum(checksum):
     returns 201 if this was update
 
     returns checksum of stored data
+
+    data could be sent compressed with Content-Encoding: deflate,
+    the checksum is always the one of the uncompressed data
     """
     data = request.data
+    encoded = None
+    if request.headers.get("content-encoding") == "deflate":
+        encoded = data
+        try:
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(encoded, int(app.config["blocksize"]) + 1)
+        except zlib.error as exc:
+            logger.error(exc)
+            return "Bad Request: deflate data corrupt", 400
+        if decompressor.unconsumed_tail:
+            return "data too long", 501
+        if not decompressor.eof:
+            return "Bad Request: deflate data incomplete", 400
     if len(data) > int(app.config["blocksize"]):
         return "data too long", 501
     if len(data) > 0:
@@ -257,16 +280,18 @@ def put_checksum(checksum):
         digest.update(data)
         own_checksum = digest.hexdigest()
         if own_checksum == checksum:
-            filename = _get_filename(checksum)
-            if not os.path.isfile(filename):
-                with open(filename, "wb") as outfile:
-                    outfile.write(data) # store on disk
-                    bc.add(checksum) # store in db
-                    app.config["checksums"].append(checksum) # store in RAM
-                    return checksum, 200 # TODO: think about returning epoch and last hash
-            else:
-                logger.info("block %s already exists", filename)
-                return checksum, 201
+            filename, encoding = _find_block(checksum)
+            if filename is None:
+                encoding, stored = _compress_block(checksum, data, encoded) # outside of lock, takes time
+                with checksums_lock: # no second epoch for the same block
+                    filename, _ = _find_block(checksum)
+                    if filename is None: # not stored by another request meanwhile
+                        _store_block(checksum, encoding, stored) # store on disk
+                        bc.add(checksum) # store in db
+                        app.config["checksums"].append(checksum) # store in RAM
+                        return checksum, 200 # TODO: think about returning epoch and last hash
+            logger.info("block %s already exists", filename)
+            return checksum, 201
         else:
             return "checksum mismatch", 500
     else:
@@ -284,23 +309,100 @@ def options(checksum):
 
     either raise 404
     """
-    if checksum in app.config["checksums"] or os.path.exists(_get_filename(checksum)):
+    if checksum in app.config["checksums"] or _find_block(checksum)[0] is not None:
         return "checksum exists", 200
     return "checksum not found", 404
 
 ################# private functions ##############################
 
-def _get_filename(checksum):
+def _get_filename(checksum, encoding=None):
     """
     build and return absolute filpath
 
     params:
     checksum <basestring>
+    encoding <basestring> content-encoding of compressed block or None
 
     ret:
     <basestring>
     """
-    return os.path.join(app.config["storage_dir"], "%s.bin" % checksum)
+    if encoding is None:
+        return os.path.join(app.config["storage_dir"], "%s.bin" % checksum)
+    return os.path.join(app.config["storage_dir"], "%s.%s" % (checksum, encoding))
+
+def _find_block(checksum):
+    """
+    search stored block, either uncompressed or with any known encoding
+
+    ret:
+    <tuple> (filename, encoding) or (None, None) if not found
+    """
+    filename = _get_filename(checksum)
+    if os.path.isfile(filename):
+        return filename, None
+    for encoding, _, _ in CODECS.values():
+        filename = _get_filename(checksum, encoding)
+        if os.path.isfile(filename):
+            return filename, encoding
+    return None, None
+
+def _read_block(checksum):
+    """
+    return uncompressed data of stored block
+    """
+    filename, encoding = _find_block(checksum)
+    with open(filename, "rb") as infile:
+        data = infile.read()
+    if encoding is not None:
+        decompress = [codec[2] for codec in CODECS.values() if codec[0] == encoding][0]
+        data = decompress(data)
+    return data
+
+def _compress_block(checksum, data, deflated=None):
+    """
+    compress block with the best configured codec
+    if the saving is at least compression.min_saving, otherwise uncompressed
+
+    the first codec configured is used as probe, if this one does not gain
+    enough, data is regarded as incompressible and the others are not tried
+
+    deflated ... data as received with Content-Encoding: deflate, stored as is
+    if zlib is the first configured codec and it gains enough
+
+    ret:
+    <tuple> (encoding or None, data to store)
+    """
+    best_encoding = None
+    best_data = data
+    compression = app.config.get("compression")
+    if compression:
+        max_length = len(data) * (1.0 - compression.get("min_saving", 0.1))
+        codecs = compression["codecs"]
+        if deflated is not None and codecs[0] == "zlib" and len(deflated) <= max_length:
+            # client has already done the probe, no need to compress again
+            best_encoding = "deflate"
+            best_data = deflated
+            codecs = codecs[1:]
+        for codec in codecs:
+            encoding, compress, _ = CODECS[codec]
+            compressed = compress(data)
+            if len(compressed) > max_length:
+                if best_encoding is None:
+                    break # probe codec did not gain enough
+                continue
+            if len(compressed) < len(best_data):
+                best_encoding = encoding
+                best_data = compressed
+    if best_encoding is not None:
+        logger.debug("storing block %s %s compressed %d/%d bytes", checksum, best_encoding, len(best_data), len(data))
+    return best_encoding, best_data
+
+def _store_block(checksum, encoding, data):
+    """
+    write block data, encoded as returned by _compress_block, to disk
+    """
+    with open(_get_filename(checksum, encoding), "wb") as outfile:
+        outfile.write(data)
 
 def _get_config(config_filename):
     """
@@ -317,6 +419,10 @@ def _get_config(config_filename):
         config["maxlength"] = 40 # lenght of sha1 checksum
     else:
         raise Exception("Config Error only sha1 checksums are implemented yet")
+    if config.get("compression"):
+        for codec in config["compression"]["codecs"]:
+            if codec not in CODECS:
+                raise Exception("Config Error unknown compression codec %s, use one of %s" % (codec, list(CODECS.keys())))
     return config
 
 def _get_checksums(storage_dir):
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+streamed listing of stored checksums, used by BlockStorage and FileStorage
+
+the list of checksums is never serialized as a whole, it is sent in
+chunks of CHUNK_SIZE checksums, as json array or binary 20 byte digests,
+gzip compressed on the fly if the client accepts it
+
+the list is append only, so an index is a stable cursor for pagination
+"""
+import zlib
+# non-stdlib
+from flask import Response
+
+CHUNK_SIZE = 4096 # checksums per chunk of response
+BINARY_MIME_TYPE = "application/octet-stream"
+
+
+def json_chunks(checksums, start, end):
+    """
+    yield json array of checksums[start:end] in chunks
+    """
+    yield "["
+    for index in range(start, end, CHUNK_SIZE):
+        chunk = ", ".join('"%s"' % checksum for checksum in checksums[index:min(index + CHUNK_SIZE, end)])
+        yield chunk if index == start else ", " + chunk
+    yield "]"
+
+def binary_chunks(checksums, start, end):
+    """
+    yield binary digests of checksums[start:end] in chunks
+    """
+    for index in range(start, end, CHUNK_SIZE):
+        yield b"".join(bytes.fromhex(checksum) for checksum in checksums[index:min(index + CHUNK_SIZE, end)])
+
+def gzip_chunks(chunks):
+    """
+    yield chunks gzip compressed
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream(request, checksums, start=0, binary=False, end=None):
+    """
+    return streamed response of checksums[start:end],
+    gzip compressed if accepted by client
+    """
+    if end is None:
+        end = len(checksums) # appended later are not part of this response
+    chunks = binary_chunks(checksums, start, end) if binary else json_chunks(checksums, start, end)
+    headers = {}
+    if request.accept_encodings["gzip"]:
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_chunks(chunks)
+    return Response(chunks, mimetype=BINARY_MIME_TYPE if binary else "application/json", headers=headers)
+
+def listing(request, checksums):
+    """
+    return response for GET /, parameters of request
+
+    cursor ... start at this index, default 0
+    limit ... at most this number of checksums, default all
+    format ... json or binary, default json
+
+    the index to continue with is in header X-Next-Cursor, if there are more
+    """
+    try:
+        cursor = int(request.args.get("cursor", 0))
+        limit = int(request.args.get("limit", 0))
+    except ValueError:
+        return "Bad Request: cursor and limit have to be integer", 400
+    if request.args.get("format", "json") not in ("json", "binary"):
+        return "Bad Request: format has to be json or binary", 400
+    total = len(checksums)
+    cursor = min(max(cursor, 0), total)
+    end = min(cursor + limit, total) if limit > 0 else total
+    response = stream(request, checksums, cursor, request.args.get("format") == "binary", end)
+    response.headers["X-Total-Count"] = str(total)
+    if end < total:
+        response.headers["X-Next-Cursor"] = str(end)
+    return response
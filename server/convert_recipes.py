@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+copy all recipes of FileStorage to another recipe store, like from
+one file per recipe to sqlite, optionally changing the recipe format
+
+FileStorage should be stopped while converting, afterwards set
+recipe_store, recipe_db and recipe_format in filestorage.yaml,
+the source store is left as it is
+"""
+import os
+import sys
+import json
+import time
+import logging
+logging.basicConfig(level=logging.INFO)
+import argparse
+# non-stdlib
+import yaml
+# own modules
+sys.path.append("/opt/webstorage/server") #TODO: remove ugly hack
+import recipeformat
+import recipestore
+
+
+def convert(data, recipe_format=None):
+    """
+    return data in recipe_format and True if this is binary,
+    data is not changed if recipe_format is None
+    """
+    binary = recipeformat.is_binary(data)
+    if recipe_format == "binary" and not binary:
+        return recipeformat.encode(json.loads(data.decode("utf-8"))), True
+    if recipe_format == "json" and binary:
+        return json.dumps(recipeformat.decode(data)).encode("utf-8"), False
+    return data, binary
+
+def batches(source, recipe_format, size=1000):
+    """
+    yield lists of checksum, data, binary of all recipes in source
+    """
+    batch = []
+    for checksum in source.checksums():
+        batch.append((checksum,) + convert(source.get(checksum), recipe_format))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="copy recipes of FileStorage to another recipe store")
+    parser.add_argument("root", help="directory of filestorage.yaml")
+    parser.add_argument("--to", dest="recipe_store", choices=("files", "sqlite"), required=True, help="recipe store to copy to")
+    parser.add_argument("--recipe-db", help="sqlite database to copy to, default recipes.db in storage_dir")
+    parser.add_argument("--storage-dir", help="directory to copy to for store files, default storage_dir")
+    parser.add_argument("--recipe-format", choices=("json", "binary"), help="convert recipes to this format, default keep format")
+    args = parser.parse_args()
+    with open(os.path.join(args.root, "filestorage.yaml"), "rt") as infile:
+        config = yaml.safe_load(infile)
+    config.setdefault("recipe_store", "files")
+    target_config = dict(config, recipe_store=args.recipe_store)
+    if args.recipe_db:
+        target_config["recipe_db"] = args.recipe_db
+    if args.storage_dir:
+        target_config["storage_dir"] = args.storage_dir
+        if not os.path.isdir(args.storage_dir):
+            os.makedirs(args.storage_dir)
+    if args.recipe_format is None and all(config.get(key) == target_config.get(key) for key in ("recipe_store", "recipe_db", "storage_dir")):
+        logging.error("source and target recipe store are the same, nothing to do")
+        sys.exit(1)
+    source = recipestore.get_store(config)
+    target = recipestore.get_store(target_config)
+    count = 0
+    starttime = time.time()
+    for batch in batches(source, args.recipe_format):
+        target.put_many(batch)
+        count += len(batch)
+        logging.info("copied %d recipes, %0.1f recipes/s", count, count / (time.time() - starttime))
+    logging.info("copied %d recipes in %0.2f s, now set recipe_store: %s in filestorage.yaml", count, time.time() - starttime, args.recipe_store)
@@ -5,9 +5,11 @@ Webapp to store recipes for files chunked in blocks and stored in BlockStorage
 import os
 import sys
 import json
+import base64
 import hashlib
 import sqlite3
 import logging
+import threading
 logging.basicConfig(level=logging.INFO)
 try:
     import mod_wsgi
@@ -20,9 +22,14 @@ from flask import Flask, request, send_file, send_from_directory, Response
 # own modules
 sys.path.append("/opt/webstorage/server") #TODO: remove ugly hack
 from blockchain import BlockChain
+import recipeformat
+import checksumlisting
+import recipestore
 
 app = Flask(__name__)
 bc = BlockChain()
+RECIPE_VERSION = 2 # highest recipe version known, 2 ... inline or pages
+checksums_lock = threading.Lock() # add to blockchain and list in RAM in the same order
 logger = logging.getLogger(name)
 
 def xapikey(func):
@@ -73,6 +80,8 @@ def info():
             "blockchain_epoch" : blockchain["epoch"], # blockchain epoch
             "blockchain_checksum" : blockchain["sha256_checksum"], # last blockchain hash
             "blockchain_seed" : app.config["blockchain_seed"], # initial seed used
+            "recipe_formats" : ["json", "binary"], # accepted and served recipe formats
+            "bulk" : True, # bulk/get and bulk/put available
             }),
         status=200,
         mimetype="application/json"
@@ -84,71 +93,97 @@ def download(file_checksum):
     """
     return full data stream of file specified by checksum
     """
-    if os.path.isfile(_get_filename(file_checksum)):
+    stored = app.config["store"].get(file_checksum)
+    if stored is not None:
         logger.info("found file with checksum %s", file_checksum)
         # omit Content-Length
         # disable compression of apache or other webservers
-        with open(_get_filename(file_checksum), "rt") as infile:
-            data = json.load(infile)
-            bsc = BlockStorageClient(cache=False)
-            total_size = 0
-            if len(data["blockchain"]) == 1:
-                total_size = len(bsc.get(data["blockchain"][0]))
-            else:
-                total_size = bsc.blocksize * (len(data["blockchain"]) - 1) + len(bsc.get(data["blockchain"][-1]))
-            # web.header('Content-Length', total_size)
-            logger.info("returning %d blocks, total_length=%d", len(data["blockchain"]), total_size)
-            for block_checksum in data["blockchain"]:
-                # goto : https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Transfer-Encoding
-                block = bsc.get(block_checksum)
-                # web.header('Content-Length', str(len(block)))
-                logger.info("yielding block %s", block_checksum)
-                prefix = "%x\r\n" % len(block)
-                yield prefix + block + "\r\n"
-            # sending end of stream information
-            yield "0\r\n" + "\r\n"
+        data = _load_recipe(stored)
+        bsc = BlockStorageClient(cache=False)
+        total_size = 0
+        if len(data["blockchain"]) == 1:
+            total_size = len(bsc.get(data["blockchain"][0]))
+        else:
+            total_size = bsc.blocksize * (len(data["blockchain"]) - 1) + len(bsc.get(data["blockchain"][-1]))
+        # web.header('Content-Length', total_size)
+        logger.info("returning %d blocks, total_length=%d", len(data["blockchain"]), total_size)
+        for block_checksum in data["blockchain"]:
+            # goto : https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Transfer-Encoding
+            block = bsc.get(block_checksum)
+            # web.header('Content-Length', str(len(block)))
+            logger.info("yielding block %s", block_checksum)
+            prefix = "%x\r\n" % len(block)
+            yield prefix + block + "\r\n"
+        # sending end of stream information
+        yield "0\r\n" + "\r\n"
     else:
-        logger.error("File with checksum %s does not exist", _get_filename(checksum))
+        logger.error("File with checksum %s does not exist", file_checksum)
         return "not found", 404
 
 @app.route("/", methods=["GET"])
 def get_checksums():
     """
-    get block stored in blockstorage directory with hash
+    list checksums of stored recipes, streamed in chunks
 
-    GOOD : 200 : get metadata stored in file, json formatted
-    BAD  : 404 : not found
-    UGLY : decorator
+    cursor, limit ... paginate, next cursor in header X-Next-Cursor
+    format ... json or binary 20 byte digests
+    compressed with gzip if accepted by client
+    """
+    return checksumlisting.listing(request, app.config["checksums"])
+
+@app.route("/epoch/<int:epoch>", methods=["GET"])
+def get_epoch(epoch):
     """
-    # no checksum given, do ls style
+    return epoch information, like checksum added, and blockchain checksum
+
+    GOOD : 200 : epoch, checksum and sha256, json formatted
+    BAD  : 404 : epoch not found
+    """
+    res = bc.epoch(epoch)
+    if res is None or res[1] is None: # epoch 1 is the seed
+        return "epoch not found", 404
     response = app.response_class(
-        json.dumps(app.config["checksums"]),
+        json.dumps({
+            "epoch" : res[0],
+            "checksum" : res[1].decode("ascii"),
+            "sha256" : res[2].decode("ascii"),
+        }),
         status=200,
         mimetype="application/json"
     )
     return response
 
-@app.route("/<checksum>", methods=["GET"])
+@app.route("/<checksum>", methods=["GET"], provide_automatic_options=False)
 def get_checksum(checksum):
     """
     get block stored in blockstorage directory with hash
 
-    GOOD : 200 : get metadata stored in file, json formatted
+    GOOD : 200 : get metadata stored in file, json formatted,
+                 binary if preferred by Accept header of client
     BAD  : 404 : not found
     UGLY : decorator
     """
-    filename = _get_filename(checksum) 
-    if os.path.isfile(filename):
-        with open(filename, "rt") as infile:
-            response = app.response_class(
-                infile.read(),
-                status=200,
-                mimetype="application/json"
-            )
-            return response
-    else:
-        logger.error("File %s does not exist", filename)
+    data = app.config["store"].get(checksum)
+    if data is None:
+        logger.error("recipe %s does not exist", checksum)
         return "not found", 404
+    # binary only if client prefers it, json for all others
+    binary = request.accept_mimetypes[recipeformat.MIME_TYPE] > request.accept_mimetypes["application/json"]
+    if binary and not recipeformat.is_binary(data):
+        metadata = _load_recipe(data)
+        binary = _check_shape(metadata) is None # json stored before validation could be not encodable
+        if binary:
+            data = recipeformat.encode(metadata)
+    if not binary and recipeformat.is_binary(data):
+        data = json.dumps(recipeformat.decode(data))
+    mimetype = recipeformat.MIME_TYPE if binary else "application/json"
+    response = app.response_class(
+        data,
+        status=200,
+        mimetype=mimetype
+    )
+    response.headers["Vary"] = "Accept"
+    return response
 
 @app.route("/<checksum>", methods=["OPTIONS"])
 def exists(checksum):
@@ -159,51 +194,218 @@ def exists(checksum):
     BAD  : 404 not found
     UGLY : decorator
     """
-    if not os.path.isfile(_get_filename(checksum)):
+    if not app.config["store"].exists(checksum):
         return "checksum not found", 404
     return "checksum found", 200
 
 @app.route("/<checksum>", methods=["PUT", "POST"])
 def put_checksum(checksum):
     """
-    INSERT and overwrite existing data
+    INSERT, existing recipes are never overwritten
 
     put some arbitraty recipe in Store
     recipe is used to reassemble a file from its stored chunkes in BlockStorage
 
-    the name of the recipe is the sha1 checksum of the reassembled file
+    the name of the recipe is the sha1 checksum of the reassembled file,
+    or for recipes with identity blocklist the sha1 of the binary block
+    checksums followed by the size as 8 byte big endian,
+    tiny files could be stored base64 encoded in inline, without blocks
+    recipes are sent as json or binary, stored as set by recipe_format
     put data into storag
 
     GOOD : 200 storing metadata in file
-           201 if file already existed
+           201 if file already existed, stored recipe is kept
     BAD  : 404 if file not found
     UGLY : decorator or if no data is given
     """
     if len(checksum) != app.config["maxlength"]:
         return "Bad Requests: checksum is not sha1", 400
     try:
-        metadata = json.loads(request.data.decode("utf-8"))
-    except TypeError as exc:
-        return "Bad Request: JSON format error", 400
+        if request.mimetype == recipeformat.MIME_TYPE:
+            metadata = recipeformat.decode(request.data)
+        else:
+            metadata = json.loads(request.data.decode("utf-8"))
+    except (TypeError, ValueError) as exc:
+        return "Bad Request: recipe format error", 400
     if metadata:
-        if metadata["checksum"] == checksum:
-            return "Bad Request: checksum mismatch", 400
-        filename = _get_filename(checksum)
-        with open(filename, "wt") as outfile:
-            json.dump(metadata, outfile)
+        error = _check_recipe(checksum, metadata)
+        if error is not None:
+            return "Bad Request: %s" % error, 400
+        with checksums_lock: # no second epoch for the same recipe
+            if app.config["store"].exists(checksum): # never overwritten, could not be verified for every identity
+                return "checksum exists", 201
+            app.config["store"].put(checksum, *_encode_recipe(metadata))
             bc.add(checksum) # store in db
             app.config["checksums"].append(checksum) # store in RAM
         return "checksum stored", 200
     return "no data to store", 501
 
+@app.route("/bulk/get", methods=["POST"])
+def get_many():
+    """
+    get many recipes with one request, body is json list of checksums
+
+    GOOD : 200 : ndjson stream, one line per checksum in requested order,
+                 {"checksum" : <checksum>, "recipe" : <recipe>}
+                 or {"checksum" : <checksum>, "error" : "not found"}
+    BAD  : 400 : body is no json list
+    """
+    try:
+        checksums = json.loads(request.data.decode("utf-8"))
+    except (TypeError, ValueError):
+        return "Bad Request: JSON format error", 400
+    if not isinstance(checksums, list):
+        return "Bad Request: list of checksums expected", 400
+    store = app.config["store"]
+    def generate():
+        for checksum in checksums:
+            data = None
+            if isinstance(checksum, str) and len(checksum) == app.config["maxlength"]:
+                data = store.get(checksum)
+            if data is None:
+                yield json.dumps({"checksum" : checksum, "error" : "not found"}) + "\n"
+            elif recipeformat.is_binary(data):
+                yield json.dumps({"checksum" : checksum, "recipe" : recipeformat.decode(data)}) + "\n"
+            else: # stored json is embedded as is, newlines could only be whitespace
+                yield '{"checksum": "%s", "recipe": %s}\n' % (checksum, data.decode("utf-8").replace("\n", " "))
+    logger.info("streaming %d recipes", len(checksums))
+    return app.response_class(generate(), status=200, mimetype="application/x-ndjson")
+
+@app.route("/bulk/put", methods=["POST"])
+def put_many():
+    """
+    store many recipes with one request, body is ndjson, one recipe per line,
+    recipes already stored are not overwritten
+
+    GOOD : 200 : json dict of checksum : "stored", "exists" or error of every recipe
+    BAD  : 400 : some line is no json
+    """
+    try:
+        recipes = [json.loads(line) for line in request.data.decode("utf-8").splitlines() if line.strip()]
+    except (TypeError, ValueError):
+        return "Bad Request: JSON format error", 400
+    store = app.config["store"]
+    results = {}
+    batch = []
+    with checksums_lock: # no second epoch for the same recipe
+        for metadata in recipes:
+            checksum = metadata.get("checksum") if isinstance(metadata, dict) else None
+            if not isinstance(checksum, str) or len(checksum) != app.config["maxlength"]:
+                return "Bad Request: recipe without valid checksum", 400
+            error = _check_recipe(checksum, metadata)
+            if error is not None:
+                results[checksum] = error
+            elif checksum in results or store.exists(checksum):
+                results[checksum] = "exists"
+            else:
+                batch.append((checksum,) + _encode_recipe(metadata))
+                results[checksum] = "stored"
+        store.put_many(batch)
+        for checksum, _, _ in batch:
+            bc.add(checksum) # store in db
+            app.config["checksums"].append(checksum) # store in RAM
+    logger.info("stored %d of %d recipes", len(batch), len(recipes))
+    response = app.response_class(
+        json.dumps(results),
+        status=200,
+        mimetype="application/json"
+    )
+    return response
+
 ####################### private functions #################################
 
-def _get_filename(checksum):
+def _check_recipe(checksum, metadata):
+    """
+    return error message if recipe is not valid to be stored under checksum,
+    otherwise None
+    """
+    error = _check_shape(metadata)
+    if error is not None:
+        return error
+    if metadata["checksum"] != checksum:
+        return "checksum mismatch"
+    identity = metadata.get("identity", "sha1")
+    if ("inline" in metadata or "pages" in metadata) and metadata.get("version", 1) < 2:
+        return "inline or paged recipe needs version 2" # older clients would read an empty blockchain
+    if "inline" in metadata: # tiny file stored in recipe
+        try:
+            data = base64.b64decode(metadata["inline"], validate=True)
+        except (TypeError, ValueError):
+            return "inline data is not base64"
+        if identity != "sha1" or metadata["blockchain"] or len(data) != metadata["size"]:
+            return "inline recipe inconsistent"
+        if hashlib.sha1(data).hexdigest() != checksum:
+            return "inline checksum mismatch"
+    elif "pages" in metadata: # blockchain stored in pages at BlockStorage, checksum could not be verified here
+        if identity not in ("sha1", "blocklist") or metadata["blockchain"] or sum(metadata["pagesizes"]) != metadata["size"]:
+            return "paged recipe inconsistent"
+    elif identity == "blocklist":
+        if _blocklist_checksum(metadata["blockchain"], metadata["size"]) != checksum:
+            return "blocklist checksum mismatch"
+    elif identity != "sha1":
+        return "unknown identity"
+    return None
+
+def _is_digests(value):
+    """
+    return True if value is a list of hex sha1 digests
+    """
+    return isinstance(value, list) and all(isinstance(item, str) and len(item) == 40 and all(char in "0123456789abcdef" for char in item) for item in value)
+
+def _is_sizes(value, count, limit):
+    """
+    return True if value is a list of count integers in range 0 to limit
+    """
+    return isinstance(value, list) and len(value) == count and all(type(item) is int and 0 <= item < limit for item in value)
+
+def _check_shape(metadata):
+    """
+    return error message if fields of recipe have the wrong type or length,
+    so every stored recipe could be encoded binary, otherwise None
+    """
+    if not isinstance(metadata, dict):
+        return "recipe is no object"
+    if not isinstance(metadata.get("checksum"), str) or type(metadata.get("size")) is not int or not 0 <= metadata["size"] < 2 ** 63:
+        return "recipe without valid checksum or size"
+    if type(metadata.get("version", 1)) is not int or not 1 <= metadata.get("version", 1) <= RECIPE_VERSION:
+        return "unknown recipe version"
+    if not _is_digests(metadata.get("blockchain")):
+        return "blockchain is no list of sha1 digests"
+    if "blocksizes" in metadata:
+        if "pages" in metadata or not _is_sizes(metadata["blocksizes"], len(metadata["blockchain"]), 2 ** 32):
+            return "blocksizes do not match blockchain"
+    if "pages" in metadata:
+        if not _is_digests(metadata["pages"]) or not _is_sizes(metadata.get("pagesizes"), len(metadata["pages"]), 2 ** 64):
+            return "pages do not match pagesizes"
+    elif "pagesizes" in metadata:
+        return "pagesizes without pages"
+    return None
+
+def _encode_recipe(metadata):
+    """
+    return data to store of recipe in configured recipe_format, and if this is binary
+    """
+    if app.config["recipe_format"] == "binary":
+        return recipeformat.encode(metadata), True
+    return json.dumps(metadata).encode("utf-8"), False
+
+def _load_recipe(data):
+    """
+    return recipe dict of stored data, binary or json
+    """
+    if recipeformat.is_binary(data):
+        return recipeformat.decode(data)
+    return json.loads(data.decode("utf-8"))
+
+def _blocklist_checksum(blockchain, size):
     """
-    get os filename for provided checksum
+    calculate checksum of recipe with identity blocklist
     """
-    assert len(checksum) == app.config["maxlength"]
-    return os.path.join(app.config["storage_dir"], "%s.json" % checksum)
+    digest = hashlib.sha1()
+    for block_checksum in blockchain:
+        digest.update(bytes.fromhex(block_checksum))
+    digest.update(size.to_bytes(8, "big"))
+    return digest.hexdigest()
 
 def _get_config(config_filename):
     """
@@ -219,6 +421,12 @@ def _get_config(config_filename):
         config["maxlength"] = 40 # lenght of sha1 checksum
     else:
         raise Exception("Config Error only sha1 checksums are implemented yet")
+    config.setdefault("recipe_format", "json")
+    if config["recipe_format"] not in ("json", "binary"):
+        raise Exception("Config Error recipe_format has to be json or binary")
+    config.setdefault("recipe_store", "files")
+    if config["recipe_store"] not in ("files", "sqlite"):
+        raise Exception("Config Error recipe_store has to be files or sqlite")
     return config
 
 def _get_checksums(storage_dir):
@@ -246,6 +454,7 @@ def application(environ, start_response):
         # application = app # needed for WSGI Apache module
         for key, value in _get_config(configfile).items(): # TODO: make this relative
             app.config[key] = value
+        app.config["store"] = recipestore.get_store(app.config)
         # initialize blockchain database
         bc.set_db(app.config["blockchain_db"])
         logger.info("using blockchain database %s", app.config["blockchain_db"])
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+"""
+storage engines for recipes of FileStorage
+
+every engine stores the recipe data as given, json or binary,
+under the checksum of the recipe
+"""
+import os
+import sqlite3
+import logging
+import threading
+
+
+class FileRecipeStore(object):
+    """
+    one file per recipe in storage_dir, <checksum>.json or <checksum>.bin
+    """
+
+    extensions = ("bin", "json")
+
+    def __init__(self, storage_dir):
+        self._storage_dir = storage_dir
+
+    def _filename(self, checksum, extension):
+        return os.path.join(self._storage_dir, "%s.%s" % (checksum, extension))
+
+    def _find(self, checksum):
+        """
+        return filename of recipe in any format, None if not found
+        """
+        for extension in self.extensions:
+            filename = self._filename(checksum, extension)
+            if os.path.isfile(filename):
+                return filename
+        return None
+
+    def get(self, checksum):
+        """
+        return data of recipe, None if not found
+        """
+        filename = self._find(checksum)
+        if filename is None:
+            return None
+        with open(filename, "rb") as infile:
+            return infile.read()
+
+    def exists(self, checksum):
+        return self._find(checksum) is not None
+
+    def put(self, checksum, data, binary=False):
+        """
+        store data of recipe, replacing the recipe in other format if any
+        """
+        extension = "bin" if binary else "json"
+        with open(self._filename(checksum, extension), "wb") as outfile:
+            outfile.write(data)
+        for other in self.extensions:
+            if other != extension and os.path.isfile(self._filename(checksum, other)):
+                os.unlink(self._filename(checksum, other))
+
+    def put_many(self, recipes):
+        """
+        store every checksum, data, binary of recipes
+        """
+        for checksum, data, binary in recipes:
+            self.put(checksum, data, binary)
+
+    def checksums(self):
+        """
+        yield checksum of every recipe stored
+        """
+        for entry in os.scandir(self._storage_dir):
+            checksum, _, extension = entry.name.partition(".")
+            if extension in self.extensions:
+                yield checksum
+
+
+class SqliteRecipeStore(object):
+    """
+    all recipes in one table of a sqlite database, no inode per recipe,
+    every thread uses its own connection
+    """
+
+    def __init__(self, db_filename):
+        self._db = db_filename
+        self._local = threading.local()
+        con = self._connection()
+        con.execute("pragma journal_mode=wal") # readers do not block the writer
+        con.execute("create table if not exists recipes (checksum char(40) primary key, data blob)")
+        con.commit()
+
+    def _connection(self):
+        if not hasattr(self._local, "con"):
+            self._local.con = sqlite3.connect(self._db)
+        return self._local.con
+
+    def get(self, checksum):
+        """
+        return data of recipe, None if not found
+        """
+        row = self._connection().execute("select data from recipes where checksum = ?", (checksum,)).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def exists(self, checksum):
+        return self._connection().execute("select 1 from recipes where checksum = ?", (checksum,)).fetchone() is not None
+
+    def put(self, checksum, data, binary=False):
+        """
+        store data of recipe, binary or json is told by data itself
+        """
+        con = self._connection()
+        with con:
+            con.execute("insert or replace into recipes values (?, ?)", (checksum, sqlite3.Binary(data)))
+
+    def put_many(self, recipes):
+        """
+        store every checksum, data, binary of recipes in one transaction
+        """
+        con = self._connection()
+        with con:
+            con.executemany("insert or replace into recipes values (?, ?)", ((checksum, sqlite3.Binary(data)) for checksum, data, _ in recipes))
+
+    def checksums(self):
+        """
+        yield checksum of every recipe stored
+        """
+        for row in self._connection().execute("select checksum from recipes"):
+            yield row[0]
+
+
+def get_store(config):
+    """
+    return recipe store configured by recipe_store,
+    files in storage_dir or sqlite in recipe_db
+    """
+    if config["recipe_store"] == "sqlite":
+        db_filename = config.get("recipe_db") or os.path.join(config["storage_dir"], "recipes.db")
+        logging.info("using recipe store sqlite %s", db_filename)
+        return SqliteRecipeStore(db_filename)
+    logging.info("using recipe store files in %s", config["storage_dir"])
+    return FileRecipeStore(config["storage_dir"])